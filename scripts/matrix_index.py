@@ -0,0 +1,46 @@
+import docopt
+
+import teuthology.suite.matrix_index
+
+doc = """
+usage:
+    teuthology-matrix-index -h
+    teuthology-matrix-index [-v] [--outof <outof>]... [options]
+                            [--] <suite_dir>...
+
+Pre-build the on-disk matrix index used by teuthology-suite and
+teuthology-describe-tests, so that later runs against the same suite sha1 do
+not need to walk the suite directory.
+
+Indices are keyed by the commit checked out in each suite's git repo and
+the suite's path within it, and stored in the matrix_index directory under
+src_base_path (by default, ~/src/matrix_index). Suites which are not clean
+git checkouts are skipped.
+
+positional arguments:
+  <suite_dir>                  Path of a suite, e.g.
+                               ~/src/ceph-qa-suite_master/suites/rados
+
+optional arguments:
+  -h, --help                   Show this help message and exit
+  -v, --verbose                Be more verbose
+  --outof <outof>              Also build the index used by
+                               'teuthology-suite --subset <index>/<outof>'.
+                               May be given more than once.
+  --subsets-dir <dir>          For each --outof value N, also write the job
+                               list of every subset 0/N ... N-1/N to
+                               <dir>/<suite>-<index>-of-<N>.yaml, to be
+                               scheduled with 'teuthology-suite
+                               --subset-file'. The matrix is only built once
+                               for all N subsets.
+  -j <processes>, --processes <processes>
+                               Number of processes to spread --subsets-dir
+                               work across. Defaults to the number of CPUs.
+"""
+
+
+def main():
+    args = docopt.docopt(doc)
+    if args['--subsets-dir'] and not args['--outof']:
+        raise docopt.DocoptExit("--subsets-dir requires at least one --outof")
+    teuthology.suite.matrix_index.main(args)
@@ -7,7 +7,8 @@ usage:
   teuthology-nuke --help
   teuthology-nuke [-v] [--owner OWNER] [-n NAME] [-u] [-i] [-r] [-s]
                        [-p PID] [--dry-run] (-t CONFIG... | -a DIR)
-  teuthology-nuke [-v] [-u] [-i] [-r] [-s] [--dry-run] --owner OWNER --stale
+  teuthology-nuke [-v] [-u] [-i] [-r] [-s] [--dry-run] [--owner OWNER] --stale
+                       [--concurrency N] [--loop SECONDS] [--metrics PATH]
   teuthology-nuke [-v] [--dry-run] --stale-openstack
 
 Reset test machines
@@ -21,13 +22,20 @@ optional arguments:
                         archive path for a job to kill and nuke
   --stale               attempt to find and nuke 'stale' machines
                         (e.g. locked by jobs that are no longer running)
+  --concurrency N       with --stale, how many machines to nuke at once
+                        [default: 10]
+  --loop SECONDS        with --stale, keep running, looking for stale
+                        machines every SECONDS seconds
+  --metrics PATH        with --stale, write per-machine reclamation metrics
+                        to PATH as YAML
   --stale-openstack     nuke 'stale' OpenStack instances and volumes
                         and unlock OpenStack targets with no instance
   --dry-run             Don't actually nuke anything; just print the list of
                         targets that would be nuked
   --owner OWNER         job owner
   -p PID, --pid PID     pid of the process to be killed
-  -r, --reboot-all      reboot all machines
+  -r, --reboot-all      reboot all machines, rather than only those which
+                        are found to need it after cleaning up
   -s, --synch-clocks    synchronize clocks on all machines
   -u, --unlock          Unlock each successfully nuked machine, and output
                         targets thatcould not be nuked.
@@ -37,6 +45,7 @@ optional arguments:
 Examples:
 teuthology-nuke -t target.yaml --unlock --owner user@host
 teuthology-nuke -t target.yaml --pid 1234 --unlock --owner user@host
+teuthology-nuke --stale --unlock --loop 300 --metrics reclaim.yaml
 """
 
 
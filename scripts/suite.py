@@ -95,6 +95,10 @@ Scheduler arguments:
                               piece <index>.  Scheduling 0/<outof>, 1/<outof>,
                               2/<outof> ... <outof>-1/<outof> will schedule all
                               jobs in the suite (many more than once).
+  --subset-file <path>        Schedule the jobs listed in <path>, one of the
+                              subset files written by
+                              'teuthology-matrix-index --subsets-dir',
+                              instead of generating them from the suite.
   -p <priority>, --priority <priority>
                               Job priority (lower is sooner)
                               [default: 1000]
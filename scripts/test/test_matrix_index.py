@@ -0,0 +1,18 @@
+from mock import patch
+from pytest import raises
+
+from script import Script
+from scripts import matrix_index
+
+
+class TestMatrixIndex(Script):
+    script_name = 'teuthology-matrix-index'
+
+    def test_subsets_dir_requires_outof(self):
+        argv = [self.script_name, '--subsets-dir', '/tmp/subsets', '.']
+        with patch('sys.argv', argv):
+            with patch.object(matrix_index.teuthology.suite.matrix_index,
+                              'main') as m_main:
+                with raises(SystemExit):
+                    matrix_index.main()
+                m_main.assert_not_called()
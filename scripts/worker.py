@@ -10,7 +10,7 @@ def main():
 def parse_args():
     parser = argparse.ArgumentParser(description="""
 Grab jobs from a beanstalk queue and run the teuthology tests they
-describe. One job is run at a time.
+describe. By default one job is run at a time; see --concurrency.
 """)
     parser.add_argument(
         '-v', '--verbose',
@@ -34,4 +34,10 @@ describe. One job is run at a time.
         required=True,
     )
 
+    parser.add_argument(
+        '-c', '--concurrency',
+        type=int, default=1,
+        help='how many jobs to run at once (default: 1)',
+    )
+
     return parser.parse_args()
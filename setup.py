@@ -61,7 +61,7 @@ setup(
                       'configobj',
                       'six >= 1.9', # python-openstackclient won't work properly with less
                       'httplib2',
-                      'paramiko >= 1.15.1',
+                      'paramiko >= 1.16.0',
                       'pexpect',
                       'requests',
                       'raven',
@@ -115,6 +115,7 @@ setup(
             'teuthology-queue = scripts.queue:main',
             'teuthology-prune-logs = scripts.prune_logs:main',
             'teuthology-describe-tests = scripts.describe_tests:main',
+            'teuthology-matrix-index = scripts.matrix_index:main',
             ],
         },
 
@@ -0,0 +1,139 @@
+import heapq
+import logging
+import yaml
+
+log = logging.getLogger(__name__)
+
+
+class CommandStats(object):
+    """
+    A class that aggregates timing and traffic data for remote commands.
+
+    orchestra.run records every command it waits for here, and run_tasks
+    tells it which task is running, so that slow hosts and expensive tasks
+    and commands can be found without grepping teuthology.log.
+    """
+    # How many decimal places to use for time intervals
+    precision = 3
+    # How many of the slowest commands to keep
+    slowest_count = 50
+    # How much of each command line to keep
+    command_length = 200
+
+    def __init__(self):
+        self.task = None
+        self.hosts = dict()
+        self.tasks = dict()
+        # a min-heap of (seconds, n, record)
+        self._slowest = list()
+        self._count = 0
+
+    def record(self, host, command, seconds, first_byte=None, bytes_in=0,
+               bytes_out=0, exitstatus=None, label=None):
+        """
+        Record a command's completion
+
+        :param host:       The host it ran on
+        :param command:    The command line
+        :param seconds:    How long it ran for
+        :param first_byte: How long it took to produce its first output, if
+                           it produced any
+        :param bytes_in:   How many bytes were sent to its stdin
+        :param bytes_out:  How many bytes of stdout and stderr it produced
+        :param exitstatus: Its exit status; None if it was killed or the
+                           connection was lost
+        :param label:      Its label, if any
+        """
+        for totals, key in ((self.hosts, host),
+                            (self.tasks, self.task or 'none')):
+            group = totals.setdefault(key, dict(
+                commands=0,
+                failed=0,
+                seconds=0.0,
+                max_seconds=0.0,
+                first_byte_seconds=0.0,
+                bytes_in=0,
+                bytes_out=0,
+                _with_output=0,
+            ))
+            group['commands'] += 1
+            if exitstatus != 0:
+                group['failed'] += 1
+            group['seconds'] += seconds
+            group['max_seconds'] = max(group['max_seconds'], seconds)
+            if first_byte is not None:
+                group['first_byte_seconds'] += first_byte
+                group['_with_output'] += 1
+            group['bytes_in'] += bytes_in
+            group['bytes_out'] += bytes_out
+
+        self._count += 1
+        entry = (seconds, self._count, dict(
+            host=host,
+            task=self.task,
+            command=command[:self.command_length],
+            label=label,
+            seconds=round(seconds, self.precision),
+            first_byte=(None if first_byte is None
+                        else round(first_byte, self.precision)),
+            bytes_in=bytes_in,
+            bytes_out=bytes_out,
+            exitstatus=exitstatus,
+        ))
+        if len(self._slowest) < self.slowest_count:
+            heapq.heappush(self._slowest, entry)
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def _summarize(self, totals):
+        result = dict()
+        for key, group in totals.items():
+            group = dict(group)
+            with_output = group.pop('_with_output')
+            # report the mean time to first byte
+            if with_output:
+                group['first_byte_seconds'] /= with_output
+            for name in ('seconds', 'max_seconds', 'first_byte_seconds'):
+                group[name] = round(group[name], self.precision)
+            result[key] = group
+        return result
+
+    @property
+    def data(self):
+        """
+        Return an object similar to::
+
+            {'hosts': {'smithi001': {'commands': 2, 'failed': 0,
+                                     'seconds': 3.2, 'max_seconds': 3.1,
+                                     'first_byte_seconds': 0.05,
+                                     'bytes_in': 0, 'bytes_out': 1024}},
+             'tasks': {'install': {...}},
+             'slowest': [
+                 {'host': 'smithi001', 'task': 'install',
+                  'command': 'sudo yum install ...', 'label': None,
+                  'seconds': 3.1, 'first_byte': 0.05, 'bytes_in': 0,
+                  'bytes_out': 1000, 'exitstatus': 0},
+             ],
+             }
+
+        Totals are kept per host and per task; first_byte_seconds is the
+        mean over the commands which produced any output. 'slowest' lists
+        the slowest commands, slowest first.
+        """
+        return dict(
+            hosts=self._summarize(self.hosts),
+            tasks=self._summarize(self.tasks),
+            slowest=[entry[2] for entry in
+                     sorted(self._slowest, reverse=True)],
+        )
+
+    def write(self, path):
+        try:
+            with file(path, 'w') as f:
+                yaml.safe_dump(self.data, f, default_flow_style=False)
+        except Exception:
+            log.exception("Failed to write command stats!")
+
+
+# The stats for the commands run by this process
+stats = CommandStats()
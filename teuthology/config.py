@@ -151,8 +151,13 @@ class TeuthologyConfig(YamlConfig):
         'results_sending_email': 'teuthology',
         'results_timeout': 43200,
         'src_base_path': os.path.expanduser('~/src'),
+        'checkout_cache': False,
+        'checkout_cache_size': 32,
+        'host_facts_dir': None,
         'verify_host_keys': True,
         'watchdog_interval': 120,
+        'archive_concurrency': 4,
+        'log_ship_interval': 0,
         'kojihub_url': 'http://koji.fedoraproject.org/kojihub',
         'kojiroot_url': 'http://kojipkgs.fedoraproject.org/packages',
         'koji_task_url': 'https://kojipkgs.fedoraproject.org/work/',
@@ -162,6 +167,7 @@ class TeuthologyConfig(YamlConfig):
         'teuthology_path': None,
         'suite_verify_ceph_hash': True,
         'suite_allow_missing_packages': False,
+        'suite_package_probe_concurrency': 8,
         'openstack': {
             'clone': 'git clone http://github.com/ceph/teuthology',
             'user-data': 'teuthology/openstack/openstack-{os_type}-{os_version}-user-data.txt',
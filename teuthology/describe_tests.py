@@ -80,8 +80,8 @@ def get_combinations(suite_dir, fields, subset,
     Returns a tuple of (headers, rows) where both elements are lists
     of strings.
     """
-    configs = [(combine_path(suite_dir, item[0]), item[1]) for item in
-               build_matrix(suite_dir, subset)]
+    configs = ((combine_path(suite_dir, item[0]), item[1]) for item in
+               build_matrix(suite_dir, subset, lazy=True, use_index=True))
 
     num_listed = 0
     rows = []
@@ -6,18 +6,22 @@ import subprocess
 import yaml
 import re
 import collections
-import os
 import pprint
 import requests
+import time
 import urllib
 
+import gevent.pool
+
 import teuthology
 from . import misc
 from . import provision
 from .config import config
 from .config import set_config_attr
 from .contextutil import safe_while
+from .lock_client import client
 from .lockstatus import get_status
+from .report import ResultsReporter
 
 log = logging.getLogger(__name__)
 
@@ -116,9 +120,11 @@ def validate_distro_version(version, supported_versions):
 def get_statuses(machines):
     if machines:
         statuses = []
+        machines = [misc.canonicalize_hostname(machine)
+                    for machine in machines]
+        machine_statuses = client.get_statuses(machines)
         for machine in machines:
-            machine = misc.canonicalize_hostname(machine)
-            status = get_status(machine)
+            status = machine_statuses[machine]
             if status:
                 statuses.append(status)
             else:
@@ -322,11 +328,15 @@ def main(ctx):
     elif ctx.unlock:
         if ctx.owner is None and user is None:
             user = misc.get_user()
-        # If none of them are vpm, do them all in one shot
-        if not filter(is_vm, machines):
-            res = unlock_many(machines, user)
-            return 0 if res else 1
-        for machine in machines:
+        # Unlock everything but the VMs, which need destroying, in one shot.
+        # is_vm() needs each machine's status; fetch them all at once.
+        client.get_statuses(machines)
+        physical = [machine for machine in machines if not is_vm(machine)]
+        if physical and not unlock_many_or_each(ctx, physical, user):
+            ret = 1
+            if not ctx.f:
+                return ret
+        for machine in filter(is_vm, machines):
             if not unlock_one(ctx, machine, user):
                 ret = 1
                 if not ctx.f:
@@ -370,8 +380,8 @@ def main(ctx):
         machines_to_update = machines
 
         if ctx.desc is not None or ctx.status is not None:
-            for machine in machines_to_update:
-                update_lock(machine, ctx.desc, ctx.status)
+            if not update_locks(machines_to_update, ctx.desc, ctx.status):
+                ret = 1
 
     return ret
 
@@ -426,7 +436,7 @@ def lock_many(ctx, num, machine_type, user=None, description=None,
         machine_types = [machine_types_str, ]
 
     for machine_type in machine_types:
-        uri = os.path.join(config.lock_server, 'nodes', 'lock_many', '')
+        uri = client.uri('nodes', 'lock_many')
         data = dict(
             locked_by=user,
             count=num,
@@ -443,16 +453,17 @@ def lock_many(ctx, num, machine_type, user=None, description=None,
         if arch:
             data['arch'] = arch
         log.debug("lock_many request: %s", repr(data))
-        response = requests.post(
+        response = client.session.post(
             uri,
             data=json.dumps(data),
-            headers={'content-type': 'application/json'},
+            headers=client.json_headers,
         )
         if response.ok:
             machines = {misc.canonicalize_hostname(machine['name']):
                         machine['ssh_pub_key'] for machine in response.json()}
             log.debug('locked {machines}'.format(
                 machines=', '.join(machines.keys())))
+            client.invalidate(machines.keys())
             if machine_type == 'vps':
                 ok_machs = {}
                 for machine in machines:
@@ -480,8 +491,9 @@ def lock_one(name, user=None, description=None):
         user = misc.get_user()
     request = dict(name=name, locked=True, locked_by=user,
                    description=description)
-    uri = os.path.join(config.lock_server, 'nodes', name, 'lock', '')
-    response = requests.put(uri, json.dumps(request))
+    uri = client.uri('nodes', name, 'lock')
+    response = client.session.put(uri, json.dumps(request))
+    client.invalidate([name])
     success = response.ok
     if success:
         log.debug('locked %s as %s', name, user)
@@ -499,16 +511,17 @@ def unlock_many(names, user):
     fixed_names = [misc.canonicalize_hostname(name, user=None) for name in
                    names]
     names = fixed_names
-    uri = os.path.join(config.lock_server, 'nodes', 'unlock_many', '')
+    uri = client.uri('nodes', 'unlock_many')
     data = dict(
         locked_by=user,
         names=names,
     )
-    response = requests.post(
+    response = client.session.post(
         uri,
         data=json.dumps(data),
-        headers={'content-type': 'application/json'},
+        headers=client.json_headers,
     )
+    client.invalidate(names)
     if response.ok:
         log.debug("Unlocked: %s", ', '.join(names))
     else:
@@ -516,22 +529,64 @@ def unlock_many(names, user):
     return response.ok
 
 
+def unlock_many_or_each(ctx, names, user):
+    """
+    Unlock names, which must not be VMs, in one request. If that fails,
+    unlock whichever of them are still locked one at a time.
+
+    :returns: True if they were all unlocked
+    """
+    if unlock_many(names, user):
+        return True
+    statuses = client.get_statuses(names)
+    remaining = [name for name in names
+                 if statuses[name] is None or statuses[name]['locked']]
+    log.warning("Unlocking %s one at a time", ', '.join(remaining))
+    success = True
+    for name in remaining:
+        success = unlock_one(ctx, name, user) and success
+    return success
+
+
+def unlock_nodes(ctx, names, user, description=None):
+    """
+    Unlock names. If description is given, the lock server has to check it
+    against each node, which it only does when they are unlocked one at a
+    time; otherwise all but any VMs, which must be destroyed one at a time,
+    are unlocked at once.
+
+    :returns: True if they were all unlocked
+    """
+    client.get_statuses(names)
+    success = True
+    singles = names
+    if description is None:
+        physical = [name for name in names if not is_vm(name)]
+        if physical:
+            success = unlock_many_or_each(ctx, physical, user)
+        singles = filter(is_vm, names)
+    for name in singles:
+        success = unlock_one(ctx, name, user, description) and success
+    return success
+
+
 def unlock_one(ctx, name, user, description=None):
     name = misc.canonicalize_hostname(name, user=None)
     if not provision.destroy_if_vm(ctx, name, user, description):
         log.error('destroy failed for %s', name)
     request = dict(name=name, locked=False, locked_by=user,
                    description=description)
-    uri = os.path.join(config.lock_server, 'nodes', name, 'lock', '')
+    uri = client.uri('nodes', name, 'lock')
     with safe_while(
             sleep=1, increment=0.5, action="unlock %s" % name) as proceed:
         while proceed():
             try:
-                response = requests.put(uri, json.dumps(request))
+                response = client.session.put(uri, json.dumps(request))
                 break
             # Work around https://github.com/kennethreitz/requests/issues/2364
             except requests.ConnectionError as e:
                 log.warn("Saw %s while unlocking; retrying...", str(e))
+    client.invalidate([name])
     success = response.ok
     if success:
         log.info('unlocked %s', name)
@@ -552,7 +607,7 @@ def locked_since_seconds(node):
 
 def list_locks(keyed_by_name=False, **kwargs):
     log.debug("list_locks")
-    uri = os.path.join(config.lock_server, 'nodes', '')
+    uri = client.uri('nodes')
     log.debug("uri is " + pprint.pformat(uri))
     for key, value in kwargs.iteritems():
         if kwargs[key] is False:
@@ -565,7 +620,7 @@ def list_locks(keyed_by_name=False, **kwargs):
         uri += '?' + urllib.urlencode(kwargs)
     log.debug("uri is " + pprint.pformat(uri))
     try:
-        response = requests.get(uri)
+        response = client.session.get(uri)
     except requests.ConnectionError:
         success = False
         log.exception("Could not contact lock server: %s", config.lock_server)
@@ -580,7 +635,94 @@ def list_locks(keyed_by_name=False, **kwargs):
     return dict()
 
 
-def find_stale_locks(owner=None):
+class JobStatusCache(object):
+    """
+    Remembers whether jobs were found to be active (e.g. running or waiting)
+    by the results server. Active jobs are soon re-checked, since they may
+    finish at any time; inactive ones are kept for longer, so that nodes
+    which repeatedly fail to be reclaimed don't cause repeated queries.
+    """
+    active_statuses = ('running', 'waiting')
+
+    def __init__(self, active_ttl=60, inactive_ttl=600, concurrency=10):
+        self.active_ttl = active_ttl
+        self.inactive_ttl = inactive_ttl
+        self.concurrency = concurrency
+        # (run_name, job_id) -> (active, expiry time)
+        self._entries = dict()
+        self._reporter = None
+
+    @property
+    def reporter(self):
+        if self._reporter is None:
+            self._reporter = ResultsReporter()
+        return self._reporter
+
+    def get(self, run_name, job_id):
+        """
+        :returns: True or False if the job is known to be active or not, or
+                  None if it needs to be looked up
+        """
+        entry = self._entries.get((run_name, job_id))
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def put(self, run_name, job_id, active):
+        ttl = self.active_ttl if active else self.inactive_ttl
+        self._entries[(run_name, job_id)] = (active, time.time() + ttl)
+
+    def prune(self):
+        """
+        Forget expired entries, so that a long-lived cache doesn't grow with
+        every job it has ever seen
+        """
+        now = time.time()
+        for key, (_, expiry) in self._entries.items():
+            if expiry < now:
+                del self._entries[key]
+
+    def _fetch_run(self, run_name, job_ids):
+        try:
+            jobs = self.reporter.get_jobs(run_name, fields=['status'])
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                log.warning("Could not get jobs for run %s: %s", run_name, e)
+                return
+            jobs = list()
+        except requests.RequestException as e:
+            log.warning("Could not get jobs for run %s: %s", run_name, e)
+            return
+        statuses = dict((str(job['job_id']), job.get('status'))
+                        for job in jobs)
+        # jobs missing from the results server are no longer active either
+        for job_id in job_ids:
+            self.put(run_name, job_id,
+                     statuses.get(job_id) in self.active_statuses)
+
+    def fetch(self, jobs):
+        """
+        Look up every job in jobs which isn't cached, with one query per run.
+        The runs are queried concurrently. Jobs which can't be looked up are
+        left uncached.
+
+        :param jobs: An iterable of (run_name, job_id) tuples
+        """
+        self.prune()
+        job_ids_by_run = dict()
+        for run_name, job_id in jobs:
+            if self.get(run_name, job_id) is None:
+                job_ids_by_run.setdefault(run_name, set()).add(job_id)
+        if not job_ids_by_run:
+            return
+        log.debug("Getting job statuses for %s runs", len(job_ids_by_run))
+        pool = gevent.pool.Pool(self.concurrency)
+        for run_name, job_ids in job_ids_by_run.items():
+            pool.spawn(self._fetch_run, run_name, job_ids)
+        pool.join()
+
+
+def find_stale_locks(owner=None, cache=None):
     """
     Return a list of node dicts corresponding to nodes that were locked to run
     a job, but the job is no longer running. The purpose of this is to enable
@@ -588,6 +730,8 @@ def find_stale_locks(owner=None):
     and return them to the pool.
 
     :param owner: If non-None, return nodes locked by owner. Default is None.
+    :param cache: A JobStatusCache to use; passing the same one to later calls
+                  avoids asking the results server about the same jobs again.
     """
     def might_be_stale(node_dict):
         """
@@ -607,47 +751,32 @@ def find_stale_locks(owner=None):
             return True
         return False
 
+    def node_job(node):
+        """
+        :returns: A tuple of the node's job's (run_name, job_id)
+        """
+        return tuple(node['description'].rstrip('/').split('/')[-2:])
+
     # Which nodes are locked for jobs?
     nodes = list_locks(locked=True)
     if owner is not None:
         nodes = [node for node in nodes if node['locked_by'] == owner]
     nodes = filter(might_be_stale, nodes)
 
-    def node_job_is_active(node, cache):
-        """
-        Is this node's job active (e.g. running or waiting)?
-
-        :param node:  The node dict as returned from the lock server
-        :param cache: A set() used for caching results
-        :returns:     True or False
-        """
-        description = node['description']
-        if description in cache:
-            return True
-        (name, job_id) = description.split('/')[-2:]
-        url = os.path.join(config.results_server, 'runs', name, 'jobs', job_id,
-                           '')
-        resp = requests.get(url)
-        job_info = resp.json()
-        if job_info['status'] in ('running', 'waiting'):
-            cache.add(description)
-            return True
-        return False
-
-    result = list()
+    if cache is None:
+        cache = JobStatusCache()
+    cache.fetch(node_job(node) for node in nodes)
     # Here we build the list of of nodes that are locked, for a job (as opposed
-    # to being locked manually for random monkeying), where the job is not
-    # running
-    active_jobs = set()
-    for node in nodes:
-        if node_job_is_active(node, active_jobs):
-            continue
-        result.append(node)
-    return result
+    # to being locked manually for random monkeying), where the job is known
+    # not to be running
+    return [node for node in nodes if cache.get(*node_job(node)) is False]
 
 
-def update_lock(name, description=None, status=None, ssh_pub_key=None):
-    name = misc.canonicalize_hostname(name, user=None)
+def lock_updates(description=None, status=None, ssh_pub_key=None):
+    """
+    :returns: The dict of fields to send to the lock server to make the given
+              changes to a node
+    """
     updated = {}
     if description is not None:
         updated['description'] = description
@@ -655,16 +784,35 @@ def update_lock(name, description=None, status=None, ssh_pub_key=None):
         updated['up'] = (status == 'up')
     if ssh_pub_key is not None:
         updated['ssh_pub_key'] = ssh_pub_key
+    return updated
 
+
+def update_lock(name, description=None, status=None, ssh_pub_key=None):
+    name = misc.canonicalize_hostname(name, user=None)
+    updated = lock_updates(description, status, ssh_pub_key)
     if updated:
-        uri = os.path.join(config.lock_server, 'nodes', name, '')
-        response = requests.put(
-            uri,
-            json.dumps(updated))
-        return response.ok
+        return client.update(name, updated).ok
     return True
 
 
+def update_locks(names, description=None, status=None):
+    """
+    Like update_lock(), but for many nodes at once
+
+    :returns: True if every update succeeded
+    """
+    updated = lock_updates(description, status)
+    if not updated:
+        return True
+    results = client.update_many(dict(
+        (misc.canonicalize_hostname(name, user=None), updated)
+        for name in names))
+    for name, ok in results.items():
+        if not ok:
+            log.error('failed to update %s!', name)
+    return all(results.values())
+
+
 def update_inventory(node_dict):
     """
     Like update_lock(), but takes a dict and doesn't try to do anything smart
@@ -675,21 +823,22 @@ def update_inventory(node_dict):
         raise ValueError("must specify name")
     if not config.lock_server:
         return
-    uri = os.path.join(config.lock_server, 'nodes', name, '')
+    uri = client.uri('nodes', name)
     log.info("Updating %s on lock server", name)
-    response = requests.put(
+    response = client.session.put(
         uri,
         json.dumps(node_dict),
-        headers={'content-type': 'application/json'},
+        headers=client.json_headers,
         )
     if response.status_code == 404:
         log.info("Creating new node %s on lock server", name)
-        uri = os.path.join(config.lock_server, 'nodes', '')
-        response = requests.post(
+        uri = client.uri('nodes')
+        response = client.session.post(
             uri,
             json.dumps(node_dict),
-            headers={'content-type': 'application/json'},
+            headers=client.json_headers,
         )
+    client.invalidate([name])
     if not response.ok:
         log.error("Node update/creation failed for %s: %s",
                   name, response.text)
@@ -727,13 +876,18 @@ def do_update_keys(machines, all_=False):
 
 def push_new_keys(keys_dict, reference):
     ret = 0
+    updates = dict()
     for hostname, pubkey in keys_dict.iteritems():
         log.info('Checking %s', hostname)
         if reference[hostname]['ssh_pub_key'] != pubkey:
-            log.info('New key found. Updating...')
-            if not update_lock(hostname, ssh_pub_key=pubkey):
-                log.error('failed to update %s!', hostname)
-                ret = 1
+            log.info('New key found for %s', hostname)
+            updates[hostname] = lock_updates(ssh_pub_key=pubkey)
+    if updates:
+        log.info('Updating %s keys...', len(updates))
+    for hostname, ok in client.update_many(updates).items():
+        if not ok:
+            log.error('failed to update %s!', hostname)
+            ret = 1
     return ret
 
 
@@ -0,0 +1,148 @@
+"""
+A client for the lock server, which reuses one keep-alive HTTP session,
+retries requests which fail to connect with backoff, and briefly caches node
+statuses
+"""
+import gevent.pool
+import json
+import logging
+import os
+import requests
+import time
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from .config import config
+from .misc import canonicalize_hostname
+
+log = logging.getLogger(__name__)
+
+
+class LockClient(object):
+    """
+    Requests for node statuses are served from a cache for status_ttl
+    seconds. Changes made through this client invalidate the nodes they
+    touch, so a process always sees its own changes.
+    """
+    json_headers = {'content-type': 'application/json'}
+
+    def __init__(self, base_uri=None, status_ttl=5, retries=5, backoff=0.5,
+                 concurrency=10):
+        """
+        :param base_uri:    The lock server's URI. Defaults to
+                            config.lock_server, looked up on each request.
+        :param status_ttl:  How long, in seconds, to cache node statuses
+        :param retries:     How many times to retry a request which fails to
+                            connect, or a GET which gets a gateway error
+        :param backoff:     The backoff factor between retries, in seconds
+        :param concurrency: How many requests to make at once, for methods
+                            which act on many nodes
+        """
+        self._base_uri = base_uri
+        self.status_ttl = status_ttl
+        self.concurrency = concurrency
+        self.session = self._make_session(retries, backoff)
+        # name -> (status, expiry time)
+        self._statuses = dict()
+
+    @property
+    def base_uri(self):
+        return self._base_uri or config.lock_server
+
+    def _make_session(self, retries, backoff):
+        session = requests.Session()
+        # Any request which failed to connect can safely be retried, but
+        # once one has been sent only reads are: repeating e.g. a PUT to
+        # nodes/<name>/lock after a timeout would fail against our own lock
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 504),
+            method_whitelist=frozenset(['GET', 'HEAD']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def uri(self, *parts):
+        """
+        :returns: The URI of parts under the lock server, with a trailing '/'
+        """
+        return os.path.join(self.base_uri, *(parts + ('', )))
+
+    def invalidate(self, names=None):
+        """
+        Forget the cached statuses of names, or of every node if names is None
+        """
+        if names is None:
+            self._statuses.clear()
+            return
+        for name in names:
+            self._statuses.pop(canonicalize_hostname(name, user=None), None)
+
+    def get_status(self, name, cached=True):
+        """
+        :param name:   The node's name
+        :param cached: Whether a recently-fetched status may be returned
+        :returns:      The node's status dict, or None if it couldn't be
+                       retrieved
+        """
+        name = canonicalize_hostname(name, user=None)
+        entry = self._statuses.get(name)
+        if cached and entry is not None and entry[1] >= time.time():
+            return entry[0]
+        response = self.session.get(self.uri('nodes', name))
+        if not response.ok:
+            log.warning(
+                "Failed to query lock server for status of {name}".format(
+                    name=name))
+            return None
+        status = response.json()
+        self._statuses[name] = (status, time.time() + self.status_ttl)
+        return status
+
+    def get_statuses(self, names, cached=True):
+        """
+        Call get_status() for each of names, concurrently
+
+        :returns: A dict mapping each name to its status, or None
+        """
+        names = list(names)
+        pool = gevent.pool.Pool(self.concurrency)
+        statuses = pool.map(lambda name: self.get_status(name, cached), names)
+        return dict(zip(names, statuses))
+
+    def update(self, name, data):
+        """
+        Update a node's fields with data
+
+        :returns: The response
+        """
+        response = self.session.put(self.uri('nodes', name),
+                                    json.dumps(data))
+        self.invalidate([name])
+        return response
+
+    def update_many(self, updates):
+        """
+        Apply several nodes' updates concurrently. The lock server has no
+        endpoint for updating many nodes at once, but the requests share this
+        client's connections.
+
+        :param updates: A dict mapping node names to dicts of their updates
+        :returns:       A dict mapping node names to whether their update
+                        succeeded
+        """
+        names = list(updates.keys())
+        pool = gevent.pool.Pool(self.concurrency)
+        responses = pool.map(lambda name: self.update(name, updates[name]),
+                             names)
+        return dict((name, response.ok)
+                    for name, response in zip(names, responses))
+
+
+# The client used by this process
+client = LockClient()
@@ -1,19 +1,13 @@
-import requests
-import os
 import logging
-from .config import config
-from .misc import canonicalize_hostname
+from .lock_client import client
 
 log = logging.getLogger(__name__)
 
 
-def get_status(name):
-    name = canonicalize_hostname(name, user=None)
-    uri = os.path.join(config.lock_server, 'nodes', name, '')
-    response = requests.get(uri)
-    success = response.ok
-    if success:
-        return response.json()
-    log.warning(
-        "Failed to query lock server for status of {name}".format(name=name))
-    return None
+def get_status(name, cached=True):
+    """
+    :returns: The lock server's status dict for the node, or None if it
+              couldn't be retrieved. Statuses are briefly cached; pass
+              cached=False to make sure of getting the current one.
+    """
+    return client.get_status(name, cached=cached)
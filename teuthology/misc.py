@@ -29,7 +29,9 @@ from teuthology.exceptions import (CommandCrashedError, CommandFailedError,
 from .orchestra import run
 from .config import config
 from .contextutil import safe_while
+from .orchestra.facts import get_lsb_value
 from .orchestra.opsys import DEFAULT_OS_VERSION
+from .orchestra.reboot import get_boot_id, wait_for_reboot
 
 log = logging.getLogger(__name__)
 
@@ -746,24 +748,55 @@ def get_file(remote, path, sudo=False, dest_dir='/tmp'):
     """
     Get the contents of a remote file. Do not use for large files; use
     Remote.get_file() instead.
+
+    dest_dir is ignored; the contents are streamed straight into memory.
     """
-    local_path = remote.get_file(path, sudo=sudo, dest_dir=dest_dir)
-    with open(local_path) as file_obj:
-        file_data = file_obj.read()
-    os.remove(local_path)
-    return file_data
+    return remote.read_file(path, sudo=sudo)
+
+
+class CountingReader(object):
+    """
+    Wraps a file-like object, counting the bytes read from it, and logging
+    progress every log_interval bytes.
+    """
+    def __init__(self, fileobj, name, log_interval=100 * 1024 ** 2):
+        self.fileobj = fileobj
+        self.name = name
+        self.log_interval = log_interval
+        self.bytes = 0
+        self._next_log = log_interval
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.bytes += len(data)
+        if self.log_interval and self.bytes >= self._next_log:
+            log.info('%s: %d MB transferred', self.name,
+                     self.bytes / 1024 ** 2)
+            self._next_log += self.log_interval
+        return data
 
 
 def pull_directory(remote, remotedir, localdir):
     """
     Copy a remote directory to a local directory.
+
+    The directory is streamed as a tarball, using the fastest compressor the
+    remote has, and unpacked as it arrives.
+
+    :returns: A dict with the number of files copied ('files'), their total
+              size ('bytes'), the number of compressed bytes transferred
+              ('transferred_bytes') and how long it took ('seconds').
     """
     log.debug('Transferring archived files from %s:%s to %s',
               remote.shortname, remotedir, localdir)
+    start = time.time()
     if not os.path.exists(localdir):
         os.mkdir(localdir)
-    r = remote.get_tar_stream(remotedir, sudo=True)
-    tar = tarfile.open(mode='r|gz', fileobj=r.stdout)
+    r = remote.get_tar_stream(remotedir, sudo=True, fast=True)
+    reader = CountingReader(r.stdout, remote.shortname)
+    tar = tarfile.open(mode='r|gz', fileobj=reader)
+    files = 0
+    total_bytes = 0
     while True:
         ti = tar.next()
         if ti is None:
@@ -777,6 +810,8 @@ def pull_directory(remote, remotedir, localdir):
             sub = safepath.munge(ti.name)
             safepath.makedirs(root=localdir, path=os.path.dirname(sub))
             tar.makefile(ti, targetpath=os.path.join(localdir, sub))
+            files += 1
+            total_bytes += ti.size
         else:
             if ti.isdev():
                 type_ = 'device'
@@ -787,6 +822,16 @@ def pull_directory(remote, remotedir, localdir):
             else:
                 type_ = 'unknown'
             log.info('Ignoring tar entry: %r type %r', ti.name, type_)
+    stats = dict(
+        files=files,
+        bytes=total_bytes,
+        transferred_bytes=reader.bytes,
+        seconds=round(time.time() - start, 1),
+    )
+    log.info('Transferred %d files (%d bytes; %d compressed) from %s in '
+             '%ss', files, total_bytes, reader.bytes, remote.shortname,
+             stats['seconds'])
+    return stats
 
 
 def pull_directory_tarball(remote, remotedir, localfile):
@@ -848,16 +893,8 @@ def get_scratch_devices(remote):
     """
     Read the scratch disk list from remote host
     """
-    devs = []
-    try:
-        file_data = get_file(remote, "/scratch_devs")
-        devs = file_data.split()
-    except Exception:
-        r = remote.run(
-            args=['ls', run.Raw('/dev/[sv]d?')],
-            stdout=StringIO()
-        )
-        devs = r.stdout.getvalue().strip().split('\n')
+    # /scratch_devs if it exists, else every /dev/[sv]d?
+    devs = (remote.facts['scratch_devs'] or '').split()
 
     # Remove root device (vm guests) from the disk list
     for dev in devs:
@@ -867,28 +904,34 @@ def get_scratch_devices(remote):
 
     log.debug('devs={d}'.format(d=devs))
 
+    if not devs:
+        return []
+    # Check every device over one channel
+    results = remote.run_batch(
+        [
+            [
+                # node exists
+                'stat',
+                dev,
+                run.Raw('&&'),
+                # readable
+                'sudo', 'dd', 'if=%s' % dev, 'of=/dev/null', 'count=1',
+                run.Raw('&&'),
+                # not mounted
+                run.Raw('!'),
+                'mount',
+                run.Raw('|'),
+                'grep', '-q', dev,
+            ]
+            for dev in devs
+        ],
+        check_status=False,
+    )
     retval = []
-    for dev in devs:
-        try:
-            # FIXME: Split this into multiple calls.
-            remote.run(
-                args=[
-                    # node exists
-                    'stat',
-                    dev,
-                    run.Raw('&&'),
-                    # readable
-                    'sudo', 'dd', 'if=%s' % dev, 'of=/dev/null', 'count=1',
-                    run.Raw('&&'),
-                    # not mounted
-                    run.Raw('!'),
-                    'mount',
-                    run.Raw('|'),
-                    'grep', '-q', dev,
-                ]
-            )
+    for dev, result in zip(devs, results):
+        if result.exitstatus == 0:
             retval.append(dev)
-        except CommandFailedError:
+        else:
             log.debug("get_scratch_devices: %s is in use" % dev)
     return retval
 
@@ -956,21 +999,20 @@ def reboot(node, timeout=300, interval=30):
     :param node: The teuthology.orchestra.remote.Remote object of the node
     :param timeout: The amount of time, in seconds, after which to give up
                     waiting for the node to return
-    :param interval: The amount of time, in seconds, to wait between attempts
-                     to re-establish with the node. This should not be set to
-                     less than maybe 10, to make sure the node actually goes
-                     down first.
+    :param interval: The longest amount of time, in seconds, to wait between
+                     attempts to re-establish with the node. The node's boot
+                     id is checked to make sure it actually went down.
     """
     log.info("Rebooting {host}...".format(host=node.hostname))
+    boot_id = get_boot_id(node)
     node.run(args=['sudo', 'shutdown', '-r', 'now'])
-    reboot_start_time = time.time()
-    while time.time() - reboot_start_time < timeout:
-        time.sleep(interval)
-        if node.is_online or node.reconnect():
-            return
-    raise RuntimeError(
-        "{host} did not come up after reboot within {time}s".format(
-            host=node.hostname, time=timeout))
+    try:
+        wait_for_reboot([node], timeout, boot_ids={node: boot_id},
+                        max_interval=interval)
+    except RuntimeError:
+        raise RuntimeError(
+            "{host} did not come up after reboot within {time}s".format(
+                host=node.hostname, time=timeout))
 
 
 def reconnect(ctx, timeout, remotes=None):
@@ -991,12 +1033,12 @@ def reconnect(ctx, timeout, remotes=None):
     starttime = time.time()
 
     if remotes:
-        need_reconnect = remotes
+        need_reconnect = list(remotes)
     else:
         need_reconnect = ctx.cluster.remotes.keys()
 
     while need_reconnect:
-        for remote in need_reconnect:
+        for remote in list(need_reconnect):
             log.info('trying to connect to %s', remote.name)
             success = remote.reconnect()
             if not success:
@@ -1205,17 +1247,13 @@ def get_system_type(remote, distro=False, version=False):
     If neither, return 'deb' or 'rpm' if distro is known to be one of those
     Finally, if unknown, return the unfiltered distro (from lsb_release -is)
     """
-    r = remote.run(
-        args=[
-            'sudo', 'lsb_release', '-is',
-        ],
-        stdout=StringIO(),
-    )
-    system_value = r.stdout.getvalue().strip()
+    lsb_release = remote.facts['lsb_release']
+    if lsb_release is None:
+        raise RuntimeError("lsb_release failed on %s" % remote.shortname)
+    system_value = get_lsb_value(lsb_release, 'Distributor ID') or ''
     log.debug("System to be installed: %s" % system_value)
     if version:
-        v = remote.run(args=['sudo', 'lsb_release', '-rs'], stdout=StringIO())
-        version = v.stdout.getvalue().strip()
+        version = get_lsb_value(lsb_release, 'Release') or ''
     if distro and version:
         return system_value.lower(), version
     if distro:
@@ -10,7 +10,7 @@ import teuthology
 
 from ..config import config, FakeNamespace
 from ..lock import (
-    list_locks, locked_since_seconds, unlock_one, find_stale_locks
+    list_locks, locked_since_seconds, unlock_one
 )
 from ..lockstatus import get_status
 from ..misc import (
@@ -18,6 +18,7 @@ from ..misc import (
     get_user, sh
 )
 from ..openstack import OpenStack, OpenStackInstance, enforce_json_dictionary
+from ..orchestra.cluster import Cluster
 from ..orchestra.remote import Remote
 from ..parallel import parallel
 from ..task.internal import check_lock, add_remotes, connect
@@ -28,7 +29,10 @@ from .actions import (
     remove_ceph_packages, synch_clocks,
     unlock_firmware_repo, remove_configuration_files, undo_multipath,
     reset_syslog_dir, remove_ceph_data, remove_testing_tree,
-    remove_yum_timedhosts, kill_valgrind,
+    remove_yum_timedhosts, kill_valgrind, needs_reboot,
+)
+from .script import (
+    run_cluster_steps, PRE_REBOOT_STEPS, POST_REBOOT_STEPS,
 )
 
 log = logging.getLogger(__name__)
@@ -199,11 +203,23 @@ def main(args):
         ctx.config = merge_configs(ctx.targets)
 
     if ctx.stale:
-        stale_nodes = find_stale_locks(ctx.owner)
-        targets = dict()
-        for node in stale_nodes:
-            targets[node['name']] = node['ssh_pub_key']
-        ctx.config = dict(targets=targets)
+        from .reclaim import Reclaimer
+        reclaimer = Reclaimer(
+            owner=ctx.owner,
+            concurrency=int(ctx.concurrency),
+            unlock=ctx.unlock,
+            synch_clocks=ctx.synch_clocks,
+            reboot_all=ctx.reboot_all,
+            noipmi=ctx.noipmi,
+            dry_run=ctx.dry_run,
+        )
+        if ctx.loop:
+            reclaimer.loop(float(ctx.loop), metrics_path=ctx.metrics)
+        else:
+            reclaimer.run_once()
+            if ctx.metrics:
+                reclaimer.write_metrics(ctx.metrics)
+        return
 
     if ctx.stale_openstack:
         stale_openstack(ctx)
@@ -300,6 +316,63 @@ def nuke_one(ctx, target, should_unlock, synch_clocks, reboot_all,
     return ret
 
 
+def post_reboot_cleanup(ctx):
+    if not run_cluster_steps(ctx, POST_REBOOT_STEPS):
+        log.warning("Running post-reboot cleanup steps one at a time")
+        # shutdown daemons again incase of startup
+        shutdown_daemons(ctx)
+        remove_osd_mounts(ctx)
+        remove_osd_tmpfs(ctx)
+        kill_hadoop(ctx)
+        remove_ceph_packages(ctx)
+        synch_clocks(ctx.cluster.remotes.keys())
+        unlock_firmware_repo(ctx)
+        remove_configuration_files(ctx)
+        undo_multipath(ctx)
+        reset_syslog_dir(ctx)
+        remove_ceph_data(ctx)
+        remove_testing_tree(ctx)
+        remove_yum_timedhosts(ctx)
+
+
+def _post_reboot_cleanup_on(ctx, remotes):
+    """
+    Run post_reboot_cleanup() on just remotes, out of ctx.cluster
+    """
+    cluster = ctx.cluster
+    ctx.cluster = Cluster(remotes=[
+        (remote, roles) for remote, roles in cluster.remotes.items()
+        if remote in remotes
+    ])
+    try:
+        post_reboot_cleanup(ctx)
+    finally:
+        ctx.cluster = cluster
+
+
+def clean_without_reboot(ctx):
+    """
+    Clean up each remote as we would after rebooting it, one remote at a time
+    so that a failure on one doesn't stop the others from being cleaned up
+
+    :returns: The remotes which still need rebooting: those where the
+              cleanup failed, or left behind something only a reboot gets
+              rid of
+    """
+    to_reboot = []
+    for remote in ctx.cluster.remotes.keys():
+        try:
+            _post_reboot_cleanup_on(ctx, [remote])
+        except Exception:
+            log.exception("Could not clean up %s without rebooting; "
+                          "rebooting it", remote.shortname)
+            to_reboot.append(remote)
+            continue
+        if needs_reboot(remote):
+            to_reboot.append(remote)
+    return to_reboot
+
+
 def nuke_helper(ctx, should_unlock):
     # ensure node is up with ipmi
     (target,) = ctx.config['targets'].keys()
@@ -328,27 +401,22 @@ def nuke_helper(ctx, should_unlock):
             remote.connect()
     add_remotes(ctx, None)
     connect(ctx, None)
-    clear_firewall(ctx)
-    shutdown_daemons(ctx)
-    kill_valgrind(ctx)
+    # Each group of cleanup steps runs as a single script; if that fails, the
+    # steps are run again one at a time, so that failures are raised as usual
+    if not run_cluster_steps(ctx, PRE_REBOOT_STEPS):
+        log.warning("Running pre-reboot cleanup steps one at a time")
+        clear_firewall(ctx)
+        shutdown_daemons(ctx)
+        kill_valgrind(ctx)
     # Try to remove packages before reboot
     remove_installed_packages(ctx)
-    remotes = ctx.cluster.remotes.keys()
-    reboot(ctx, remotes)
-    # shutdown daemons again incase of startup
-    shutdown_daemons(ctx)
-    remove_osd_mounts(ctx)
-    remove_osd_tmpfs(ctx)
-    kill_hadoop(ctx)
-    remove_ceph_packages(ctx)
-    synch_clocks(remotes)
-    unlock_firmware_repo(ctx)
-    remove_configuration_files(ctx)
-    undo_multipath(ctx)
-    reset_syslog_dir(ctx)
-    remove_ceph_data(ctx)
-    remove_testing_tree(ctx)
-    remove_yum_timedhosts(ctx)
+    if getattr(ctx, 'reboot_all', True):
+        to_reboot = ctx.cluster.remotes.keys()
+    else:
+        to_reboot = clean_without_reboot(ctx)
+    if to_reboot:
+        reboot(ctx, to_reboot)
+        _post_reboot_cleanup_on(ctx, to_reboot)
     # Once again remove packages after reboot
     remove_installed_packages(ctx)
     log.info('Installed packages removed.')
@@ -1,14 +1,49 @@
 import logging
-import time
 
-from ..misc import get_testdir, reconnect
+from collections import namedtuple, OrderedDict
+
+from ..misc import get_testdir
 from ..orchestra import run
+from ..orchestra.reboot import get_boot_ids, wait_for_reboot
 from ..orchestra.remote import Remote
 from ..task import install as install_task
 
 
 log = logging.getLogger(__name__)
 
+# A command making up part of a cleanup step. See teuthology.nuke.script,
+# which runs every step's commands on a host in one go.
+Command = namedtuple('Command', ['args', 'check_status', 'timeout'])
+
+
+def _command(args, check_status=True, timeout=None):
+    return Command(args, check_status, timeout)
+
+
+def _run_commands(ctx, get_commands):
+    """
+    Run the commands get_commands(remote) returns on each remote, in order,
+    on all the remotes at once
+    """
+    def run_commands(remote):
+        for command in get_commands(remote):
+            remote.run(
+                args=command.args,
+                check_status=command.check_status,
+                timeout=command.timeout,
+            )
+    ctx.cluster.for_each_remote(run_commands,
+                                concurrency=len(ctx.cluster.remotes))
+
+
+def clear_firewall_commands(remote):
+    return [
+        _command([
+            "sudo", "sh", "-c",
+            "iptables-save | grep -v teuthology | iptables-restore"
+        ]),
+    ]
+
 
 def clear_firewall(ctx):
     """
@@ -17,78 +52,104 @@ def clear_firewall(ctx):
     firewall rules are unaffected.
     """
     log.info("Clearing teuthology firewall rules...")
-    ctx.cluster.run(
-        args=[
-            "sudo", "sh", "-c",
-            "iptables-save | grep -v teuthology | iptables-restore"
-        ],
-    )
+    _run_commands(ctx, clear_firewall_commands)
     log.info("Cleared teuthology firewall rules.")
 
 
+def shutdown_daemons_commands(remote):
+    return [
+        _command(
+            ['sudo', 'stop', 'ceph-all', run.Raw('||'),
+             'sudo', 'service', 'ceph', 'stop', run.Raw('||'),
+             'sudo', 'systemctl', 'stop', 'ceph.target'],
+            check_status=False, timeout=180),
+        _command(
+            [
+                'if', 'grep', '-q', 'ceph-fuse', '/etc/mtab', run.Raw(';'),
+                'then',
+                'grep', 'ceph-fuse', '/etc/mtab', run.Raw('|'),
+                'grep', '-o', " /.* fuse", run.Raw('|'),
+                'grep', '-o', "/.* ", run.Raw('|'),
+                'xargs', '-n', '1', 'sudo', 'fusermount', '-u', run.Raw(';'),
+                'fi',
+                run.Raw(';'),
+                'if', 'grep', '-q', 'rbd-fuse', '/etc/mtab', run.Raw(';'),
+                'then',
+                'grep', 'rbd-fuse', '/etc/mtab', run.Raw('|'),
+                'grep', '-o', " /.* fuse", run.Raw('|'),
+                'grep', '-o', "/.* ", run.Raw('|'),
+                'xargs', '-n', '1', 'sudo', 'fusermount', '-u', run.Raw(';'),
+                'fi',
+                run.Raw(';'),
+                'sudo',
+                'killall',
+                '--quiet',
+                'ceph-mon',
+                'ceph-osd',
+                'ceph-mds',
+                'ceph-mgr',
+                'ceph-fuse',
+                'ceph-disk',
+                'radosgw',
+                'ceph_test_rados',
+                'rados',
+                'rbd-fuse',
+                'apache2',
+                run.Raw('||'),
+                'true',  # ignore errors from ceph binaries not being found
+            ],
+            timeout=120),
+    ]
+
+
 def shutdown_daemons(ctx):
     log.info('Unmounting ceph-fuse and killing daemons...')
-    ctx.cluster.run(args=['sudo', 'stop', 'ceph-all', run.Raw('||'),
-                          'sudo', 'service', 'ceph', 'stop', run.Raw('||'),
-                          'sudo', 'systemctl', 'stop', 'ceph.target'],
-                    check_status=False, timeout=180)
-    ctx.cluster.run(
-        args=[
-            'if', 'grep', '-q', 'ceph-fuse', '/etc/mtab', run.Raw(';'),
-            'then',
-            'grep', 'ceph-fuse', '/etc/mtab', run.Raw('|'),
-            'grep', '-o', " /.* fuse", run.Raw('|'),
-            'grep', '-o', "/.* ", run.Raw('|'),
-            'xargs', '-n', '1', 'sudo', 'fusermount', '-u', run.Raw(';'),
-            'fi',
-            run.Raw(';'),
-            'if', 'grep', '-q', 'rbd-fuse', '/etc/mtab', run.Raw(';'),
-            'then',
-            'grep', 'rbd-fuse', '/etc/mtab', run.Raw('|'),
-            'grep', '-o', " /.* fuse", run.Raw('|'),
-            'grep', '-o', "/.* ", run.Raw('|'),
-            'xargs', '-n', '1', 'sudo', 'fusermount', '-u', run.Raw(';'),
-            'fi',
-            run.Raw(';'),
-            'sudo',
-            'killall',
-            '--quiet',
-            'ceph-mon',
-            'ceph-osd',
-            'ceph-mds',
-            'ceph-mgr',
-            'ceph-fuse',
-            'ceph-disk',
-            'radosgw',
-            'ceph_test_rados',
-            'rados',
-            'rbd-fuse',
-            'apache2',
-            run.Raw('||'),
-            'true',  # ignore errors from ceph binaries not being found
-        ],
-        timeout=120,
-    )
+    _run_commands(ctx, shutdown_daemons_commands)
     log.info('All daemons killed.')
 
 
+def kill_hadoop_commands(remote):
+    # pkill -f matches whole command lines, so bracket a character to stop
+    # the pattern matching the shell running it, e.g. nuke's batch script
+    return [
+        _command(["pkill", "-f", "-KILL", "[j]ava.*hadoop"],
+                 check_status=False, timeout=60),
+    ]
+
+
 def kill_hadoop(ctx):
     log.info("Terminating Hadoop services...")
-    ctx.cluster.run(args=[
-        "pkill", "-f", "-KILL", "java.*hadoop",
-        ],
-        check_status=False,
-        timeout=60
-    )
+    _run_commands(ctx, kill_hadoop_commands)
 
 
-def kill_valgrind(ctx):
+def kill_valgrind_commands(remote):
     # http://tracker.ceph.com/issues/17084
-    ctx.cluster.run(
-        args=['sudo', 'pkill', '-f', '-9', 'valgrind.bin'],
-        check_status=False,
-        timeout=20,
-    )
+    # As in kill_hadoop_commands(), the pattern mustn't match itself
+    return [
+        _command(['sudo', 'pkill', '-f', '-9', '[v]algrind.bin'],
+                 check_status=False, timeout=20),
+    ]
+
+
+def kill_valgrind(ctx):
+    _run_commands(ctx, kill_valgrind_commands)
+
+
+def remove_osd_mounts_commands(remote):
+    return [
+        _command(
+            [
+                'grep',
+                '/var/lib/ceph/osd/',
+                '/etc/mtab',
+                run.Raw('|'),
+                'awk', '{print $2}', run.Raw('|'),
+                'xargs', '-r',
+                'sudo', 'umount', '-l', run.Raw(';'),
+                'true'
+            ],
+            timeout=120),
+    ]
 
 
 def remove_osd_mounts(ctx):
@@ -96,19 +157,21 @@ def remove_osd_mounts(ctx):
     unmount any osd data mounts (scratch disks)
     """
     log.info('Unmount any osd data directories...')
-    ctx.cluster.run(
-        args=[
-            'grep',
-            '/var/lib/ceph/osd/',
-            '/etc/mtab',
-            run.Raw('|'),
-            'awk', '{print $2}', run.Raw('|'),
-            'xargs', '-r',
-            'sudo', 'umount', '-l', run.Raw(';'),
-            'true'
-        ],
-        timeout=120
-    )
+    _run_commands(ctx, remove_osd_mounts_commands)
+
+
+def remove_osd_tmpfs_commands(remote):
+    return [
+        _command(
+            [
+                'egrep', 'tmpfs\s+/mnt', '/etc/mtab', run.Raw('|'),
+                'awk', '{print $2}', run.Raw('|'),
+                'xargs', '-r',
+                'sudo', 'umount', run.Raw(';'),
+                'true'
+            ],
+            timeout=120),
+    ]
 
 
 def remove_osd_tmpfs(ctx):
@@ -116,16 +179,7 @@ def remove_osd_tmpfs(ctx):
     unmount tmpfs mounts
     """
     log.info('Unmount any osd tmpfs dirs...')
-    ctx.cluster.run(
-        args=[
-            'egrep', 'tmpfs\s+/mnt', '/etc/mtab', run.Raw('|'),
-            'awk', '{print $2}', run.Raw('|'),
-            'xargs', '-r',
-            'sudo', 'umount', run.Raw(';'),
-            'true'
-        ],
-        timeout=120
-    )
+    _run_commands(ctx, remove_osd_tmpfs_commands)
 
 
 def stale_kernel_mount(remote):
@@ -143,7 +197,47 @@ def stale_kernel_mount(remote):
     return proc.exitstatus == 0
 
 
+# Checks, run in one round trip, for state which cleaning up doesn't get rid
+# of, so that the node needs rebooting. Each exits 0 if it finds any.
+REBOOT_PROBES = OrderedDict([
+    ('stale kernel mounts',
+     'sudo find /sys/kernel/debug/ceph -mindepth 1 -type d | read d'),
+    ('rbd/ceph kernel modules',
+     "grep -qE '^(rbd|ceph|libceph) ' /proc/modules"),
+    ('leftover daemons',
+     "pgrep -x 'ceph-(mon|osd|mds|mgr|fuse|disk)|radosgw|rbd-fuse|"
+     "ceph_test_rados|valgrind.bin'"),
+    ('osd mounts', 'grep -q /var/lib/ceph/osd/ /etc/mtab'),
+    ('osd tmpfs mounts', "egrep -q 'tmpfs\s+/mnt' /etc/mtab"),
+    ('multipath devices',
+     'sudo multipath -l -v1 2>/dev/null | grep -q .'),
+])
+
+
+def needs_reboot(remote):
+    """
+    :returns: True if any of REBOOT_PROBES found something on remote, or if
+              it couldn't be probed
+    """
+    try:
+        results = remote.run_batch(REBOOT_PROBES.values(),
+                                   check_status=False,
+                                   label='check whether a reboot is needed')
+    except Exception:
+        log.exception("Could not probe %s; rebooting it", remote.shortname)
+        return True
+    found = [name for name, result in zip(REBOOT_PROBES.keys(), results)
+             if result.exitstatus == 0]
+    if found:
+        log.info("%s needs rebooting: found %s", remote.shortname,
+                 ', '.join(found))
+    else:
+        log.info("%s doesn't need rebooting", remote.shortname)
+    return bool(found)
+
+
 def reboot(ctx, remotes):
+    boot_ids = get_boot_ids(remotes)
     for remote in remotes:
         if stale_kernel_mount(remote):
             log.warn('Stale kernel mount on %s!', remote.name)
@@ -169,16 +263,14 @@ def reboot(ctx, remotes):
         # send anything back to the ssh client!
     if remotes:
         log.info('waiting for nodes to reboot')
-        time.sleep(8)  # if we try and reconnect too quickly, it succeeds!
-        reconnect(ctx, 480)  # allow 8 minutes for the reboots
+        # a node still reporting its old boot id hasn't gone down yet
+        wait_for_reboot(remotes, 480, boot_ids=boot_ids)  # allow 8 minutes
 
 
-def reset_syslog_dir(ctx):
-    log.info('Resetting syslog output locations...')
-    nodes = {}
-    for remote in ctx.cluster.remotes.iterkeys():
-        proc = remote.run(
-            args=[
+def reset_syslog_dir_commands(remote):
+    return [
+        _command(
+            [
                 'if', 'test', '-e', '/etc/rsyslog.d/80-cephtest.conf',
                 run.Raw(';'),
                 'then',
@@ -189,13 +281,13 @@ def reset_syslog_dir(ctx):
                 'fi',
                 run.Raw(';'),
             ],
-            timeout=60,
-        )
-        nodes[remote.name] = proc
+            timeout=60),
+    ]
 
-    for name, proc in nodes.iteritems():
-        log.info('Waiting for %s to restart syslog...', name)
-        proc.wait()
+
+def reset_syslog_dir(ctx):
+    log.info('Resetting syslog output locations...')
+    _run_commands(ctx, reset_syslog_dir_commands)
 
 
 def dpkg_configure(ctx):
@@ -218,26 +310,29 @@ def dpkg_configure(ctx):
         )
 
 
-def remove_yum_timedhosts(ctx):
+def remove_yum_timedhosts_commands(remote):
     # Workaround for https://bugzilla.redhat.com/show_bug.cgi?id=1233329
+    if remote.os.package_type != 'rpm':
+        return []
+    return [
+        _command(
+            "sudo find /var/cache/yum -name 'timedhosts' -exec rm {} \;",
+            check_status=False, timeout=180),
+    ]
+
+
+def remove_yum_timedhosts(ctx):
     log.info("Removing yum timedhosts files...")
-    for remote in ctx.cluster.remotes.iterkeys():
-        if remote.os.package_type != 'rpm':
-            continue
-        remote.run(
-            args="sudo find /var/cache/yum -name 'timedhosts' -exec rm {} \;",
-            check_status=False, timeout=180
-        )
+    _run_commands(ctx, remove_yum_timedhosts_commands)
 
 
-def remove_ceph_packages(ctx):
+def remove_ceph_packages_commands(remote):
     """
     remove ceph and ceph dependent packages by force
     force is needed since the node's repo might have changed and
     in many cases autocorrect will not work due to missing packages
     due to repo changes
     """
-    log.info("Force remove ceph packages")
     ceph_packages_to_remove = ['ceph-common', 'ceph-mon', 'ceph-osd',
                                'libcephfs1', 'libcephfs2',
                                'librados2', 'librgw2', 'librbd1', 'python-rgw',
@@ -247,49 +342,38 @@ def remove_ceph_packages(ctx):
                                'ceph-deploy', 'libapache2-mod-fastcgi'
                                ]
     pkgs = str.join(' ', ceph_packages_to_remove)
-    for remote in ctx.cluster.remotes.iterkeys():
-        if remote.os.package_type == 'rpm':
-            log.info("Remove any broken repos")
-            remote.run(
-                args=['sudo', 'rm', run.Raw("/etc/yum.repos.d/*ceph*")],
-                check_status=False
-            )
-            remote.run(
-                args=['sudo', 'rm', run.Raw("/etc/yum.repos.d/*fcgi*")],
-                check_status=False,
-            )
-            remote.run(
-                args=['sudo', 'rpm', '--rebuilddb', run.Raw('&&'), 'yum',
-                      'clean', 'all']
-            )
-            log.info('Remove any ceph packages')
-            remote.run(
-                args=['sudo', 'yum', 'remove', '-y', run.Raw(pkgs)],
-                check_status=False
-            )
-        else:
-            log.info("Remove any broken repos")
-            remote.run(
-                args=['sudo', 'rm', run.Raw("/etc/apt/sources.list.d/*ceph*")],
-                check_status=False,
-            )
-            log.info("Autoclean")
-            remote.run(
-                args=['sudo', 'apt-get', 'autoclean'],
-                check_status=False,
-            )
-            log.info('Remove any ceph packages')
-            remote.run(
-                args=[
-                    'sudo', 'dpkg', '--remove', '--force-remove-reinstreq',
-                    run.Raw(pkgs)
-                ],
-                check_status=False
-            )
-            log.info("Autoclean")
-            remote.run(
-                args=['sudo', 'apt-get', 'autoclean']
-            )
+    if remote.os.package_type == 'rpm':
+        return [
+            # Remove any broken repos
+            _command(['sudo', 'rm', run.Raw("/etc/yum.repos.d/*ceph*")],
+                     check_status=False),
+            _command(['sudo', 'rm', run.Raw("/etc/yum.repos.d/*fcgi*")],
+                     check_status=False),
+            _command(['sudo', 'rpm', '--rebuilddb', run.Raw('&&'), 'yum',
+                      'clean', 'all']),
+            # Remove any ceph packages
+            _command(['sudo', 'yum', 'remove', '-y', run.Raw(pkgs)],
+                     check_status=False),
+        ]
+    return [
+        # Remove any broken repos
+        _command(['sudo', 'rm', run.Raw("/etc/apt/sources.list.d/*ceph*")],
+                 check_status=False),
+        _command(['sudo', 'apt-get', 'autoclean'], check_status=False),
+        # Remove any ceph packages
+        _command(
+            [
+                'sudo', 'dpkg', '--remove', '--force-remove-reinstreq',
+                run.Raw(pkgs)
+            ],
+            check_status=False),
+        _command(['sudo', 'apt-get', 'autoclean']),
+    ]
+
+
+def remove_ceph_packages(ctx):
+    log.info("Force remove ceph packages")
+    _run_commands(ctx, remove_ceph_packages_commands)
 
 
 def remove_installed_packages(ctx):
@@ -316,28 +400,40 @@ def remove_installed_packages(ctx):
     install_task.remove_sources(ctx, conf)
 
 
+def remove_ceph_data_commands(remote):
+    return [
+        _command(['sudo', 'rm', '-rf', '/etc/ceph']),
+        _command(install_task.PURGE_DATA_ARGS),
+    ]
+
+
 def remove_ceph_data(ctx):
     log.info("Removing ceph data...")
-    ctx.cluster.run(
-        args=[
-            'sudo', 'rm', '-rf', '/etc/ceph',
-        ],
-    )
-    install_task.purge_data(ctx)
+    _run_commands(ctx, remove_ceph_data_commands)
 
 
-def remove_testing_tree(ctx):
-    log.info('Clearing filesystem of test data...')
-    ctx.cluster.run(
-        args=[
-            'sudo', 'rm', '-rf', get_testdir(ctx),
+def remove_testing_tree_commands(remote):
+    return [
+        _command([
+            'sudo', 'rm', '-rf', get_testdir(),
             # just for old time's sake
             run.Raw('&&'),
             'sudo', 'rm', '-rf', '/tmp/cephtest',
             run.Raw('&&'),
             'sudo', 'rm', '-rf', '/home/ubuntu/cephtest',
-        ],
-    )
+        ]),
+    ]
+
+
+def remove_testing_tree(ctx):
+    log.info('Clearing filesystem of test data...')
+    _run_commands(ctx, remove_testing_tree_commands)
+
+
+def remove_configuration_files_commands(remote):
+    return [
+        _command(['rm', '-f', '/home/ubuntu/.cephdeploy.conf'], timeout=30),
+    ]
 
 
 def remove_configuration_files(ctx):
@@ -349,12 +445,14 @@ def remove_configuration_files(ctx):
     ``~/.cephdeploy.conf`` to alter how it handles installation by specifying
     a default section in its config with custom locations.
     """
-    ctx.cluster.run(
-        args=[
-            'rm', '-f', '/home/ubuntu/.cephdeploy.conf'
-        ],
-        timeout=30
-    )
+    _run_commands(ctx, remove_configuration_files_commands)
+
+
+def undo_multipath_commands(remote):
+    return [
+        _command(['sudo', 'multipath', '-F'], check_status=False,
+                 timeout=60),
+    ]
 
 
 def undo_multipath(ctx):
@@ -364,21 +462,13 @@ def undo_multipath(ctx):
     come back unless specifically requested by the test.
     """
     log.info('Removing any multipath config/pkgs...')
-    for remote in ctx.cluster.remotes.iterkeys():
-        remote.run(
-            args=[
-                'sudo', 'multipath', '-F',
-            ],
-            check_status=False,
-            timeout=60
-        )
+    _run_commands(ctx, undo_multipath_commands)
 
 
-def synch_clocks(remotes):
-    log.info('Synchronizing clocks...')
-    for remote in remotes:
-        remote.run(
-            args=[
+def synch_clocks_commands(remote):
+    return [
+        _command(
+            [
                 'sudo', 'systemctl', 'stop', 'ntpd.service', run.Raw('||'),
                 'sudo', 'systemctl', 'stop', 'chronyd.service',
                 run.Raw('&&'),
@@ -392,14 +482,27 @@ def synch_clocks(remotes):
                 run.Raw('||'),
                 'true',    # ignore errors; we may be racing with ntpd startup
             ],
-            timeout=60,
-        )
+            timeout=60),
+    ]
+
+
+def synch_clocks(remotes):
+    log.info('Synchronizing clocks...')
+    for remote in remotes:
+        for command in synch_clocks_commands(remote):
+            remote.run(args=command.args, timeout=command.timeout)
+
+
+def unlock_firmware_repo_commands(remote):
+    return [
+        _command(['sudo', 'rm', '-f',
+                  '/lib/firmware/updates/.git/index.lock']),
+    ]
 
 
 def unlock_firmware_repo(ctx):
     log.info('Making sure firmware.git is not locked...')
-    ctx.cluster.run(args=['sudo', 'rm', '-f',
-                          '/lib/firmware/updates/.git/index.lock', ])
+    _run_commands(ctx, unlock_firmware_repo_commands)
 
 
 def check_console(hostname):
@@ -0,0 +1,164 @@
+"""
+Find nodes which are still locked by jobs that are no longer running, then
+nuke and unlock them; either once, or over and over as a long-running service
+"""
+import argparse
+import gevent.pool
+import logging
+import time
+import yaml
+
+from ..lock import find_stale_locks, JobStatusCache
+from ..lockstatus import get_status
+from . import nuke_one
+
+log = logging.getLogger(__name__)
+
+
+class Reclaimer(object):
+    """
+    Reclaims stale nodes, a bounded number at a time, keeping per-node
+    metrics. Job statuses are cached between passes, so that a long-running
+    Reclaimer doesn't ask the results server about the same jobs every time.
+    """
+    # How many decimal places to use for time intervals
+    precision = 3
+
+    def __init__(self, owner=None, concurrency=10, unlock=True,
+                 synch_clocks=False, reboot_all=False, noipmi=False,
+                 dry_run=False, cache=None):
+        """
+        :param owner:       If non-None, only reclaim nodes locked by owner
+        :param concurrency: How many nodes to nuke at once
+        :param unlock:      Whether to unlock the nodes after nuking them
+        :param dry_run:     Only log which nodes would be reclaimed
+        :param cache:       The JobStatusCache to use
+        The other parameters are passed on to nuke.
+        """
+        self.owner = owner
+        self.concurrency = concurrency
+        self.unlock = unlock
+        self.synch_clocks = synch_clocks
+        self.reboot_all = reboot_all
+        self.noipmi = noipmi
+        self.dry_run = dry_run
+        self.cache = cache or JobStatusCache()
+        self.metrics = dict()
+
+    def find(self):
+        """
+        :returns: A list of node dicts for the stale nodes
+        """
+        return find_stale_locks(self.owner, cache=self.cache)
+
+    def _node_metrics(self, name):
+        return self.metrics.setdefault(name, dict(
+            attempts=0,
+            reclaimed=0,
+            failed=0,
+            skipped=0,
+            seconds=0.0,
+            last_seconds=None,
+            last_description=None,
+            last_attempt=None,
+        ))
+
+    def still_stale(self, node):
+        """
+        Make sure node is still locked for the same job as when it was found
+        to be stale, so that a node which has since changed hands isn't nuked
+        """
+        status = get_status(node['name'], cached=False)
+        return bool(status and status['locked'] and
+                    status['locked_by'] == node['locked_by'] and
+                    status['description'] == node['description'])
+
+    def reclaim_one(self, node):
+        """
+        Nuke, and unlock if configured to, a single stale node. Errors are
+        logged and counted as failures, not raised.
+
+        :returns: True if it was reclaimed, False if that failed, or None if
+                  it was skipped
+        """
+        name = node['name']
+        metrics = self._node_metrics(name)
+        try:
+            still_stale = self.still_stale(node)
+        except Exception:
+            log.exception("Could not check whether %s is still stale", name)
+            metrics['failed'] += 1
+            return False
+        if not still_stale:
+            log.info("%s has changed hands since it was found to be stale",
+                     name)
+            metrics['skipped'] += 1
+            return None
+        ctx = argparse.Namespace(owner=node['locked_by'], name=None)
+        metrics['attempts'] += 1
+        metrics['last_description'] = node['description']
+        metrics['last_attempt'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        start = time.time()
+        try:
+            unnuked = nuke_one(ctx, {name: node['ssh_pub_key']}, self.unlock,
+                               self.synch_clocks, self.reboot_all, True,
+                               self.noipmi)
+        except Exception:
+            log.exception("Could not reclaim %s", name)
+            unnuked = True
+        elapsed = time.time() - start
+        metrics['last_seconds'] = round(elapsed, self.precision)
+        metrics['seconds'] = round(metrics['seconds'] + elapsed,
+                                   self.precision)
+        if unnuked:
+            metrics['failed'] += 1
+            return False
+        metrics['reclaimed'] += 1
+        return True
+
+    def run_once(self):
+        """
+        Find the stale nodes and reclaim them
+
+        :returns: A list of the names of the nodes which couldn't be reclaimed
+        """
+        nodes = self.find()
+        log.info(
+            '\n  '.join(['stale targets:', ] +
+                        sorted(node['name'] for node in nodes)))
+        if self.dry_run:
+            log.info("Not actually nuking anything since --dry-run was passed")
+            return list()
+        pool = gevent.pool.Pool(self.concurrency)
+        greenlets = [pool.spawn(self.reclaim_one, node) for node in nodes]
+        pool.join()
+        failed = [node['name'] for node, greenlet in zip(nodes, greenlets)
+                  if greenlet.value is False]
+        if failed:
+            log.error('Could not reclaim the following targets:\n  ' +
+                      '\n  '.join(failed))
+        return failed
+
+    def loop(self, interval, metrics_path=None):
+        """
+        Call run_once() every interval seconds, forever
+
+        :param metrics_path: If non-None, write the metrics here after each
+                             pass
+        """
+        while True:
+            start = time.time()
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("Failed to reclaim stale nodes")
+            if metrics_path:
+                self.write_metrics(metrics_path)
+            time.sleep(max(0, interval - (time.time() - start)))
+
+    def write_metrics(self, path):
+        try:
+            with file(path, 'w') as f:
+                yaml.safe_dump(self.metrics, f, default_flow_style=False)
+        except Exception:
+            log.exception("Failed to write reclamation metrics!")
@@ -0,0 +1,128 @@
+"""
+Run teuthology-nuke's cleanup steps on a host as a single script, rather than
+one round trip per command
+"""
+import logging
+
+from collections import OrderedDict
+
+from ..orchestra import run
+from . import actions
+
+log = logging.getLogger(__name__)
+
+# The steps which nuke runs before rebooting a node...
+PRE_REBOOT_STEPS = OrderedDict([
+    ('clear_firewall', actions.clear_firewall_commands),
+    ('shutdown_daemons', actions.shutdown_daemons_commands),
+    ('kill_valgrind', actions.kill_valgrind_commands),
+])
+
+# ...and after rebooting it. Package removal, which goes through the install
+# task, isn't included.
+POST_REBOOT_STEPS = OrderedDict([
+    # shutdown daemons again incase of startup
+    ('shutdown_daemons', actions.shutdown_daemons_commands),
+    ('remove_osd_mounts', actions.remove_osd_mounts_commands),
+    ('remove_osd_tmpfs', actions.remove_osd_tmpfs_commands),
+    ('kill_hadoop', actions.kill_hadoop_commands),
+    ('remove_ceph_packages', actions.remove_ceph_packages_commands),
+    ('synch_clocks', actions.synch_clocks_commands),
+    ('unlock_firmware_repo', actions.unlock_firmware_repo_commands),
+    ('remove_configuration_files',
+     actions.remove_configuration_files_commands),
+    ('undo_multipath', actions.undo_multipath_commands),
+    ('reset_syslog_dir', actions.reset_syslog_dir_commands),
+    ('remove_ceph_data', actions.remove_ceph_data_commands),
+    ('remove_testing_tree', actions.remove_testing_tree_commands),
+    ('remove_yum_timedhosts', actions.remove_yum_timedhosts_commands),
+])
+
+ELAPSED_MARKER = 'teuthology-nuke-elapsed-ms'
+
+
+def build_command(command):
+    """
+    Turn a Command into a line of shell which enforces its timeout, if any,
+    and afterwards appends how long it took, in milliseconds, to its stderr
+    """
+    if isinstance(command.args, basestring):
+        shell = command.args
+    else:
+        shell = run.quote(command.args)
+    if command.timeout:
+        shell = 'timeout {timeout} sh -c {shell}'.format(
+            timeout=command.timeout,
+            shell=run.quote([shell]),
+        )
+    return (
+        '_s=$(date +%s%N); {shell}; _r=$?; '
+        'echo "{marker} $(( ($(date +%s%N) - _s) / 1000000 ))" >&2; '
+        'exit $_r'.format(shell=shell, marker=ELAPSED_MARKER)
+    )
+
+
+def split_elapsed(stderr):
+    """
+    Separate the elapsed time appended by build_command() from the rest of a
+    command's stderr
+
+    :returns: A tuple of (stderr, elapsed seconds or None)
+    """
+    head, sep, tail = stderr.rpartition(ELAPSED_MARKER + ' ')
+    if not sep:
+        return stderr, None
+    try:
+        return head, int(tail.strip()) / 1000.0
+    except ValueError:
+        return stderr, None
+
+
+def run_steps(remote, steps):
+    """
+    Run the commands making up steps on remote, in one round trip. Every
+    command runs, even if earlier ones fail, so all of them must be safe to
+    run again.
+
+    :param remote: The Remote to clean up
+    :param steps:  An OrderedDict mapping each step's name to a function
+                   returning its Commands for a remote, e.g. PRE_REBOOT_STEPS
+    :returns:      True if every command whose exit status matters succeeded
+    """
+    commands = list()
+    for name, get_commands in steps.items():
+        for command in get_commands(remote):
+            commands.append((name, command))
+    results = remote.run_batch(
+        [build_command(command) for (name, command) in commands],
+        check_status=False,
+        label='nuke ' + ', '.join(steps.keys()),
+    )
+    success = True
+    for (name, command), result in zip(commands, results):
+        stderr, elapsed = split_elapsed(result.stderr)
+        log.debug("%s: step %s exited %s after %ss", remote.shortname, name,
+                  result.exitstatus, elapsed)
+        if result.exitstatus != 0 and command.check_status:
+            log.error("%s: step %s failed: %s", remote.shortname, name,
+                      stderr.strip())
+            success = False
+    return success
+
+
+def run_cluster_steps(ctx, steps):
+    """
+    Call run_steps() for every remote in ctx.cluster, concurrently
+
+    :returns: True if it succeeded everywhere; False if it failed anywhere,
+              including if the script itself couldn't be run
+    """
+    def run_on(remote):
+        try:
+            return run_steps(remote, steps)
+        except Exception:
+            log.exception("Failed to run nuke script on %s",
+                          remote.shortname)
+            return False
+    return all(ctx.cluster.for_each_remote(
+        run_on, concurrency=len(ctx.cluster.remotes)))
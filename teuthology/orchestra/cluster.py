@@ -2,7 +2,15 @@
 Cluster definition
 part of context, Cluster is used to save connection information.
 """
+import logging
+
+import gevent.pool
+
 import teuthology.misc
+from teuthology.parallel import (ExceptionHolder, capture_traceback,
+                                 resurrect_traceback)
+
+log = logging.getLogger(__name__)
 
 
 class Cluster(object):
@@ -50,20 +58,29 @@ class Cluster(object):
                 )
         self.remotes[remote] = list(roles)
 
-    def run(self, **kwargs):
+    def run(self, concurrency=None, **kwargs):
         """
         Run a command on all the nodes in this cluster.
 
         Goes through nodes in alphabetical order.
 
-        If you don't specify wait=False, this will be sequentially.
+        If you don't specify wait=False or concurrency, this will be
+        sequentially.
+
+        :param concurrency: If given, run on up to this many nodes at once,
+                            waiting for all of them to finish. If any of them
+                            raised, every failure is logged and the first
+                            one, in alphabetical order, is re-raised.
 
         Returns a list of `RemoteProcess`.
         """
-        remotes = sorted(self.remotes.iterkeys(), key=lambda rem: rem.name)
-        return [remote.run(**kwargs) for remote in remotes]
+        return self.for_each_remote(
+            lambda remote: remote.run(**kwargs),
+            concurrency=concurrency,
+        )
 
-    def write_file(self, file_name, content, sudo=False, perms=None, owner=None):
+    def write_file(self, file_name, content, sudo=False, perms=None,
+                   owner=None, concurrency=None):
         """
         Write text to a file on each node.
 
@@ -71,16 +88,48 @@ class Cluster(object):
         :param content: file content
         :param sudo: use sudo
         :param perms: file permissions (passed to chmod) ONLY if sudo is True
+        :param concurrency: as for run()
         """
-        remotes = sorted(self.remotes.iterkeys(), key=lambda rem: rem.name)
-        for remote in remotes:
+        if not sudo and (perms is not None or owner is not None):
+            raise ValueError("To specify perms or owner, sudo must be True")
+
+        def write(remote):
             if sudo:
                 teuthology.misc.sudo_write_file(remote, file_name, content, perms=perms, owner=owner)
             else:
-                if perms is not None or owner is not None:
-                    raise ValueError("To specify perms or owner, sudo must be True")
                 teuthology.misc.write_file(remote, file_name, content)
 
+        self.for_each_remote(write, concurrency=concurrency)
+
+    def for_each_remote(self, func, concurrency=None):
+        """
+        Call func(remote) for each node in this cluster, in alphabetical
+        order, returning a list of the results.
+
+        :param concurrency: If given, make up to this many calls at once using
+                            gevent, and wait for all of them to finish before
+                            raising the first exception (by node order), if
+                            any, after logging each node's exception.
+        """
+        remotes = sorted(self.remotes.iterkeys(), key=lambda rem: rem.name)
+        if not concurrency:
+            return [func(remote) for remote in remotes]
+        pool = gevent.pool.Pool(concurrency)
+        greenlets = [
+            pool.spawn(capture_traceback, func, remote) for remote in remotes
+        ]
+        pool.join()
+        results = [greenlet.value for greenlet in greenlets]
+        failures = [
+            (remote, result) for remote, result in zip(remotes, results)
+            if isinstance(result, ExceptionHolder)
+        ]
+        for remote, failure in failures:
+            log.error("Failed on %s", remote.name, exc_info=failure.exc_info)
+        if failures:
+            resurrect_traceback(failures[0][1])
+        return results
+
     def only(self, *roles):
         """
         Return a cluster with only the remotes that have all of given roles.
@@ -37,8 +37,116 @@ def create_key(keytype, key):
         raise ValueError('keytype must be ssh-rsa or ssh-dss (DSA)')
 
 
+_ssh_configs = dict()
+
+
+def get_ssh_config(path=None):
+    """
+    Return a paramiko.SSHConfig for path (by default ~/.ssh/config), or None
+    if it does not exist. Parsed configs are cached until the file changes.
+    """
+    if path is None:
+        path = os.path.expanduser("~/.ssh/config")
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _ssh_configs.get(path)
+    if cached is None or cached[0] != mtime:
+        ssh_config = paramiko.SSHConfig()
+        with open(path) as ssh_config_file:
+            ssh_config.parse(ssh_config_file)
+        cached = (mtime, ssh_config)
+        _ssh_configs[path] = cached
+    return cached[1]
+
+
+def is_alive(ssh):
+    """
+    Is this SSHClient's transport still usable?
+    """
+    transport = ssh.get_transport()
+    return transport is not None and transport.is_active()
+
+
+class ConnectionPool(object):
+    """
+    Authenticated SSH clients, keyed by (user, host, key_filename), so that
+    connecting to the same host again within this process reuses the
+    existing transport rather than doing another key exchange and
+    authentication.
+
+    Clients whose transports have died (e.g. because keepalives failed, or
+    the host rebooted) are dropped rather than handed out.
+
+    Transports can't be shared between processes, so each process has its own
+    pool; see connect()'s reuse parameter.
+    """
+    def __init__(self):
+        self.clients = dict()
+
+    def get(self, key):
+        """
+        :returns: A live SSHClient for key, or None
+        """
+        ssh = self.clients.get(key)
+        if ssh is None:
+            return None
+        if not is_alive(ssh):
+            log.debug("Discarding dead connection to %s", key[1])
+            self.discard(key)
+            return None
+        return ssh
+
+    def put(self, key, ssh):
+        self.clients[key] = ssh
+
+    def discard(self, key):
+        ssh = self.clients.pop(key, None)
+        if ssh is not None:
+            ssh.close()
+
+    def release(self, ssh):
+        """
+        Give up a client returned by connect(). Pooled clients may be shared
+        with other Remotes, so they are only dropped, and closed, if their
+        transports have died; any other client is closed.
+        """
+        for key, pooled in self.clients.items():
+            if pooled is ssh:
+                self.get(key)
+                return
+        ssh.close()
+
+    def prune(self):
+        """
+        Drop all clients whose transports have died
+        """
+        for key in list(self.clients):
+            self.get(key)
+
+    def close_all(self):
+        for key in list(self.clients):
+            self.discard(key)
+
+
+pool = ConnectionPool()
+
+
+def get_pool_key(user_at_host, key_filename=None):
+    """
+    :returns: The key under which connect() pools connections to user_at_host
+    """
+    user, host = split_user(user_at_host)
+    if not key_filename:
+        ssh_config = get_ssh_config()
+        if ssh_config is not None:
+            key_filename = ssh_config.lookup(host).get('identityfile')
+    return (user, host, key_filename)
+
+
 def connect(user_at_host, host_key=None, keep_alive=False, timeout=60,
-            _SSHClient=None, _create_key=None, retry=True, key_filename=None):
+            _SSHClient=None, _create_key=None, retry=True, key_filename=None,
+            reuse=False):
     """
     ssh connection routine.
 
@@ -51,9 +159,19 @@ def connect(user_at_host, host_key=None, keep_alive=False, timeout=60,
     :param retry:       Whether or not to retry failed connection attempts
                         (eventually giving up if none succeed). Default is True
     :param key_filename:  Optionally override which private key to use.
+    :param reuse:       If True, return a live connection from the pool if
+                        there is one for the same user, host and key, and add
+                        new connections to the pool.
     :return: ssh connection.
     """
-    user, host = split_user(user_at_host)
+    pool_key = get_pool_key(user_at_host, key_filename)
+    user, host, key_filename = pool_key
+    if reuse:
+        ssh = pool.get(pool_key)
+        if ssh is not None:
+            log.debug("Reusing connection to %s", host)
+            return ssh
+
     if _SSHClient is None:
         _SSHClient = paramiko.SSHClient
     ssh = _SSHClient()
@@ -80,14 +198,6 @@ def connect(user_at_host, host_key=None, keep_alive=False, timeout=60,
         timeout=timeout
     )
 
-    ssh_config_path = os.path.expanduser("~/.ssh/config")
-    if os.path.exists(ssh_config_path):
-        ssh_config = paramiko.SSHConfig()
-        ssh_config.parse(open(ssh_config_path))
-        opts = ssh_config.lookup(host)
-        if not key_filename and 'identityfile' in opts:
-            key_filename = opts['identityfile']
-
     if key_filename:
         connect_args['key_filename'] = os.path.expanduser(key_filename)
 
@@ -106,4 +216,6 @@ def connect(user_at_host, host_key=None, keep_alive=False, timeout=60,
                     log.exception(
                         "Error connecting to {host}".format(host=host))
     ssh.get_transport().set_keepalive(keep_alive)
+    if reuse:
+        pool.put(pool_key, ssh)
     return ssh
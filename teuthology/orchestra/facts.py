@@ -0,0 +1,146 @@
+"""
+Gather commonly-needed facts about remote hosts in a single round trip, and
+cache them on disk so that other processes using the same host don't have to
+ask again
+"""
+import json
+import logging
+import os
+import tempfile
+
+from collections import OrderedDict
+
+from teuthology.config import config
+
+log = logging.getLogger(__name__)
+
+# fact name -> command printing it. Every command runs even if others fail; a
+# fact whose command fails is None.
+FACT_COMMANDS = OrderedDict([
+    ('os_release', 'cat /etc/os-release'),
+    ('lsb_release', 'lsb_release -a'),
+    ('arch', 'uname -m'),
+    ('hostname', 'hostname --fqdn'),
+    ('ip_addr', 'PATH=/sbin:/usr/sbin ip addr show'),
+    ('scratch_devs', 'cat /scratch_devs || ls /dev/[sv]d?'),
+])
+
+# Facts which are used as-is, rather than parsed
+STRIPPED_FACTS = ('arch', 'hostname')
+
+# Facts which can change without the host being reinstalled, e.g. when it
+# reboots; these are never cached on disk
+VOLATILE_FACTS = ('ip_addr', 'scratch_devs')
+
+
+def gather(remote, names=None):
+    """
+    Run FACT_COMMANDS on remote, over a single channel
+
+    :param names: The names of the facts to gather. Defaults to all of them.
+    :returns:     A dict mapping each fact's name to its command's output, or
+                  None if the command failed
+    """
+    if names is None:
+        names = FACT_COMMANDS.keys()
+    results = remote.run_batch([FACT_COMMANDS[name] for name in names],
+                               check_status=False, label='gather host facts')
+    facts = dict()
+    for name, result in zip(names, results):
+        if result.exitstatus != 0:
+            facts[name] = None
+        elif name in STRIPPED_FACTS:
+            facts[name] = result.stdout.strip()
+        else:
+            facts[name] = result.stdout
+    return facts
+
+
+def get_lsb_value(lsb_release, name):
+    """
+    Return the value of the field called name (e.g. 'Distributor ID') in the
+    output of 'lsb_release -a', or None if it is missing
+    """
+    for line in (lsb_release or '').splitlines():
+        if ':' not in line:
+            continue
+        key, value = line.split(':', 1)
+        if key.strip() == name:
+            return value.strip()
+    return None
+
+
+class Facts(dict):
+    """
+    A dict of a host's facts. Any which are missing, e.g. because they were
+    loaded from a FactsCache, are all gathered from the host in one round
+    trip the first time one of them is looked up.
+    """
+    def __init__(self, remote, facts):
+        super(Facts, self).__init__(facts)
+        self.remote = remote
+
+    def __missing__(self, name):
+        if name not in FACT_COMMANDS:
+            raise KeyError(name)
+        self.update(gather(
+            self.remote,
+            [other for other in FACT_COMMANDS.keys() if other not in self],
+        ))
+        return self[name]
+
+
+class FactsCache(object):
+    """
+    Stores each host's facts as a JSON file named after the host in path,
+    along with the host key they were gathered under. Reinstalling a host
+    changes its host key, so facts for a stale host key are ignored.
+    VOLATILE_FACTS are left out.
+    """
+    def __init__(self, path=None):
+        self.path = path or config.host_facts_dir
+
+    def _host_path(self, hostname):
+        return os.path.join(self.path, hostname + '.json')
+
+    def get(self, hostname, host_key):
+        """
+        :returns: The facts stored for hostname, or None if there are none or
+                  they were gathered under another host key
+        """
+        if not self.path or not host_key:
+            return None
+        try:
+            with open(self._host_path(hostname)) as facts_file:
+                entry = json.load(facts_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get('host_key') != host_key:
+            return None
+        return entry.get('facts')
+
+    def put(self, hostname, host_key, facts):
+        """
+        Atomically store facts for hostname. Failures are logged, not raised,
+        since the cache is only an optimization.
+        """
+        if not self.path or not host_key:
+            return
+        facts = dict((name, value) for name, value in facts.items()
+                     if name not in VOLATILE_FACTS)
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            with tempfile.NamedTemporaryFile(
+                    dir=self.path, prefix='.facts_', delete=False) as tmp:
+                json.dump(dict(host_key=host_key, facts=facts), tmp)
+            os.rename(tmp.name, self._host_path(hostname))
+        except (IOError, OSError):
+            log.warning("Could not store facts for %s", hostname,
+                        exc_info=True)
+
+    def remove(self, hostname):
+        try:
+            os.remove(self._host_path(hostname))
+        except OSError:
+            pass
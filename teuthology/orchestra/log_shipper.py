@@ -0,0 +1,174 @@
+"""
+Copy files from a remote directory while they are still being written
+"""
+import gevent
+import gevent.event
+import logging
+import os
+import shutil
+import time
+
+from cStringIO import StringIO
+
+from teuthology import safepath
+from teuthology.exceptions import CommandFailedError
+from . import run
+
+log = logging.getLogger(__name__)
+
+
+class LogShipper(object):
+    """
+    Keeps a local directory up to date with the files under a directory on a
+    remote, by periodically copying whatever has been appended to each file
+    since the last time.
+
+    Files which shrink (e.g. were truncated or replaced) are copied again
+    from the start.
+
+    Usage:
+        shipper = LogShipper(remote, '/home/ubuntu/cephtest/archive',
+                             '/archive/run/job/remote/host')
+        shipper.start(interval=60)
+        ...
+        shipper.stop()
+        stats = shipper.sync(prune=True)  # copy whatever is left
+    """
+    def __init__(self, remote, remote_dir, local_dir, sudo=True):
+        self.remote = remote
+        self.remote_dir = remote_dir
+        self.local_dir = local_dir
+        self.sudo = sudo
+        # relative path -> bytes copied so far
+        self.offsets = dict()
+        self.greenlet = None
+        self._stopped = gevent.event.Event()
+
+    def start(self, interval):
+        """
+        Call sync() every interval seconds in a greenlet, until stop() is
+        called. Errors (e.g. because the remote went down) are logged, not
+        raised.
+        """
+        self._stopped.clear()
+        self.greenlet = gevent.spawn(self._loop, interval)
+
+    def stop(self):
+        """
+        Stop the greenlet started by start(), waiting for any sync() it is
+        in the middle of.
+        """
+        self._stopped.set()
+        if self.greenlet is not None:
+            self.greenlet.join()
+            self.greenlet = None
+
+    def _loop(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.sync()
+            except Exception:
+                log.exception("Failed to ship logs from %s",
+                              self.remote.shortname)
+
+    def _sudo(self):
+        return ['sudo'] if self.sudo else []
+
+    def _copy_output(self, args, dest):
+        """
+        Run args on the remote, copying its stdout into dest without
+        buffering or logging it.
+        """
+        proc = self.remote.run(
+            args=args,
+            stdout=run.PIPE,
+            stderr=StringIO(),
+            wait=False,
+        )
+        shutil.copyfileobj(proc.stdout, dest, 32768)
+        proc.wait()
+
+    def list_files(self):
+        """
+        :returns: A dict mapping the path (relative to remote_dir) of each
+                  file under remote_dir to its size
+        """
+        listing = StringIO()
+        self._copy_output(
+            self._sudo() + [
+                'find', self.remote_dir, '-type', 'f',
+                '-printf', r'%s %P\0',
+            ],
+            listing,
+        )
+        files = dict()
+        for entry in listing.getvalue().split('\0'):
+            if not entry:
+                continue
+            size, path = entry.split(' ', 1)
+            files[path] = int(size)
+        return files
+
+    def sync(self, prune=False):
+        """
+        Copy whatever has been added to each remote file since the last call.
+
+        :param prune: Whether to also remove the local copies of files which
+                      were shipped earlier but are no longer on the remote,
+                      so that the result matches a full copy
+        :returns: A dict with the number of files ('files'), their total size
+                  ('bytes'), the number of bytes copied by this call
+                  ('transferred_bytes') and how long it took ('seconds')
+        """
+        start = time.time()
+        files = self.list_files()
+        transferred = 0
+        for path, size in sorted(files.items()):
+            offset = self.offsets.get(path, 0)
+            if size == offset:
+                continue
+            sub = safepath.munge(path)
+            safepath.makedirs(root=self.local_dir, path=os.path.dirname(sub))
+            local_path = os.path.join(self.local_dir, sub)
+            if size < offset or not os.path.exists(local_path):
+                offset = 0
+            with open(local_path, 'ab' if offset else 'wb') as local_file:
+                try:
+                    self._copy_output(
+                        self._sudo() + [
+                            'tail', '-c', '+%d' % (offset + 1), '--',
+                            os.path.join(self.remote_dir, path),
+                            run.Raw('|'),
+                            'head', '-c', str(size - offset),
+                        ],
+                        local_file,
+                    )
+                except CommandFailedError:
+                    # e.g. it was removed since we listed it. Drop anything
+                    # partially copied, so that the next sync starts over
+                    # from the same offset.
+                    log.warning("Failed to ship %s from %s", path,
+                                self.remote.shortname)
+                    local_file.truncate(offset)
+                    self.offsets[path] = offset
+                    continue
+            copied = os.path.getsize(local_path) - offset
+            self.offsets[path] = offset + copied
+            transferred += copied
+        if prune:
+            for path in set(self.offsets) - set(files):
+                log.debug("Removing %s, which is gone from %s", path,
+                          self.remote.shortname)
+                local_path = os.path.join(self.local_dir, safepath.munge(path))
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+                del self.offsets[path]
+        stats = dict(
+            files=len(files),
+            bytes=sum(files.values()),
+            transferred_bytes=transferred,
+            seconds=round(time.time() - start, 1),
+        )
+        log.debug('Shipped %d bytes from %s in %ss', transferred,
+                  self.remote.shortname, stats['seconds'])
+        return stats
@@ -0,0 +1,144 @@
+"""
+Wait for many hosts to come back from a reboot at once, reconnecting to each
+as soon as its sshd answers
+"""
+import gevent
+import logging
+import socket
+import time
+
+log = logging.getLogger(__name__)
+
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+UPTIME_PATH = '/proc/uptime'
+
+
+def get_boot_id(remote):
+    """
+    :returns: The remote's boot id, which changes every time it boots
+    """
+    return remote.sh('cat ' + BOOT_ID_PATH).strip()
+
+
+def get_uptime(remote):
+    """
+    :returns: How long, in seconds, the remote has been up
+    """
+    return float(remote.sh('cat ' + UPTIME_PATH).split()[0])
+
+
+def get_boot_ids(remotes):
+    """
+    Call get_boot_id() for each of remotes, concurrently
+
+    :returns: A dict mapping each remote to its boot id, or to None if it
+              couldn't be read
+    """
+    def get_one(remote):
+        try:
+            return get_boot_id(remote)
+        except Exception:
+            log.warning("Could not read the boot id of %s", remote.name,
+                        exc_info=True)
+            return None
+    remotes = list(remotes)
+    greenlets = [gevent.spawn(get_one, remote) for remote in remotes]
+    gevent.joinall(greenlets)
+    return dict(zip(remotes, [greenlet.value for greenlet in greenlets]))
+
+
+def port_open(host, port=22, timeout=5):
+    """
+    :returns: True if a TCP connection to host:port can be made within
+              timeout seconds
+    """
+    try:
+        sock = socket.create_connection((host, port), timeout)
+    except socket.error:
+        return False
+    sock.close()
+    return True
+
+
+def _has_rebooted(remote, boot_id, since, seen_down):
+    """
+    :param since:     When we started waiting for remote
+    :param seen_down: Whether remote has been unreachable since then
+    """
+    if boot_id is None:
+        # Without the old boot id, the remote has rebooted if it went down,
+        # or has been up for less time than we've been waiting for it
+        if seen_down:
+            return True
+        try:
+            return get_uptime(remote) < time.time() - since
+        except Exception:
+            log.debug("Could not read the uptime of %s", remote.name,
+                      exc_info=True)
+            return False
+    try:
+        return get_boot_id(remote) != boot_id
+    except Exception:
+        log.debug("Could not read the boot id of %s", remote.name,
+                  exc_info=True)
+        return False
+
+
+def _wait_for_one(remote, deadline, boot_id, min_interval, max_interval):
+    """
+    :returns: True once remote is reconnected and has rebooted; False if that
+              didn't happen before deadline
+    """
+    host = remote.name.split('@')[-1]
+    interval = min_interval
+    since = time.time()
+    seen_down = False
+    while True:
+        remaining = max(1, deadline - time.time())
+        if port_open(host, timeout=min(remaining, 10)) and \
+                remote.reconnect(socket_timeout=min(remaining, 30)):
+            if _has_rebooted(remote, boot_id, since, seen_down):
+                log.info("%s is back", remote.name)
+                return True
+            log.debug("%s has not gone down yet", remote.name)
+        else:
+            seen_down = True
+        if time.time() + interval > deadline:
+            return False
+        time.sleep(interval)
+        interval = min(interval * 2, max_interval)
+
+
+def wait_for_reboot(remotes, timeout, boot_ids=None, min_interval=1,
+                    max_interval=10):
+    """
+    Wait for each of remotes to come back after being told to reboot. Each
+    host is watched separately, probing its ssh port with exponential backoff
+    and reconnecting as soon as it answers, so this only takes as long as the
+    slowest host.
+
+    :param remotes:      The Remotes to wait for
+    :param timeout:      How long, in seconds, to wait for all of them
+    :param boot_ids:     A dict mapping remotes to their boot ids from before
+                         the reboot, as returned by get_boot_ids(). A remote
+                         still reporting the same boot id hasn't gone down
+                         yet. A remote without one is taken to be back once
+                         it has been seen to go down, or reports an uptime
+                         shorter than we have been waiting.
+    :param min_interval: The initial delay, in seconds, between probes
+    :param max_interval: The longest delay, in seconds, between probes
+    :raises: RuntimeError if any remote isn't back within timeout
+    """
+    boot_ids = boot_ids or dict()
+    remotes = list(remotes)
+    deadline = time.time() + timeout
+    greenlets = [
+        gevent.spawn(_wait_for_one, remote, deadline, boot_ids.get(remote),
+                     min_interval, max_interval)
+        for remote in remotes
+    ]
+    gevent.joinall(greenlets)
+    failed = [remote.name for remote, greenlet in zip(remotes, greenlets)
+              if not greenlet.value]
+    if failed:
+        raise RuntimeError("Could not reconnect to %s" % ', '.join(failed))
@@ -1,6 +1,7 @@
 """
 Support for paramiko remote objects.
 """
+from . import facts as host_facts
 from . import run
 from .opsys import OS
 import connection
@@ -12,10 +13,14 @@ import logging
 from cStringIO import StringIO
 from teuthology import lockstatus as ls
 from teuthology import lock
+from teuthology.exceptions import CommandFailedError
 import os
 import pwd
 import tempfile
 import netaddr
+import pipes
+import shutil
+import uuid
 
 import console
 
@@ -51,10 +56,16 @@ class Remote(object):
         self.keep_alive = keep_alive
         self._console = console
         self.ssh = ssh
+        # (SSHClient, SFTPClient)
+        self._sftp = None
+        self._facts = None
 
     def connect(self, timeout=None, create_key=None, context='connect'):
+        # Remotes for the same host share a pooled connection, as long as it
+        # is alive
         args = dict(user_at_host=self.name, host_key=self._host_key,
-                    keep_alive=self.keep_alive, _create_key=create_key)
+                    keep_alive=self.keep_alive, _create_key=create_key,
+                    reuse=True)
         if context == 'reconnect':
             # The reason for the 'context' workaround is not very
             # clear from the technical side.
@@ -62,7 +73,8 @@ class Remote(object):
             # there are no open tcp(ssh) connections.
             # When connecting without keepalive, host_key and _create_key 
             # set, it will proceed.
-            args = dict(user_at_host=self.name, _create_key=False, host_key=None)
+            args = dict(user_at_host=self.name, _create_key=False,
+                        host_key=None)
         if timeout:
             args['timeout'] = timeout
 
@@ -71,11 +83,15 @@ class Remote(object):
 
     def reconnect(self, timeout=None, socket_timeout=None, sleep_time=30):
         """
-        Attempts to re-establish connection. Returns True for success; False
-        for failure.
+        Attempts to re-establish connection, with a new SSH session. Returns
+        True for success; False for failure.
         """
+        # Callers want a new session (e.g. so that group changes apply), or
+        # suspect the old one is dead, so don't let connect() hand the pooled
+        # connection to this host out again
+        connection.pool.discard(connection.get_pool_key(self.name))
         if self.ssh is not None:
-            self.ssh.close()
+            connection.pool.release(self.ssh)
         if not timeout:
             return self._reconnect(timeout=socket_timeout)
         start_time = time.time()
@@ -123,14 +139,8 @@ class Remote(object):
         return self._cidr
 
     def _set_iface_and_cidr(self):
-        proc = self.run(
-            args=['PATH=/sbin:/usr/sbin', 'ip', 'addr', 'show'],
-            stdout=StringIO(),
-        )
-        proc.wait()
         regexp = 'inet.? %s' % self.ip_address
-        proc.stdout.seek(0)
-        for line in proc.stdout.readlines():
+        for line in (self.facts['ip_addr'] or '').splitlines():
             line = line.strip()
             if re.match(regexp, line):
                 items = line.split()
@@ -142,11 +152,45 @@ class Remote(object):
     @property
     def hostname(self):
         if not hasattr(self, '_hostname'):
-            proc = self.run(args=['hostname', '--fqdn'], stdout=StringIO())
-            proc.wait()
-            self._hostname = proc.stdout.getvalue().strip()
+            hostname = self.facts['hostname']
+            if not hostname:
+                raise RuntimeError("Could not determine hostname!")
+            self._hostname = hostname
         return self._hostname
 
+    @property
+    def facts(self):
+        """
+        A dict of commonly-needed facts about the host (see
+        orchestra.facts.FACT_COMMANDS), gathered in a single round trip the
+        first time they are needed. Those which only change when the host is
+        reinstalled are also cached on disk, keyed by the host key, so other
+        processes using this host can skip gathering them.
+        """
+        if self._facts is None:
+            name = self.name.split('@')[-1]
+            cache = host_facts.FactsCache()
+            facts = None
+            if cache.path:
+                facts = cache.get(name, self.host_key)
+            if facts is None:
+                facts = host_facts.gather(self)
+                if cache.path:
+                    cache.put(name, self.host_key, facts)
+            self._facts = host_facts.Facts(self, facts)
+        return self._facts
+
+    def refresh_facts(self):
+        """
+        Forget the host's facts, and anything derived from them, so they are
+        gathered again the next time they are needed
+        """
+        for attr in ('_os', '_arch', '_interface', '_cidr'):
+            if hasattr(self, attr):
+                delattr(self, attr)
+        self._facts = None
+        host_facts.FactsCache().remove(self.name.split('@')[-1])
+
     @property
     def machine_type(self):
         if not getattr(self, '_machine_type', None):
@@ -206,6 +250,45 @@ class Remote(object):
         r.remote = self
         return r
 
+    def run_batch(self, commands, check_status=True, label=None):
+        """
+        Run several commands, one after another, over a single channel.
+
+        Each command runs in its own subshell, with stdin from /dev/null, and
+        later commands run even if earlier ones fail.
+
+        Usage:
+            results = remote.run_batch([
+                ['touch', path],
+                'sudo chcon {con} {path}'.format(con=con, path=path),
+            ])
+
+        :param commands:     A list of commands, each either a string or a
+                             list of arguments as passed to run()
+        :param check_status: Raise CommandFailedError for the first command
+                             which exited non-zero
+        :returns:            A list of run.CommandResult, one per command
+        """
+        marker = 'teuthology-batch-%s' % uuid.uuid4().hex
+        proc = self.run(
+            args=run.build_batch_script(commands, marker),
+            stdout=StringIO(),
+            stderr=StringIO(),
+            label=label,
+        )
+        results = run.parse_batch_output(
+            proc.stdout.getvalue(), marker, commands)
+        if check_status:
+            for result in results:
+                if result.exitstatus != 0:
+                    raise CommandFailedError(
+                        command=run.quote(result.args),
+                        exitstatus=result.exitstatus,
+                        node=self.shortname,
+                        label=label,
+                    )
+        return results
+
     def mktemp(self):
         """
         Make a remote temporary file
@@ -295,34 +378,59 @@ class Remote(object):
         :param file_path: The path to the file
         :param context:   The SELinux context to be used
         """
+        args = self.chcon_command(file_path, context)
+        if args is not None:
+            self.run(args=args)
+
+    def chcon_command(self, file_path, context):
+        """
+        Return the command chcon() would run, e.g. for use with run_batch();
+        or None if this host should skip it.
+        """
         if self.os.package_type != 'rpm':
-            return
+            return None
         if lock.is_vm(self.shortname):
             log.info("Not running chcon on {machine} because it is a VM".format(
                 machine=self.shortname
             ))
-            return
-        self.run(args="sudo chcon {con} {path}".format(
-            con=context, path=file_path))
+            return None
+        return "sudo chcon {con} {path}".format(con=context, path=file_path)
+
+    def _get_sftp(self):
+        """
+        Return a paramiko.SFTPClient for the current SSH connection, reusing
+        one we already opened while it and the connection are still usable.
+        """
+        if self._sftp is not None:
+            ssh, sftp = self._sftp
+            if ssh is self.ssh and not sftp.get_channel().closed and \
+                    connection.is_alive(ssh):
+                return sftp
+        sftp = self.ssh.open_sftp()
+        self._sftp = (self.ssh, sftp)
+        return sftp
 
     def _sftp_put_file(self, local_path, remote_path):
         """
         Use the paramiko.SFTPClient to put a file. Returns the remote filename.
         """
-        sftp = self.ssh.open_sftp()
-        sftp.put(local_path, remote_path)
+        self._get_sftp().put(local_path, remote_path)
         return
 
     def _sftp_get_file(self, remote_path, local_path):
         """
         Use the paramiko.SFTPClient to get a file. Returns the local filename.
         """
-        file_size = self._format_size(
-            self._sftp_get_size(remote_path)
-        ).strip()
-        log.debug("{}:{} is {}".format(self.shortname, remote_path, file_size))
-        sftp = self.ssh.open_sftp()
-        sftp.get(remote_path, local_path)
+        with self._sftp_open_file(remote_path) as remote_file:
+            size = remote_file.stat().st_size
+            log.debug("{}:{} is {}".format(
+                self.shortname, remote_path,
+                self._format_size(size).strip()))
+            # Request the whole file up front rather than one block per
+            # round trip
+            remote_file.prefetch(size)
+            with open(local_path, 'wb') as local_file:
+                shutil.copyfileobj(remote_file, local_file, 32768)
         return local_path
 
     def _sftp_open_file(self, remote_path):
@@ -330,8 +438,7 @@ class Remote(object):
         Use the paramiko.SFTPClient to open a file. Returns a
         paramiko.SFTPFile object.
         """
-        sftp = self.ssh.open_sftp()
-        return sftp.open(remote_path)
+        return self._get_sftp().open(remote_path, 'rb')
 
     def _sftp_get_size(self, remote_path):
         """
@@ -354,12 +461,57 @@ class Remote(object):
     def remove(self, path):
         self.run(args=['rm', '-fr', path])
 
+    def read_file(self, path, sudo=False, stream=None):
+        """
+        Stream the contents of a remote file over a single channel, using
+        'cat' (or 'sudo cat').
+
+        :param sudo:   Read the file as root
+        :param stream: A file-like object to write the contents to. If not
+                       given, the contents are returned as a string.
+        :returns:      The contents, if stream was not given
+        """
+        args = ['sudo'] if sudo else []
+        args.extend(['cat', '--', path])
+        proc = self.run(args=args, stdout=run.PIPE, stderr=StringIO(),
+                        wait=False)
+        dest = stream if stream is not None else StringIO()
+        shutil.copyfileobj(proc.stdout, dest, 32768)
+        proc.wait()
+        if stream is None:
+            return dest.getvalue()
+
+    def write_file(self, path, data, sudo=False, perms=None, owner=None):
+        """
+        Stream data into a remote file over a single channel, using 'cat'
+        (run as root via 'sudo sh -c' if sudo is True).
+
+        :param data:  A string or file-like object
+        :param sudo:  Write the file as root
+        :param perms: If sudo is True, permissions to pass to chmod
+        :param owner: If sudo is True, an owner to pass to chown
+        """
+        if sudo:
+            args = ['sudo', 'sh', '-c', 'cat > ' + pipes.quote(path)]
+            if owner:
+                args.extend([run.Raw('&&'), 'sudo', 'chown', owner, path])
+            if perms:
+                args.extend([run.Raw('&&'), 'sudo', 'chmod', perms, path])
+        else:
+            if perms is not None or owner is not None:
+                raise ValueError(
+                    "To specify perms or owner, sudo must be True")
+            args = ['cat', run.Raw('>'), path]
+        self.run(args=args, stdin=data)
+
     def put_file(self, path, dest_path, sudo=False):
         """
         Copy a local filename to a remote file
         """
         if sudo:
-            raise NotImplementedError("sudo not supported")
+            with open(path, 'rb') as local_file:
+                self.write_file(dest_path, local_file, sudo=True)
+            return
 
         self._sftp_put_file(path, dest_path)
         return
@@ -378,18 +530,6 @@ class Remote(object):
         if not os.path.isdir(dest_dir):
             raise IOError("{dir} is not a directory".format(dir=dest_dir))
 
-        if sudo:
-            orig_path = path
-            path = self.mktemp()
-            args = [
-                'sudo',
-                'cp',
-                orig_path,
-                path,
-                ]
-            self.run(args=args)
-            self.chmod(path, '0666')
-
         if dest_dir == '/tmp':
             # If we're storing in /tmp, generate a unique filename
             (fd, local_path) = tempfile.mkstemp(dir=dest_dir)
@@ -399,9 +539,13 @@ class Remote(object):
             # filename
             local_path = os.path.join(dest_dir, path.split(os.path.sep)[-1])
 
-        self._sftp_get_file(path, local_path)
         if sudo:
-            self.remove(path)
+            # Stream it through 'sudo cat' rather than copying it somewhere
+            # readable first
+            with open(local_path, 'wb') as local_file:
+                self.read_file(path, sudo=True, stream=local_file)
+        else:
+            self._sftp_get_file(path, local_path)
         return local_path
 
     def get_tar(self, path, to_path, sudo=False):
@@ -426,44 +570,58 @@ class Remote(object):
         self._sftp_get_file(remote_temp_path, to_path)
         self.remove(remote_temp_path)
 
-    def get_tar_stream(self, path, sudo=False):
+    def get_tar_stream(self, path, sudo=False, fast=False):
         """
         Tar-compress a remote directory and return the RemoteProcess
         for streaming
+
+        :param fast: Compress with pigz if the remote has it, otherwise
+                     gzip, in either case at the fastest level. The stream is
+                     still gzip.
         """
         args = []
         if sudo:
             args.append('sudo')
-        args.extend([
-            'tar',
-            'cz',
-            '-f', '-',
-            '-C', path,
-            '--',
-            '.',
-            ])
+        if not fast:
+            args.extend([
+                'tar',
+                'cz',
+                '-f', '-',
+                '-C', path,
+                '--',
+                '.',
+                ])
+        else:
+            args.extend([
+                'tar',
+                'c',
+                '-f', '-',
+                '-C', path,
+                '--',
+                '.',
+                run.Raw('|'),
+                'sh', '-c',
+                'if command -v pigz >/dev/null; then exec pigz -1 -c; '
+                'else exec gzip -1 -c; fi',
+                ])
         return self.run(args=args, wait=False, stdout=run.PIPE)
 
     @property
     def os(self):
         if not hasattr(self, '_os'):
-            proc = self.run(args=['cat', '/etc/os-release'], stdout=StringIO(),
-                            stderr=StringIO(), check_status=False)
-            if proc.exitstatus == 0:
-                self._os = OS.from_os_release(proc.stdout.getvalue().strip())
-                return self._os
-
-            proc = self.run(args=['lsb_release', '-a'], stdout=StringIO(),
-                            stderr=StringIO())
-            self._os = OS.from_lsb_release(proc.stdout.getvalue().strip())
+            facts = self.facts
+            if facts['os_release'] is not None:
+                self._os = OS.from_os_release(facts['os_release'].strip())
+            elif facts['lsb_release'] is not None:
+                self._os = OS.from_lsb_release(facts['lsb_release'].strip())
+            else:
+                raise RuntimeError("Could not determine OS!")
         return self._os
 
     @property
     def arch(self):
         if not hasattr(self, '_arch'):
-            proc = self.run(args=['uname', '-m'], stdout=StringIO())
-            proc.wait()
-            self._arch = proc.stdout.getvalue().strip()
+            self._arch = self.facts['arch']
         return self._arch
 
     @property
@@ -494,7 +652,7 @@ class Remote(object):
 
     def __del__(self):
         if self.ssh is not None:
-            self.ssh.close()
+            connection.pool.release(self.ssh)
 
 
 def getShortName(name):
@@ -1,8 +1,9 @@
 """
 Paramiko run support
 """
+from collections import deque, namedtuple
 from cStringIO import StringIO
-from paramiko import ChannelFile
+from paramiko import ChannelFile, ChannelStderrFile
 
 import gevent
 import gevent.event
@@ -10,8 +11,10 @@ import socket
 import pipes
 import logging
 import shutil
+import time
 
-from ..contextutil import safe_while
+from ..command_stats import stats as command_stats
+from ..contextutil import MaxWhileTries
 from ..exceptions import (CommandCrashedError, CommandFailedError,
                           ConnectionLostError)
 
@@ -28,7 +31,10 @@ class RemoteProcess(object):
         '_stdin_buf', '_stdout_buf', '_stderr_buf',
         'returncode', 'exitstatus', 'timeout',
         'greenlets',
-        '_wait', 'logger',
+        '_wait', 'logger', 'log_limiter', 'log_blocks',
+        # for command_stats
+        'start_time', 'first_byte_time', 'bytes_out', '_stdin_file',
+        '_recorded',
         # for orchestra.remote.Remote to place a backreference
         'remote',
         'label',
@@ -37,7 +43,8 @@ class RemoteProcess(object):
     deadlock_warning = "Using PIPE for %s without wait=False would deadlock"
 
     def __init__(self, client, args, check_status=True, hostname=None,
-                 label=None, timeout=None, wait=True, logger=None):
+                 label=None, timeout=None, wait=True, logger=None,
+                 log_limiter=None, log_blocks=False):
         """
         Create the object. Does not initiate command execution.
 
@@ -54,6 +61,10 @@ class RemoteProcess(object):
                              exec_command of paramiko
         :param wait:         Whether self.wait() will be called automatically
         :param logger:       Alternative logger to use (optional)
+        :param log_limiter:  A LogLimiter to apply to the logging of stdout
+                             and stderr (optional)
+        :param log_blocks:   Log output in blocks rather than line by line
+                             (see copy_to_log())
         """
         self.client = client
         self.args = args
@@ -76,6 +87,12 @@ class RemoteProcess(object):
         self.returncode = self.exitstatus = None
         self._wait = wait
         self.logger = logger or log
+        self.log_limiter = log_limiter
+        self.log_blocks = log_blocks
+        self.start_time = self.first_byte_time = None
+        self.bytes_out = 0
+        self._stdin_file = None
+        self._recorded = False
 
     def execute(self):
         """
@@ -87,6 +104,7 @@ class RemoteProcess(object):
         log.getChild(self.hostname).info(u"{prefix} {cmd!r}".format(
             cmd=self.command, prefix=prefix))
 
+        self.start_time = time.time()
         if hasattr(self, 'timeout'):
             (self._stdin_buf, self._stdout_buf, self._stderr_buf) = \
                 self.client.exec_command(self.command, timeout=self.timeout)
@@ -100,7 +118,7 @@ class RemoteProcess(object):
         self.greenlets.append(greenlet)
 
     def setup_stdin(self, stream_obj):
-        self.stdin = KludgeFile(wrapped=self.stdin)
+        self.stdin = self._stdin_file = KludgeFile(wrapped=self.stdin)
         if stream_obj is not PIPE:
             greenlet = gevent.spawn(copy_and_close, stream_obj, self.stdin)
             self.add_greenlet(greenlet)
@@ -120,6 +138,9 @@ class RemoteProcess(object):
                     getattr(self, stream_name),
                     stream_log,
                     stream_obj,
+                    limiter=self.log_limiter,
+                    blocks=self.log_blocks,
+                    on_data=self._saw_output,
                 )
             )
             setattr(self, stream_name, stream_obj)
@@ -127,6 +148,33 @@ class RemoteProcess(object):
             # FIXME: Is this actually true?
             raise RuntimeError(self.deadlock_warning % stream_name)
 
+    def _saw_output(self, nbytes):
+        if self.first_byte_time is None:
+            self.first_byte_time = time.time()
+        self.bytes_out += nbytes
+
+    def _record_stats(self, status):
+        """
+        Record the command in command_stats, once. Output read by the caller
+        via PIPE is not counted in bytes_out.
+        """
+        if self._recorded or self.start_time is None:
+            return
+        self._recorded = True
+        first_byte = None
+        if self.first_byte_time is not None:
+            first_byte = self.first_byte_time - self.start_time
+        command_stats.record(
+            host=self.hostname,
+            command=self.command,
+            seconds=time.time() - self.start_time,
+            first_byte=first_byte,
+            bytes_in=getattr(self._stdin_file, 'bytes', 0),
+            bytes_out=self.bytes_out,
+            exitstatus=status,
+            label=self.label,
+        )
+
     def wait(self):
         """
         Block until remote process finishes.
@@ -138,6 +186,7 @@ class RemoteProcess(object):
 
         status = self._get_exitstatus()
         self.exitstatus = self.returncode = status
+        self._record_stats(status)
         for stream in ('stdout', 'stderr'):
             if hasattr(self, stream):
                 stream_obj = getattr(self, stream)
@@ -181,6 +230,19 @@ class RemoteProcess(object):
     def finished(self):
         return self._stdout_buf.channel.exit_status_ready()
 
+    def wait_for_exit(self, timeout=None):
+        """
+        Block until the remote process has exited, or until timeout seconds
+        have passed. Unlike wait(), this does not check the exit status.
+
+        paramiko sets the channel's status_event as soon as the exit status
+        arrives, and with gevent's monkey-patching waiting on it only blocks
+        the calling greenlet.
+
+        :returns: True if the process has exited; else False
+        """
+        return bool(self._stdout_buf.channel.status_event.wait(timeout))
+
     def poll(self):
         """
         :returns: self.returncode if the process is finished; else None
@@ -236,20 +298,282 @@ def quote(args):
     return ' '.join(_quote(args))
 
 
-def copy_to_log(f, logger, loglevel=logging.INFO):
+CommandResult = namedtuple(
+    'CommandResult', ['args', 'exitstatus', 'stdout', 'stderr'])
+
+
+def build_batch_script(commands, marker):
+    """
+    Return a shell script which runs each of commands in turn, each in its
+    own subshell with stdin from /dev/null, and then writes, for each command:
+
+        <marker> <index> <exitstatus> <stdout length> <stderr length>\\n
+        <stdout><stderr>
+
+    See parse_batch_output().
+
+    :param commands: A list of commands, each either a string or a list of
+                     arguments as passed to run()
+    :param marker:   A string used to sanity-check the framing
+    """
+    lines = [
+        'd=$(mktemp -d) || exit 1',
+        "trap 'rm -rf \"$d\"' EXIT",
+    ]
+    for index, command in enumerate(commands):
+        lines.append(
+            '( {cmd} ) >"$d/{i}.out" 2>"$d/{i}.err" </dev/null; '
+            'echo $? >"$d/{i}.rc"'.format(cmd=quote(command), i=index))
+    lines.append(
+        'i=0; while [ $i -lt {count} ]; do '
+        'printf \'{marker} %s %s %s %s\\n\' $i $(cat "$d/$i.rc") '
+        '$(wc -c <"$d/$i.out") $(wc -c <"$d/$i.err"); '
+        'cat "$d/$i.out" "$d/$i.err"; '
+        'i=$((i+1)); done'.format(count=len(commands), marker=marker))
+    return '\n'.join(lines)
+
+
+def parse_batch_output(output, marker, commands):
+    """
+    Split the output of a script from build_batch_script() into one
+    CommandResult per command.
+
+    :raises: ValueError if the output is truncated or malformed
+    """
+    results = []
+    pos = 0
+    for index, command in enumerate(commands):
+        end = output.find('\n', pos)
+        header = output[pos:end].split() if end != -1 else []
+        if len(header) != 5 or header[0] != marker or \
+                header[1] != str(index):
+            raise ValueError(
+                "Malformed output for batched command %d: %r" %
+                (index, output[pos:pos + 100]))
+        exitstatus, out_len, err_len = [int(n) for n in header[2:]]
+        pos = end + 1
+        stdout = output[pos:pos + out_len]
+        pos += out_len
+        stderr = output[pos:pos + err_len]
+        pos += err_len
+        if len(stdout) != out_len or len(stderr) != err_len:
+            raise ValueError(
+                "Truncated output for batched command %d" % index)
+        results.append(CommandResult(command, exitstatus, stdout, stderr))
+    return results
+
+
+class LogLimiter(object):
+    """
+    A token bucket limiting how many records copy_to_log() emits, so that
+    very noisy commands don't spend the orchestrator's CPU in log formatting.
+
+    Up to burst records are let through at once, and after that rate records
+    per second. While over the limit, every sample'th record is still let
+    through so the log shows that the command is making progress; how many
+    records were dropped is logged along with the next one let through.
+
+    One LogLimiter may be shared by several streams, e.g. a command's stdout
+    and stderr.
+    """
+    def __init__(self, rate=50, burst=500, sample=100):
+        self.rate = rate
+        self.burst = burst
+        self.sample = sample
+        self.tokens = burst
+        self.last = time.time()
+        self.over = 0
+        self.suppressed = 0
+
+    def allow(self):
+        """
+        :returns: True if the next record should be logged
+        """
+        now = time.time()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.over += 1
+        if self.sample and self.over % self.sample == 0:
+            return True
+        self.suppressed += 1
+        return False
+
+    def pop_suppressed(self):
+        """
+        :returns: The number of records dropped since the last call
+        """
+        suppressed, self.suppressed = self.suppressed, 0
+        return suppressed
+
+
+class RingBuffer(object):
+    """
+    A file-like object for capturing output which only keeps the last
+    maxsize bytes written to it, so that capturing the output of noisy
+    commands takes constant memory. The number of bytes dropped from the
+    start is kept in truncated.
+
+    Usage:
+        out = RingBuffer(maxsize=64 * 1024)
+        remote.run(args=['ceph', '-w'], stdout=out)
+        tail = out.getvalue()
+    """
+    def __init__(self, maxsize=1024 * 1024):
+        self.maxsize = maxsize
+        self.chunks = deque()
+        self.size = 0
+        self.truncated = 0
+        self.pos = 0
+
+    def write(self, data):
+        if not data:
+            return
+        self.chunks.append(data)
+        self.size += len(data)
+        while self.size > self.maxsize:
+            excess = self.size - self.maxsize
+            first = self.chunks[0]
+            if len(first) <= excess:
+                self.chunks.popleft()
+                dropped = len(first)
+            else:
+                self.chunks[0] = first[excess:]
+                dropped = excess
+            self.size -= dropped
+            self.truncated += dropped
+            self.pos = max(0, self.pos - dropped)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def getvalue(self):
+        value = ''.join(self.chunks)
+        self.chunks = deque([value]) if value else deque()
+        return value
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = max(0, offset)
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        value = self.getvalue()
+        if size is None or size < 0:
+            end = self.size
+        else:
+            end = self.pos + size
+        data = value[self.pos:end]
+        self.pos += len(data)
+        return data
+
+    def readline(self):
+        value = self.getvalue()
+        end = value.find('\n', self.pos)
+        end = self.size if end == -1 else end + 1
+        data = value[self.pos:end]
+        self.pos += len(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _iter_output(f, blocks=False):
+    """
+    Yield the data in f as it arrives: line by line, or if blocks is True, in
+    whatever chunks are available, so that a burst of output doesn't cost one
+    iteration per line.
+    """
+    if not blocks:
+        for line in f:
+            yield line
+        return
+    if isinstance(f, ChannelStderrFile):
+        read = f.channel.recv_stderr
+    elif isinstance(f, ChannelFile):
+        read = f.channel.recv
+    else:
+        read = f.read
+    while True:
+        data = read(32768)
+        if not data:
+            return
+        yield data
+
+
+def copy_to_log(f, logger, loglevel=logging.INFO, limiter=None,
+                blocks=False, stream=None, on_data=None):
+    """
+    Log the contents of f, a line at a time.
+
+    :param f:        The file-like object to read from
+    :param logger:   The logger to log to
+    :param loglevel: The level to log at
+    :param limiter:  A LogLimiter to drop records with (optional)
+    :param blocks:   Log each chunk of output as it arrives as a single
+                     multi-line record, rather than one record per line, so
+                     that log handlers can write it out as a raw block
+    :param stream:   An optional file-like object which will receive a copy
+                     of everything read from f
+    :param on_data:  An optional function to call with the length of each
+                     piece of data read from f
+    """
     # Work-around for http://tracker.ceph.com/issues/8313
     if isinstance(f, ChannelFile):
         f._flags += ChannelFile.FLAG_BINARY
 
-    for line in f:
-        line = line.rstrip()
+    def log_text(text):
+        if limiter is not None:
+            if not limiter.allow():
+                return
+            log_suppressed()
         # Second part of work-around for http://tracker.ceph.com/issues/8313
         try:
-            line = unicode(line, 'utf-8', 'replace').encode('utf-8')
-            logger.log(loglevel, line.decode('utf-8'))
+            text = unicode(text, 'utf-8', 'replace').encode('utf-8')
+            logger.log(loglevel, text.decode('utf-8'))
         except (UnicodeDecodeError, UnicodeEncodeError):
             logger.exception("Encountered unprintable line in command output")
 
+    def log_suppressed():
+        suppressed = limiter.pop_suppressed()
+        if suppressed:
+            logger.log(loglevel, "(%d records of output not logged)",
+                       suppressed)
+
+    partial = ''
+    for data in _iter_output(f, blocks):
+        if on_data is not None:
+            on_data(len(data))
+        if stream is not None:
+            stream.write(data)
+        if not blocks:
+            log_text(data.rstrip())
+            continue
+        lines = (partial + data).split('\n')
+        partial = lines.pop()
+        if lines:
+            log_text('\n'.join(line.rstrip() for line in lines))
+    if partial:
+        log_text(partial.rstrip())
+    if limiter is not None:
+        log_suppressed()
+
 
 def copy_and_close(src, fdst):
     """
@@ -262,19 +586,21 @@ def copy_and_close(src, fdst):
     fdst.close()
 
 
-def copy_file_to(src, logger, stream=None):
+def copy_file_to(src, logger, stream=None, limiter=None, blocks=False,
+                 on_data=None):
     """
     Copy file
     :param src: file to be copied.
     :param logger: the logger object
     :param stream: an optional file-like object which will receive a copy of
-                   src.
+                   src. It is written to as src is read, rather than once
+                   src is exhausted, so a RingBuffer keeps memory bounded.
+    :param limiter: see copy_to_log()
+    :param blocks: see copy_to_log()
+    :param on_data: see copy_to_log()
     """
-    if stream is not None:
-        shutil.copyfileobj(src, stream)
-        stream.seek(0)
-        src = stream
-    copy_to_log(src, logger)
+    copy_to_log(src, logger, limiter=limiter, blocks=blocks, stream=stream,
+                on_data=on_data)
 
 
 def spawn_asyncresult(fn, *args, **kwargs):
@@ -326,10 +652,16 @@ class KludgeFile(object):
     """
     def __init__(self, wrapped):
         self._wrapped = wrapped
+        # bytes written so far
+        self.bytes = 0
 
     def __getattr__(self, name):
         return getattr(self._wrapped, name)
 
+    def write(self, data):
+        self._wrapped.write(data)
+        self.bytes += len(data)
+
     def close(self):
         """
         Close and shutdown.
@@ -347,6 +679,8 @@ def run(
     name=None,
     label=None,
     timeout=None,
+    log_limiter=None,
+    log_blocks=False,
 ):
     """
     Run a command remotely.  If any of 'args' contains shell metacharacters
@@ -378,6 +712,11 @@ def run(
     :param label: Can be used to label or describe what the command is doing.
     :param timeout: timeout value for args to complete on remote channel of
                     paramiko
+    :param log_limiter: A `LogLimiter` limiting how much of stdout and stderr
+                        gets logged. Capturing is not affected; pass a
+                        `RingBuffer` as stdout or stderr to bound that.
+    :param log_blocks: Log output in multi-line blocks as it arrives rather
+                       than line by line.
     """
     try:
         transport = client.get_transport()
@@ -394,7 +733,8 @@ def run(
     if timeout:
         log.info("Running command with timeout %d", timeout)
     r = RemoteProcess(client, args, check_status=check_status, hostname=name,
-                      label=label, timeout=timeout, wait=wait, logger=logger)
+                      label=label, timeout=timeout, wait=wait, logger=logger,
+                      log_limiter=log_limiter, log_blocks=log_blocks)
     r.execute()
     r.setup_stdin(stdin)
     r.setup_output_stream(stderr, 'stderr')
@@ -410,18 +750,19 @@ def wait(processes, timeout=None):
 
     Raise if any one of them fails.
 
-    Optionally, timeout after 'timeout' seconds.
+    Optionally, timeout after 'timeout' seconds, raising MaxWhileTries.
     """
+    processes = list(processes)
     if timeout:
         log.info("waiting for %d", timeout)
     if timeout and timeout > 0:
-        with safe_while(tries=(timeout / 6)) as check_time:
-            not_ready = list(processes)
-            while len(not_ready) > 0:
-                check_time()
-                for proc in list(not_ready):
-                    if proc.finished:
-                        not_ready.remove(proc)
+        deadline = time.time() + timeout
+        for proc in processes:
+            remaining = max(deadline - time.time(), 0)
+            if not proc.wait_for_exit(remaining):
+                raise MaxWhileTries(
+                    "Processes did not exit within {timeout}s".format(
+                        timeout=timeout))
 
     for proc in processes:
         proc.wait()
@@ -1,4 +1,5 @@
 import fudge
+import gevent
 import pytest
 
 from mock import patch, Mock
@@ -80,6 +81,45 @@ class TestCluster(object):
         assert got[0] is ret1
         assert got[1] is ret2
 
+    def make_remotes(self, count, run):
+        remotes = []
+        for i in range(count):
+            m_remote = Mock()
+            m_remote.name = 'r%d' % i
+            m_remote.run.side_effect = run
+            remotes.append((m_remote, ['role%d' % i]))
+        return remotes
+
+    def test_run_concurrent(self):
+        running = []
+        max_running = []
+
+        def run(**kwargs):
+            running.append(None)
+            max_running.append(len(running))
+            gevent.sleep(0.01)
+            running.pop()
+            return kwargs['args']
+
+        c = cluster.Cluster(remotes=self.make_remotes(5, run))
+        got = c.run(args=['test'], concurrency=2)
+        assert got == [['test']] * 5
+        assert max(max_running) == 2
+
+    def test_run_concurrent_failure(self):
+        def run(**kwargs):
+            gevent.sleep(0)
+            raise RuntimeError(kwargs['args'])
+
+        remotes = self.make_remotes(3, run)
+        remotes[1][0].run.side_effect = None
+        c = cluster.Cluster(remotes=remotes)
+        with pytest.raises(RuntimeError):
+            c.run(args=['test'], concurrency=3)
+        # every node was still run on
+        for m_remote, _ in remotes:
+            m_remote.run.assert_called_once_with(args=['test'])
+
     @fudge.with_fakes
     def test_only_one(self):
         fudge.clear_expectations()
@@ -238,3 +278,8 @@ class TestWriteFile(object):
     def test_with_sudo(self, m_sudo_write_file):
         self.c.write_file("filename", "content", sudo=True)
         m_sudo_write_file.assert_called_with(self.r1, "filename", "content", owner=None, perms=None)
+
+    @patch("teuthology.misc.write_file")
+    def test_write_file_concurrent(self, m_write_file):
+        self.c.write_file("filename", "content", concurrency=4)
+        m_write_file.assert_called_with(self.r1, "filename", "content")
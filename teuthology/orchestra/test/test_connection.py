@@ -1,4 +1,9 @@
 import fudge
+import os
+import shutil
+import tempfile
+
+from mock import Mock
 
 from teuthology import config
 from .util import assert_raises
@@ -104,3 +109,76 @@ class TestConnection(object):
             _create_key=create_key,
             )
         assert got is ssh
+
+    def test_connect_reuse(self):
+        self.clear_config()
+        connection.pool.close_all()
+        m_sshclient = Mock(side_effect=lambda: Mock())
+        first = connection.connect(
+            'jdoe@orchestra.test.newdream.net.invalid',
+            _SSHClient=m_sshclient,
+            reuse=True,
+        )
+        first.get_transport.return_value.is_active.return_value = True
+        got = connection.connect(
+            'jdoe@orchestra.test.newdream.net.invalid',
+            _SSHClient=m_sshclient,
+            reuse=True,
+        )
+        assert got is first
+        assert m_sshclient.call_count == 1
+        # A dead transport is replaced, not reused
+        first.get_transport.return_value.is_active.return_value = False
+        got = connection.connect(
+            'jdoe@orchestra.test.newdream.net.invalid',
+            _SSHClient=m_sshclient,
+            reuse=True,
+        )
+        assert got is not first
+        assert m_sshclient.call_count == 2
+        first.close.assert_called_once_with()
+        connection.pool.close_all()
+
+    def test_release(self):
+        connection.pool.close_all()
+        shared = Mock()
+        shared.get_transport.return_value.is_active.return_value = True
+        connection.pool.put(('jdoe', 'host', None), shared)
+        connection.pool.release(shared)
+        shared.close.assert_not_called()
+        assert connection.pool.clients
+        shared.get_transport.return_value.is_active.return_value = False
+        connection.pool.release(shared)
+        shared.close.assert_called_once_with()
+        assert connection.pool.clients == dict()
+        private = Mock()
+        connection.pool.release(private)
+        private.close.assert_called_once_with()
+
+    def test_connect_no_reuse(self):
+        self.clear_config()
+        connection.pool.close_all()
+        m_sshclient = Mock(side_effect=lambda: Mock())
+        for i in range(2):
+            connection.connect(
+                'jdoe@orchestra.test.newdream.net.invalid',
+                _SSHClient=m_sshclient,
+            )
+        assert m_sshclient.call_count == 2
+        assert connection.pool.clients == dict()
+
+    def test_get_ssh_config_cached(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'config')
+            with open(path, 'w') as f:
+                f.write('Host foo\n  IdentityFile ~/.ssh/foo\n')
+            first = connection.get_ssh_config(path)
+            assert connection.get_ssh_config(path) is first
+            assert first.lookup('foo')['identityfile']
+            os.utime(path, (0, 0))
+            assert connection.get_ssh_config(path) is not first
+            assert connection.get_ssh_config(
+                os.path.join(temp_dir, 'missing')) is None
+        finally:
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,130 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from mock import patch
+from pipes import quote
+
+from teuthology.exceptions import CommandFailedError
+
+from .. import run
+from ..log_shipper import LogShipper
+
+
+class LocalProcess(object):
+    def __init__(self, args):
+        self.proc = subprocess.Popen(
+            ['sh', '-c', args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.stdout = self.proc.stdout
+
+    def wait(self):
+        self.proc.stderr.read()
+        if self.proc.wait() != 0:
+            raise CommandFailedError('', self.proc.returncode)
+
+
+class LocalRemote(object):
+    """
+    Runs commands on localhost, without sudo
+    """
+    shortname = 'local'
+
+    def run(self, args, **kwargs):
+        return LocalProcess(' '.join(
+            arg.value if isinstance(arg, run.Raw) else quote(arg)
+            for arg in args
+        ))
+
+
+class TestLogShipper(object):
+    def setup(self):
+        self.remote_dir = tempfile.mkdtemp()
+        self.local_dir = os.path.join(tempfile.mkdtemp(), 'remote')
+        self.shipper = LogShipper(LocalRemote(), self.remote_dir,
+                                  self.local_dir, sudo=False)
+
+    def teardown(self):
+        shutil.rmtree(self.remote_dir)
+        shutil.rmtree(os.path.dirname(self.local_dir))
+
+    def write(self, path, data, mode='a'):
+        path = os.path.join(self.remote_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, mode) as f:
+            f.write(data)
+
+    def read(self, path):
+        with open(os.path.join(self.local_dir, path)) as f:
+            return f.read()
+
+    def test_list_files(self):
+        self.write('a.log', 'aaa')
+        self.write('sub/b log', 'b')
+        assert self.shipper.list_files() == {'a.log': 3, 'sub/b log': 1}
+
+    def test_sync_incremental(self):
+        self.write('a.log', 'one\n')
+        self.write('sub/b.log', 'bee\n')
+        stats = self.shipper.sync()
+        assert stats['files'] == 2
+        assert stats['transferred_bytes'] == 8
+        assert self.read('a.log') == 'one\n'
+        assert self.read('sub/b.log') == 'bee\n'
+        self.write('a.log', 'two\n')
+        stats = self.shipper.sync()
+        assert stats['bytes'] == 12
+        assert stats['transferred_bytes'] == 4
+        assert self.read('a.log') == 'one\ntwo\n'
+        assert self.shipper.sync()['transferred_bytes'] == 0
+
+    def test_sync_truncated(self):
+        self.write('a.log', 'a long line\n')
+        self.shipper.sync()
+        self.write('a.log', 'short\n', mode='w')
+        stats = self.shipper.sync()
+        assert stats['transferred_bytes'] == 6
+        assert self.read('a.log') == 'short\n'
+
+    def test_sync_prune(self):
+        self.write('a.log', 'one\n')
+        self.write('b.log', 'bee\n')
+        self.shipper.sync()
+        os.remove(os.path.join(self.remote_dir, 'b.log'))
+        self.shipper.sync()
+        assert os.path.exists(os.path.join(self.local_dir, 'b.log'))
+        stats = self.shipper.sync(prune=True)
+        assert stats['files'] == 1
+        assert not os.path.exists(os.path.join(self.local_dir, 'b.log'))
+        assert self.shipper.offsets == {'a.log': 4}
+
+    def test_sync_failed(self):
+        self.write('a.log', 'one\n')
+        self.shipper.sync()
+        self.write('a.log', 'two\n')
+        copy_output = self.shipper._copy_output
+
+        def fail_partway(args, dest):
+            if args[0] != 'tail':
+                return copy_output(args, dest)
+            dest.write('tw')
+            raise CommandFailedError('tail', 1)
+
+        with patch.object(self.shipper, '_copy_output', fail_partway):
+            assert self.shipper.sync()['transferred_bytes'] == 0
+        assert self.shipper.offsets == {'a.log': 4}
+        assert self.read('a.log') == 'one\n'
+        assert self.shipper.sync()['transferred_bytes'] == 4
+        assert self.read('a.log') == 'one\ntwo\n'
+
+    def test_start_stop(self):
+        self.write('a.log', 'one\n')
+        self.shipper.start(0.01)
+        self.shipper.stop()
+        assert self.shipper.greenlet is None
+        self.shipper.sync()
+        assert self.read('a.log') == 'one\n'
@@ -0,0 +1,97 @@
+import pytest
+
+from mock import patch, Mock
+
+from .. import reboot
+
+
+class FakeRemote(object):
+    """
+    A remote which becomes reachable after down_probes probes, with boot ids
+    taken from boot_ids in turn
+    """
+    def __init__(self, name, boot_ids, down_probes=0, uptime=0):
+        self.name = name
+        self.boot_ids = list(boot_ids)
+        self.down_probes = down_probes
+        self.uptime = uptime
+        self.reconnect = Mock(return_value=True)
+
+    def probe(self):
+        if self.down_probes:
+            self.down_probes -= 1
+            return False
+        return True
+
+    def sh(self, script):
+        if script == 'cat ' + reboot.UPTIME_PATH:
+            return '%s 12345.67\n' % self.uptime
+        assert script == 'cat ' + reboot.BOOT_ID_PATH
+        if len(self.boot_ids) > 1:
+            return self.boot_ids.pop(0) + '\n'
+        return self.boot_ids[0] + '\n'
+
+
+class TestReboot(object):
+    def setup(self):
+        self.remotes = dict()
+        self.p_port_open = patch.object(reboot, 'port_open')
+        m_port_open = self.p_port_open.start()
+        m_port_open.side_effect = \
+            lambda host, timeout: self.remotes[host].probe()
+        self.p_sleep = patch.object(reboot.time, 'sleep')
+        self.m_sleep = self.p_sleep.start()
+
+    def teardown(self):
+        self.p_port_open.stop()
+        self.p_sleep.stop()
+
+    def make_remote(self, name, boot_ids, down_probes=0, uptime=0):
+        remote = FakeRemote('user@' + name, boot_ids, down_probes, uptime)
+        self.remotes[name] = remote
+        return remote
+
+    def test_get_boot_ids(self):
+        a = self.make_remote('a', ['one'])
+        b = self.make_remote('b', ['two'])
+        b.sh = Mock(side_effect=RuntimeError)
+        assert reboot.get_boot_ids([a, b]) == {a: 'one', b: None}
+
+    def test_waits_for_boot_id_change(self):
+        remote = self.make_remote('a', ['old', 'old', 'new'])
+        boot_ids = reboot.get_boot_ids([remote])
+        reboot.wait_for_reboot([remote], 60, boot_ids=boot_ids)
+        assert remote.reconnect.call_count == 2
+        assert self.m_sleep.call_count == 1
+
+    def test_backoff(self):
+        remote = self.make_remote('a', ['new'], down_probes=6)
+        reboot.wait_for_reboot([remote], 600, boot_ids={remote: 'old'},
+                               max_interval=8)
+        delays = [call[0][0] for call in self.m_sleep.call_args_list]
+        assert delays == [1, 2, 4, 8, 8, 8]
+        assert remote.reconnect.call_count == 1
+
+    def test_without_boot_id(self):
+        # Up for less time than we've been waiting, so it has rebooted
+        remote = self.make_remote('a', ['old'], uptime=-1)
+        reboot.wait_for_reboot([remote], 60)
+        assert remote.reconnect.call_count == 1
+
+    def test_without_boot_id_not_down_yet(self):
+        remote = self.make_remote('a', ['old'], uptime=1000)
+        remote.reconnect.side_effect = [True, True, False, True]
+        reboot.wait_for_reboot([remote], 60)
+        # only back once it has been seen to go down
+        assert remote.reconnect.call_count == 4
+
+    def test_timeout(self):
+        up = self.make_remote('up', ['new'])
+        down = self.make_remote('down', ['old'], down_probes=1000)
+        with patch.object(reboot.time, 'time') as m_time:
+            m_time.side_effect = range(0, 1000, 5)
+            with pytest.raises(RuntimeError) as excinfo:
+                reboot.wait_for_reboot(
+                    [up, down], 60, boot_ids={up: 'old', down: 'old'})
+        assert 'user@down' in str(excinfo.value)
+        assert 'user@up' not in str(excinfo.value)
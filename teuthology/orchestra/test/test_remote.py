@@ -1,10 +1,17 @@
 from mock import patch, Mock, MagicMock
+from pytest import raises
 
 from cStringIO import StringIO
+import os
+import shutil
+import tempfile
 
+from .. import connection
+from .. import facts
 from .. import remote
 from .. import opsys
-from ..run import RemoteProcess
+from ..run import CommandResult, RemoteProcess
+from teuthology.exceptions import CommandFailedError
 
 
 class TestRemote(object):
@@ -65,61 +72,138 @@ class TestRemote(object):
         assert result is proc
         assert result.remote is rem
 
+    def test_reconnect_discards_pooled(self):
+        pooled = Mock()
+        pooled.get_transport.return_value.is_active.return_value = True
+        key = connection.get_pool_key('jdoe@xyzzy.example.com')
+        connection.pool.put(key, pooled)
+        try:
+            r = remote.Remote(name='jdoe@xyzzy.example.com', ssh=pooled)
+            with patch.object(connection, 'connect') as m_connect, \
+                    patch.object(remote.Remote, 'is_online', True):
+                assert r.reconnect()
+            # a new session, which isn't shared with other Remotes
+            assert r.ssh is m_connect.return_value
+            assert not m_connect.call_args[1].get('reuse')
+            pooled.close.assert_called_with()
+            assert key not in connection.pool.clients
+        finally:
+            connection.pool.close_all()
+
+    def fake_facts(self, r, **outputs):
+        """
+        Make r.run_batch() answer FACT_COMMANDS with outputs, keyed by fact
+        name; facts missing from outputs fail
+        """
+        names = dict((command, name)
+                     for name, command in facts.FACT_COMMANDS.items())
+
+        def run_batch(commands, **kwargs):
+            results = []
+            for command in commands:
+                name = names[command]
+                if name in outputs:
+                    results.append(CommandResult(command, 0, outputs[name],
+                                                 ''))
+                else:
+                    results.append(CommandResult(command, 1, '', ''))
+            return results
+        r.run_batch = Mock(side_effect=run_batch)
+        return r.run_batch
+
     def test_hostname(self):
-        m_transport = MagicMock()
-        m_transport.getpeername.return_value = ('name', 22)
-        self.m_ssh.get_transport.return_value = m_transport
-        m_run = MagicMock()
-        args = [
-            'hostname',
-            '--fqdn',
-            ]
-        stdout = StringIO('test_hostname')
-        stdout.seek(0)
-        proc = RemoteProcess(
-            client=self.m_ssh,
-            args=args,
-            )
-        proc.stdout = stdout
-        proc._stdout_buf = Mock()
-        proc._stdout_buf.channel.recv_exit_status.return_value = 0
         r = remote.Remote(name='xyzzy.example.com', ssh=self.m_ssh)
-        m_run.return_value = proc
-        r._runner = m_run
+        self.fake_facts(r, hostname='test_hostname\n')
         assert r.hostname == 'test_hostname'
 
+    def test_hostname_failure(self):
+        r = remote.Remote(name='xyzzy.example.com', ssh=self.m_ssh)
+        self.fake_facts(r)
+        with raises(RuntimeError):
+            r.hostname
+
     def test_arch(self):
+        r = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        m_run_batch = self.fake_facts(r, arch='test_arch\n')
+        assert r.arch == 'test_arch'
+        with raises(RuntimeError):
+            r.os
+        assert m_run_batch.call_count == 1
+
+    def test_os_lsb_release(self):
+        r = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        self.fake_facts(r, lsb_release='\n'.join([
+            'Distributor ID:\tUbuntu',
+            'Description:\tUbuntu 14.04.5 LTS',
+            'Release:\t14.04',
+            'Codename:\ttrusty',
+        ]))
+        assert r.os.name == 'ubuntu'
+        assert r.os.version == '14.04'
+
+    def test_interface_and_cidr(self):
         m_transport = MagicMock()
-        m_transport.getpeername.return_value = ('name', 22)
+        m_transport.getpeername.return_value = ('10.0.0.5', 22)
         self.m_ssh.get_transport.return_value = m_transport
-        m_run = MagicMock()
-        args = [
-            'uname',
-            '-m',
-            ]
-        stdout = StringIO('test_arch')
-        stdout.seek(0)
-        proc = RemoteProcess(
-            client=self.m_ssh,
-            args='fakey',
-            )
-        proc._stdout_buf = Mock()
-        proc._stdout_buf.channel = Mock()
-        proc._stdout_buf.channel.recv_exit_status.return_value = 0
-        proc._stdout_buf.channel.expects('recv_exit_status').returns(0)
-        proc.stdout = stdout
-        m_run.return_value = proc
         r = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
-        r._runner = m_run
-        assert m_transport.getpeername.called_once_with()
-        assert proc._stdout_buf.channel.recv_exit_status.called_once_with()
-        assert m_run.called_once_with(
-            client=self.m_ssh,
-            args=args,
-            stdout=StringIO(),
-            name=r.shortname,
-        )
-        assert r.arch == 'test_arch'
+        self.fake_facts(r, ip_addr='\n'.join([
+            '1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536',
+            '    inet 127.0.0.1/8 scope host lo',
+            '2: eth0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500',
+            '    inet 10.0.0.5/24 brd 10.0.0.255 scope global eth0',
+        ]))
+        assert r.interface == 'eth0'
+        assert r.cidr == '10.0.0.0/24'
+
+    def test_facts_cached_on_disk(self):
+        facts_dir = tempfile.mkdtemp()
+        try:
+            with patch.object(facts.config, 'host_facts_dir', facts_dir):
+                def make_remote(host_key, arch, scratch_devs):
+                    r = remote.Remote(name='jdoe@xyzzy.example.com',
+                                      ssh=self.m_ssh, host_key=host_key)
+                    return r, self.fake_facts(r, arch=arch + '\n',
+                                              scratch_devs=scratch_devs)
+
+                r, _ = make_remote('key1', 'x86_64', '/dev/sdb')
+                assert r.arch == 'x86_64'
+                r, m_run_batch = make_remote('key1', 'aarch64', '/dev/sdc')
+                assert r.arch == 'x86_64'
+                assert m_run_batch.call_count == 0
+                # facts which may change across a reboot aren't cached, and
+                # are gathered together when first needed
+                assert r.facts['scratch_devs'] == '/dev/sdc'
+                assert r.facts['ip_addr'] is None
+                assert m_run_batch.call_count == 1
+                assert set(m_run_batch.call_args[0][0]) == set(
+                    facts.FACT_COMMANDS[name]
+                    for name in facts.VOLATILE_FACTS)
+                # a new host key means the host was reinstalled
+                r, _ = make_remote('key2', 'aarch64', '/dev/sdb')
+                assert r.arch == 'aarch64'
+        finally:
+            shutil.rmtree(facts_dir)
+
+    def test_run_batch(self):
+        r = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        m_run = Mock()
+        r.run = m_run
+
+        def run(args, stdout, **kwargs):
+            marker = args.split("printf '")[1].split()[0]
+            stdout.write('%s 0 0 3 0\nfoo%s 1 2 0 3\nbar' % (marker, marker))
+            return Mock(stdout=stdout)
+
+        m_run.side_effect = run
+        commands = [['echo', 'foo'], 'echo bar >&2; exit 2']
+        results = r.run_batch(commands, check_status=False)
+        assert m_run.call_count == 1
+        assert [result.exitstatus for result in results] == [0, 2]
+        assert results[0].stdout == 'foo'
+        assert results[1].stderr == 'bar'
+        with raises(CommandFailedError) as exc:
+            r.run_batch(commands)
+        assert exc.value.exitstatus == 2
 
     def test_host_key(self):
         m_key = MagicMock()
@@ -176,6 +260,67 @@ class TestRemote(object):
             rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
             assert rem._sftp_get_size('/fake/file') == 42
 
+    def test_get_sftp_reused(self):
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        m_sftp = self.m_ssh.open_sftp.return_value
+        m_sftp.get_channel.return_value.closed = False
+        self.m_ssh.get_transport.return_value.is_active.return_value = True
+        assert rem._get_sftp() is m_sftp
+        assert rem._get_sftp() is m_sftp
+        assert self.m_ssh.open_sftp.call_count == 1
+        m_sftp.get_channel.return_value.closed = True
+        rem._get_sftp()
+        assert self.m_ssh.open_sftp.call_count == 2
+
+    def test_read_file_sudo(self):
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        m_run = Mock()
+        m_run.return_value.stdout = StringIO('contents')
+        rem.run = m_run
+        assert rem.read_file('/the/path', sudo=True) == 'contents'
+        assert m_run.call_args[1]['args'] == \
+            ['sudo', 'cat', '--', '/the/path']
+
+    @patch('teuthology.orchestra.remote.tempfile.mkstemp')
+    def test_get_file_sudo(self, m_mkstemp):
+        local_dir = tempfile.mkdtemp()
+        try:
+            local_path = os.path.join(local_dir, 'file')
+            m_mkstemp.return_value = (os.open(local_path, os.O_CREAT), local_path)
+            rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+            m_run = Mock()
+            m_run.return_value.stdout = StringIO('contents')
+            rem.run = m_run
+            assert rem.get_file('/the/path', sudo=True) == local_path
+            # one command, no temporary copy on the remote end
+            assert m_run.call_count == 1
+            with open(local_path) as local_file:
+                assert local_file.read() == 'contents'
+        finally:
+            shutil.rmtree(local_dir)
+
+    def test_write_file_sudo(self):
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        m_run = Mock()
+        rem.run = m_run
+        rem.write_file('/the path', 'data', sudo=True, perms='0644')
+        args = m_run.call_args[1]['args']
+        assert args[:4] == ['sudo', 'sh', '-c', "cat > '/the path'"]
+        assert args[-4:] == ['sudo', 'chmod', '0644', '/the path']
+        assert m_run.call_args[1]['stdin'] == 'data'
+        with raises(ValueError):
+            rem.write_file('/the/path', 'data', perms='0644')
+
+    def test_get_tar_stream_fast(self):
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        m_run = Mock()
+        rem.run = m_run
+        rem.get_tar_stream('/the/path', sudo=True, fast=True)
+        args = m_run.call_args[1]['args']
+        assert args[:3] == ['sudo', 'tar', 'c']
+        assert 'pigz -1' in args[-1]
+        assert 'gzip -1' in args[-1]
+
     def test_format_size(self):
         assert remote.Remote._format_size(1023).strip() == '1023B'
         assert remote.Remote._format_size(1024).strip() == '1KB'
@@ -1,12 +1,17 @@
 from StringIO import StringIO
 
+import gevent
+import gevent.event
 import paramiko
 import socket
+import subprocess
+import time
 
 from mock import MagicMock, patch
 from pytest import raises
 
 from .. import run
+from teuthology.contextutil import MaxWhileTries
 from teuthology.exceptions import (CommandCrashedError, CommandFailedError,
                                    ConnectionLostError)
 
@@ -199,6 +204,32 @@ class TestRun(object):
         assert proc.returncode == 42
         assert str(exc.value) == "Command failed on name with status 42: 'foo'"
 
+    def test_wait_returns_on_exit(self):
+        self.m_stdout_buf.channel.recv_exit_status.return_value = 0
+        self.m_stdout_buf.channel.status_event = gevent.event.Event()
+        proc = run.run(
+            client=self.m_ssh,
+            args=['foo'],
+            wait=False,
+        )
+        gevent.spawn_later(0.1, self.m_stdout_buf.channel.status_event.set)
+        start = time.time()
+        run.wait([proc], timeout=60)
+        assert time.time() - start < 5
+        assert proc.exitstatus == 0
+
+    def test_wait_timeout(self):
+        self.m_stdout_buf.channel.status_event = gevent.event.Event()
+        proc = run.run(
+            client=self.m_ssh,
+            args=['foo'],
+            wait=False,
+        )
+        start = time.time()
+        with raises(MaxWhileTries):
+            run.wait([proc], timeout=0.1)
+        assert time.time() - start < 5
+
     def test_stdin_pipe(self):
         self.m_stdout_buf.channel.recv_exit_status.return_value = 0
         proc = run.run(
@@ -249,6 +280,86 @@ class TestRun(object):
         assert proc.exitstatus == 0
 
 
+    def test_command_stats(self):
+        set_buffer_contents(self.m_stdout_buf, 'foo\nbar\n')
+        self.m_stdout_buf.channel.recv_exit_status.return_value = 0
+        with patch.object(run, 'command_stats') as m_stats:
+            run.run(
+                client=self.m_ssh,
+                args=['foo'],
+                stdin='input',
+                stdout=StringIO(),
+                label='a label',
+            )
+        assert m_stats.record.call_count == 1
+        kwargs = m_stats.record.call_args[1]
+        assert kwargs['host'] == 'name'
+        assert kwargs['command'] == 'foo'
+        assert kwargs['bytes_in'] == 5
+        assert kwargs['bytes_out'] == 8
+        assert kwargs['exitstatus'] == 0
+        assert kwargs['label'] == 'a label'
+        assert 0 <= kwargs['first_byte'] <= kwargs['seconds']
+
+    def test_capture_ring_buffer(self):
+        set_buffer_contents(self.m_stdout_buf, ['line %d\n' % i
+                                                for i in range(100)])
+        self.m_stdout_buf.channel.recv_exit_status.return_value = 0
+        stdout = run.RingBuffer(maxsize=16)
+        proc = run.run(
+            client=self.m_ssh,
+            args=['foo'],
+            stdout=stdout,
+            log_limiter=run.LogLimiter(burst=5, sample=0),
+            log_blocks=True,
+        )
+        assert proc.stdout.getvalue() == 'line 98\nline 99\n'
+        assert proc.stdout.truncated == 790 - 16
+
+
+class TestOutput(object):
+    def test_ring_buffer(self):
+        buf = run.RingBuffer(maxsize=8)
+        buf.write('abcd')
+        buf.write('efghij')
+        assert buf.getvalue() == 'cdefghij'
+        assert buf.truncated == 2
+        buf.seek(0)
+        assert buf.read(3) == 'cde'
+        buf.write('k\nlm')
+        assert buf.getvalue() == 'ghijk\nlm'
+        buf.seek(0)
+        assert list(buf) == ['ghijk\n', 'lm']
+
+    def test_limiter(self):
+        limiter = run.LogLimiter(rate=0, burst=2, sample=3)
+        allowed = [limiter.allow() for i in range(8)]
+        assert allowed == [True, True, False, False, True,
+                           False, False, True]
+        assert limiter.pop_suppressed() == 4
+        assert limiter.pop_suppressed() == 0
+
+    def test_copy_to_log_limited(self):
+        logger = MagicMock()
+        src = StringIO(''.join('%d\n' % i for i in range(10)))
+        run.copy_to_log(src, logger,
+                        limiter=run.LogLimiter(rate=0, burst=3, sample=0))
+        messages = [c[0][1:] for c in logger.log.call_args_list]
+        assert messages == [
+            (u'0',), (u'1',), (u'2',),
+            ("(%d records of output not logged)", 7),
+        ]
+
+    def test_copy_to_log_blocks(self):
+        logger = MagicMock()
+        stream = StringIO()
+        data = 'one\ntwo\nthree'
+        run.copy_to_log(StringIO(data), logger, blocks=True, stream=stream)
+        assert stream.getvalue() == data
+        messages = [c[0][1] for c in logger.log.call_args_list]
+        assert messages == [u'one\ntwo', u'three']
+
+
 class TestQuote(object):
     def test_quote_simple(self):
         got = run.quote(['a b', ' c', 'd e '])
@@ -264,6 +375,38 @@ class TestQuote(object):
         assert got == "true && echo yay"
 
 
+class TestBatch(object):
+    commands = [
+        ['echo', 'a b'],
+        'echo err >&2; exit 3',
+        'printf "no newline"',
+        ['true'],
+    ]
+
+    def test_build_and_parse(self):
+        script = run.build_batch_script(self.commands, 'marker')
+        proc = subprocess.Popen(['sh', '-c', script], stdout=subprocess.PIPE)
+        output = proc.communicate()[0]
+        assert proc.returncode == 0
+        got = run.parse_batch_output(output, 'marker', self.commands)
+        assert got == [
+            run.CommandResult(['echo', 'a b'], 0, 'a b\n', ''),
+            run.CommandResult(self.commands[1], 3, '', 'err\n'),
+            run.CommandResult(self.commands[2], 0, 'no newline', ''),
+            run.CommandResult(['true'], 0, '', ''),
+        ]
+
+    def test_parse_truncated(self):
+        output = 'marker 0 0 4 0\na b\nmarker 1 3 0 4\ner'
+        with raises(ValueError):
+            run.parse_batch_output(output, 'marker', self.commands[:2])
+
+    def test_parse_wrong_marker(self):
+        output = 'other 0 0 4 0\na b\n'
+        with raises(ValueError):
+            run.parse_batch_output(output, 'marker', self.commands[:1])
+
+
 class TestRaw(object):
     def test_eq(self):
         str_ = "I am a raw something or other"
@@ -1,3 +1,4 @@
+import errno
 import fcntl
 import logging
 import os
@@ -299,15 +300,27 @@ def url_to_dirname(url):
     return string
 
 
-def fetch_qa_suite(branch, lock=True):
+def fetch_qa_suite(branch, lock=True, sha1=None, url=None):
     """
     Make sure ceph-qa-suite is checked out.
 
+    If the checkout_cache config option is set, the checkout comes from the
+    CheckoutCache instead of the per-branch clone used by fetch_repo().
+
     :param branch: The branch to fetch
+    :param sha1:   The sha1 we want, if known. Only used by the CheckoutCache.
+    :param url:    The repo to fetch from, if not the configured one
     :returns:      The destination path
     """
-    return fetch_repo(config.get_ceph_qa_suite_git_url(),
-                      branch, lock=lock)
+    url = url or config.get_ceph_qa_suite_git_url()
+    if config.checkout_cache:
+        with safe_while(sleep=10, tries=60) as proceed:
+            while proceed():
+                try:
+                    return get_checkout_cache().get(url, branch, sha1)
+                except GitError:
+                    log.exception("Git error encountered; retrying")
+    return fetch_repo(url, branch, lock=lock)
 
 
 def fetch_teuthology(branch, lock=True):
@@ -351,6 +364,217 @@ def bootstrap_teuthology(dest_path):
         touch_file(sentinel)
 
 
+_checkout_cache = None
+
+
+def get_checkout_cache():
+    """
+    Return this process' CheckoutCache, creating it if necessary
+    """
+    global _checkout_cache
+    if _checkout_cache is None:
+        _checkout_cache = CheckoutCache()
+    return _checkout_cache
+
+
+class CheckoutCache(object):
+    """
+    Hands out checkouts of specific sha1s, shared between jobs.
+
+    Each repo gets one bare mirror, into which branches are fetched as they
+    are asked for. Each sha1 gets its own 'git worktree' of the mirror,
+    which is never modified once created. So a sha1 which has already been
+    checked out is returned without running git or taking any lock; only
+    fetching into a mirror and adding or removing its worktrees are
+    serialized, by a lock on that mirror.
+
+    Rather than touching a file after each fetch, the sha1 a branch resolved
+    to is remembered, along with when; a request for that branch within
+    FRESHNESS_INTERVAL seconds reuses it. Requests naming a sha1 which the
+    mirror already has never need to fetch.
+
+    Once a mirror has more than size worktrees, the least recently used
+    ones are removed - except those used within the last max_job_time
+    seconds, since a running job may still be using them.
+
+    Layout, under base_path:
+        mirrors/<url_to_dirname(url)>.git
+        worktrees/<url_to_dirname(url)>/<sha1>
+        worktrees/<url_to_dirname(url)>/<sha1>.ready
+    """
+    def __init__(self, base_path=None, size=None):
+        self.base_path = base_path or os.path.join(
+            config.src_base_path, 'checkout_cache')
+        if size is None:
+            size = config.checkout_cache_size
+        self.size = size
+        # (url, branch) -> (sha1, time of fetch)
+        self.branch_sha1s = dict()
+
+    def mirror_path(self, url):
+        return os.path.join(self.base_path, 'mirrors',
+                            url_to_dirname(url) + '.git')
+
+    def worktree_path(self, url, sha1):
+        return os.path.join(self.base_path, 'worktrees',
+                            url_to_dirname(url), sha1)
+
+    def get(self, url, branch, sha1=None):
+        """
+        Return the path to a checkout of url at sha1; or, if sha1 isn't given
+        or can't be found, at the tip of branch.
+
+        The checkout must not be modified.
+
+        :param url:    The URL to the repo
+        :param branch: The branch
+        :param sha1:   The sha1, if known
+        :raises:       BranchNotFoundError if the branch is not found;
+                       GitError for other errors
+        """
+        validate_branch(branch)
+        want_sha1 = sha1 or self._fresh_sha1(url, branch)
+        if want_sha1:
+            path = self._get_ready(url, want_sha1)
+            if path:
+                return path
+        mirror = self.mirror_path(url)
+        if not os.path.isdir(os.path.dirname(mirror)):
+            os.makedirs(os.path.dirname(mirror))
+        with FileLock(mirror + '.lock'):
+            # Another process may have just added it
+            if want_sha1:
+                path = self._get_ready(url, want_sha1)
+                if path:
+                    return path
+            if not sha1 or not self._has_commit(mirror, sha1):
+                self._fetch(url, mirror, branch)
+                if not sha1 or not self._has_commit(mirror, sha1):
+                    if sha1:
+                        log.warning("%s not found in %s; using the tip of %s",
+                                    sha1, url, branch)
+                    sha1 = self.branch_sha1s[(url, branch)][0]
+            path = self.worktree_path(url, sha1)
+            if not self._mark_used(path):
+                self._add_worktree(mirror, path, sha1)
+                open(path + '.ready', 'w').close()
+            self._evict(url, mirror, keep=path)
+        return path
+
+    def _fresh_sha1(self, url, branch):
+        sha1, fetched = self.branch_sha1s.get((url, branch), (None, 0))
+        if time.time() - fetched < FRESHNESS_INTERVAL:
+            return sha1
+
+    def _get_ready(self, url, sha1):
+        path = self.worktree_path(url, sha1)
+        if self._mark_used(path):
+            return path
+
+    def _mark_used(self, path):
+        """
+        Bump the mtime of path's ready marker, which is only ever created,
+        after the checkout is complete, with the mirror's lock held.
+
+        :returns: False if the marker or the checkout is missing, e.g.
+                  because it was just evicted
+        """
+        try:
+            os.utime(path + '.ready', None)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+        return os.path.isdir(path)
+
+    def _git(self, args, cwd):
+        proc = subprocess.Popen(
+            ['git'] + args,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        out = proc.communicate()[0]
+        return proc.returncode, out
+
+    def _has_commit(self, mirror, sha1):
+        if not os.path.isdir(mirror):
+            return False
+        result, _ = self._git(['cat-file', '-e', sha1 + '^{commit}'], mirror)
+        return result == 0
+
+    def _fetch(self, url, mirror, branch):
+        """
+        Fetch branch from url into mirror, creating the mirror if necessary,
+        and remember what it resolved to.
+        """
+        if not os.path.isdir(mirror):
+            log.info("Creating mirror of %s at %s", url, mirror)
+            result, out = self._git(['init', '--bare', mirror],
+                                    os.path.dirname(mirror))
+            if result != 0:
+                log.error(out)
+                raise GitError("git init failed!")
+            result, out = self._git(['remote', 'add', 'origin', url], mirror)
+            if result != 0:
+                log.error(out)
+                raise GitError("git remote add failed!")
+        else:
+            set_remote(mirror, url)
+        log.info("Fetching %s from %s into %s", branch, url, mirror)
+        ref = 'refs/heads/%s' % branch
+        result, out = self._git(
+            ['fetch', '-p', 'origin', '+%s:%s' % (ref, ref)], mirror)
+        if result != 0:
+            log.error(out)
+            # git's capitalization of this message varies between versions
+            if "couldn't find remote ref" in out.lower():
+                raise BranchNotFoundError(branch, url)
+            raise GitError("git fetch failed!")
+        result, out = self._git(
+            ['rev-parse', '--verify', ref + '^{commit}'], mirror)
+        if result != 0:
+            raise BranchNotFoundError(branch, url)
+        self.branch_sha1s[(url, branch)] = (out.strip(), time.time())
+
+    def _add_worktree(self, mirror, path, sha1):
+        log.info("Checking out %s at %s", sha1, path)
+        if os.path.exists(path) or os.path.exists(path + '.ready'):
+            # Left over from an interrupted checkout or eviction
+            self._remove_worktree(mirror, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        result, out = self._git(
+            ['worktree', 'add', '--detach', path, sha1], mirror)
+        if result != 0:
+            log.error(out)
+            shutil.rmtree(path, ignore_errors=True)
+            raise GitError("git worktree add failed!")
+
+    def _remove_worktree(self, mirror, path):
+        log.info("Removing checkout %s", path)
+        if os.path.exists(path + '.ready'):
+            os.remove(path + '.ready')
+        shutil.rmtree(path, ignore_errors=True)
+        self._git(['worktree', 'prune'], mirror)
+
+    def _evict(self, url, mirror, keep=None):
+        worktrees_dir = os.path.dirname(self.worktree_path(url, 'x'))
+        used = []
+        for name in os.listdir(worktrees_dir):
+            if not name.endswith('.ready'):
+                continue
+            path = os.path.join(worktrees_dir, name[:-len('.ready')])
+            used.append((os.path.getmtime(path + '.ready'), path))
+        excess = len(used) - self.size
+        if excess <= 0:
+            return
+        in_use_since = time.time() - config.max_job_time
+        for mtime, path in sorted(used)[:excess]:
+            if path == keep or mtime > in_use_since:
+                continue
+            self._remove_worktree(mirror, path)
+
+
 class FileLock(object):
     def __init__(self, filename, noop=False):
         self.filename = filename
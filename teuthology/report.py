@@ -5,6 +5,8 @@ import re
 import requests
 import logging
 import socket
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 import teuthology
@@ -415,7 +417,7 @@ class ResultsReporter(object):
         response.raise_for_status()
 
 
-def push_job_info(run_name, job_id, job_info, base_uri=None):
+def push_job_info(run_name, job_id, job_info, base_uri=None, reporter=None):
     """
     Push a job's info (example: ctx.config) to the results server.
 
@@ -424,14 +426,17 @@ def push_job_info(run_name, job_id, job_info, base_uri=None):
     :param job_info: A dict containing the job's information.
     :param base_uri: The endpoint of the results server. If you leave it out
                      ResultsReporter will ask teuthology.config.
+    :param reporter: An existing ResultsReporter to use, so that its HTTP
+                     session can be shared between many calls.
     """
-    reporter = ResultsReporter()
+    if reporter is None:
+        reporter = ResultsReporter()
     if not reporter.base_uri:
         return
     reporter.report_job(run_name, job_id, job_info)
 
 
-def try_push_job_info(job_config, extra_info=None):
+def try_push_job_info(job_config, extra_info=None, reporter=None):
     """
     Wrap push_job_info, gracefully doing nothing if:
         Anything inheriting from requests.exceptions.RequestException is raised
@@ -441,6 +446,7 @@ def try_push_job_info(job_config, extra_info=None):
 
     :param job_config: The ctx.config object to push
     :param extra_info: Optional second dict to push
+    :param reporter:   Optional ResultsReporter to push with
     """
     log = init_logging()
 
@@ -463,13 +469,93 @@ def try_push_job_info(job_config, extra_info=None):
 
     try:
         log.debug("Pushing job info to %s", config.results_server)
-        push_job_info(run_name, job_id, job_info)
+        push_job_info(run_name, job_id, job_info, reporter=reporter)
         return
     except report_exceptions:
         log.exception("Could not report results to %s",
                       config.results_server)
 
 
+class Heartbeat(object):
+    """
+    Collects "still alive" updates for many running jobs and sends them to
+    the results server together, over one ResultsReporter's session, so that
+    the watchdog makes one pass per interval rather than one per job. If a
+    job is queued more than once before a flush, only its latest update is
+    sent.
+
+    If the results server fails or is slow to respond, backoff grows, and
+    callers should wait that much longer than usual before the next flush.
+    """
+    # Flushes that take longer than this many seconds count as slow
+    slow_threshold = 30
+    min_backoff = 15
+    max_backoff = 600
+
+    def __init__(self, reporter=None):
+        self._reporter = reporter
+        self.pending = OrderedDict()
+        self.backoff = 0
+
+    @property
+    def reporter(self):
+        if self._reporter is None:
+            self._reporter = ResultsReporter()
+        return self._reporter
+
+    def queue(self, job_info):
+        """
+        Queue a heartbeat for a job.
+
+        :param job_info: A dict containing at least the job's name and job_id
+        """
+        self.pending[job_info['job_id']] = job_info
+
+    def discard(self, job_id):
+        """
+        Drop any queued heartbeat for job_id, e.g. because it finished.
+        """
+        self.pending.pop(job_id, None)
+
+    def flush(self):
+        """
+        Send all queued heartbeats, then adjust self.backoff.
+
+        Sending stops at the first failure; the remaining heartbeats stay
+        queued for the next flush.
+
+        :returns: The number of heartbeats sent
+        """
+        log = init_logging()
+        if not self.pending or not self.reporter.base_uri:
+            self.pending.clear()
+            return 0
+        sent = 0
+        failed = False
+        start = time.time()
+        while self.pending:
+            job_id, job_info = self.pending.popitem(last=False)
+            try:
+                self.reporter.report_job(job_info['name'], job_id, job_info)
+            except report_exceptions:
+                log.exception("Could not send heartbeats to %s",
+                              self.reporter.base_uri)
+                self.pending[job_id] = job_info
+                failed = True
+                break
+            sent += 1
+        elapsed = time.time() - start
+        if failed or elapsed > self.slow_threshold:
+            self.backoff = min(max(self.backoff * 2, self.min_backoff),
+                               self.max_backoff)
+            log.warning("Results server is slow or failing; backing off "
+                        "heartbeats by %ss", self.backoff)
+        else:
+            self.backoff = 0
+        log.debug("Sent %d heartbeats in %.1fs", sent, elapsed)
+        return sent
+
+
 def try_delete_jobs(run_name, job_ids, delete_empty_run=True):
     """
     Using the same error checking and retry mechanism as try_push_job_info(),
@@ -5,6 +5,7 @@ import types
 
 from copy import deepcopy
 
+from .command_stats import stats as command_stats
 from .config import config as teuth_config
 from .exceptions import ConnectionLostError
 from .job_status import set_status
@@ -67,6 +68,7 @@ def run_one_task(taskname, stack, timer, **kwargs):
         log.info("Running task {}...".format(taskname))
     timer.mark('%s enter' % taskname)
     taskname = taskname.replace('-', '_')
+    command_stats.task = taskname
     task = get_task(taskname)
     manager = task(**kwargs)
     if hasattr(manager, '__enter__'):
@@ -169,6 +171,7 @@ def run_tasks(tasks, ctx):
                 taskname, manager = stack.pop()
                 log.debug('Unwinding manager %s', taskname)
                 timer.mark('%s exit' % taskname)
+                command_stats.task = taskname
                 try:
                     suppress = manager.__exit__(*exc_info)
                 except Exception as e:
@@ -203,4 +206,7 @@ def run_tasks(tasks, ctx):
         finally:
             # be careful about cyclic references
             del exc_info
+            if archive_path:
+                command_stats.write(
+                    os.path.join(archive_path, 'command_stats.yaml'))
         timer.mark("tasks complete")
@@ -1,10 +1,15 @@
+import logging
 import pprint
+import time
 import yaml
 
 import teuthology.beanstalk
+from teuthology.config import config
 from teuthology.misc import get_user, merge_configs
 from teuthology import report
 
+log = logging.getLogger(__name__)
+
 
 def main(args):
     if not args['--last-in-suite']:
@@ -61,17 +66,22 @@ def build_config(args):
     return job_config
 
 
-def schedule_job(job_config, num=1):
+def schedule_job(job_config, num=1, beanstalk=None, reporter=None):
     """
     Schedule a job.
 
     :param job_config: The complete job dict
     :param num:      The number of times to schedule the job
+    :param beanstalk: An existing beanstalk connection to use. If omitted, a
+                      new one is opened.
+    :param reporter: An existing report.ResultsReporter to use when reporting
+                     the job as queued. If omitted, a new one is created.
     """
     num = int(num)
     job = yaml.safe_dump(job_config)
     tube = job_config.pop('tube')
-    beanstalk = teuthology.beanstalk.connect()
+    if beanstalk is None:
+        beanstalk = teuthology.beanstalk.connect()
     beanstalk.use(tube)
     while num > 0:
         jid = beanstalk.put(
@@ -82,5 +92,38 @@ def schedule_job(job_config, num=1):
         print 'Job scheduled with name {name} and ID {jid}'.format(
             name=job_config['name'], jid=jid)
         job_config['job_id'] = str(jid)
-        report.try_push_job_info(job_config, dict(status='queued'))
+        report.try_push_job_info(job_config, dict(status='queued'),
+                                 reporter=reporter)
         num -= 1
+
+
+def schedule_jobs(job_configs, num=1, throttle=None):
+    """
+    Schedule many jobs from within this process.
+
+    All of the jobs share one beanstalk connection and one results server
+    session, which is far cheaper than running teuthology-schedule once per
+    job.
+
+    :param job_configs: An iterable of complete job dicts, e.g. from
+                        build_config()
+    :param num:         The number of times to schedule each job
+    :param throttle:    If set, the number of seconds to sleep between jobs
+    :returns:           The number of jobs scheduled
+    """
+    beanstalk = teuthology.beanstalk.connect()
+    reporter = None
+    if config.results_server:
+        reporter = report.ResultsReporter()
+    count = 0
+    try:
+        for job_config in job_configs:
+            if count and throttle:
+                log.info("pause between jobs : --throttle %s", throttle)
+                time.sleep(int(throttle))
+            schedule_job(job_config, num, beanstalk=beanstalk,
+                         reporter=reporter)
+            count += 1
+    finally:
+        beanstalk.close()
+    return count
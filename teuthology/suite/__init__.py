@@ -86,6 +86,8 @@ def main(args):
     elif 'multi' in conf.machine_type:
         schedule_fail("'multi' is not a valid machine_type. " +
                       "Maybe you want 'plana,mira,burnupi' or similar")
+    if conf.subset and conf.subset_file:
+        schedule_fail("--subset and --subset-file are mutually exclusive")
 
     if conf.email:
         config.results_email = conf.email
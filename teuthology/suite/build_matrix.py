@@ -1,12 +1,19 @@
+import cPickle as pickle
+import hashlib
 import logging
 import os
+import shutil
+import signal
+import subprocess
+import tempfile
 
+from ..config import config
 from . import matrix
 
 log = logging.getLogger(__name__)
 
 
-def build_matrix(path, subset=None):
+def build_matrix(path, subset=None, lazy=False, use_index=False):
     """
     Return a list of items descibed by path such that if the list of
     items is chunked into mincyclicity pieces, each piece is still a
@@ -41,35 +48,224 @@ def build_matrix(path, subset=None):
 
     :param path:        The path to search for yaml fragments
     :param subset:	(index, outof)
+    :param lazy:        If True, return a Combinations object which
+                        generates the tuples on demand instead of a list
+    :param use_index:   If True, use the on-disk matrix index (see
+                        load_matrix())
     """
     if subset:
         log.info(
             'Subset=%s/%s' %
             (str(subset[0]), str(subset[1]))
         )
-    mat, first, matlimit = _get_matrix(path, subset)
+    mat, first, matlimit = _get_matrix(path, subset, use_index)
+    if lazy:
+        return Combinations(path, mat, first, matlimit)
     return generate_combinations(path, mat, first, matlimit)
 
 
-def _get_matrix(path, subset=None):
+def _get_matrix(path, subset=None, use_index=False):
+    if use_index:
+        get_matrix = load_matrix
+    else:
+        get_matrix = _build_matrix
     mat = None
     first = None
     matlimit = None
     if subset:
         (index, outof) = subset
-        mat = _build_matrix(path, mincyclicity=outof)
-        first = (mat.size() / outof) * index
-        if index == outof or index == outof - 1:
-            matlimit = mat.size()
-        else:
-            matlimit = (mat.size() / outof) * (index + 1)
+        mat = get_matrix(path, mincyclicity=outof)
+        first, matlimit = _subset_range(mat, index, outof)
     else:
         first = 0
-        mat = _build_matrix(path)
+        mat = get_matrix(path)
         matlimit = mat.size()
     return mat, first, matlimit
 
 
+def _subset_range(mat, index, outof):
+    """
+    Return the [first, matlimit) range of indices into mat making up subset
+    index/outof
+    """
+    first = (mat.size() / outof) * index
+    if index == outof or index == outof - 1:
+        matlimit = mat.size()
+    else:
+        matlimit = (mat.size() / outof) * (index + 1)
+    return first, matlimit
+
+
+def _fork_map(func, args_list, processes):
+    """
+    Return [func(*args) for args in args_list], computing each item in a
+    forked child process, with at most processes children at a time.
+
+    multiprocessing.Pool does not get along with gevent's monkey-patching, so
+    results are passed back to the parent via temporary pickle files. Since
+    the children are forked, the arguments themselves are never pickled.
+    """
+    if processes <= 1 or len(args_list) <= 1:
+        return [func(*args) for args in args_list]
+    results = [None] * len(args_list)
+    todo = list(reversed(list(enumerate(args_list))))
+    pending = dict()
+    tmp_dir = tempfile.mkdtemp(prefix='teuthology-fork-map-')
+    try:
+        while todo or pending:
+            while todo and len(pending) < processes:
+                index, args = todo.pop()
+                result_path = os.path.join(tmp_dir, str(index))
+                pid = os.fork()
+                if pid == 0:
+                    status = 1
+                    try:
+                        with open(result_path, 'wb') as result_file:
+                            pickle.dump(func(*args), result_file,
+                                        pickle.HIGHEST_PROTOCOL)
+                        status = 0
+                    except Exception:
+                        log.exception("Worker for item %d failed", index)
+                    finally:
+                        os._exit(status)
+                pending[pid] = (index, result_path)
+            pid, status = os.waitpid(-1, 0)
+            if pid not in pending:
+                continue
+            index, result_path = pending.pop(pid)
+            if status != 0:
+                raise RuntimeError(
+                    "Worker for item %d exited with status %d" %
+                    (index, status))
+            with open(result_path, 'rb') as result_file:
+                results[index] = pickle.load(result_file)
+    finally:
+        for pid in pending:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+# Bump this whenever the classes in matrix.py change, so that indices pickled
+# by an older teuthology are never loaded
+MATRIX_INDEX_VERSION = 1
+
+
+def get_index_key(path):
+    """
+    Return a key identifying the contents of the suite at path, for naming
+    its matrix indices, or None if it can't be indexed.
+
+    The key is made from the commit checked out in path's git repo and
+    path's location within it, which takes two git commands however large
+    the suite is. Fragment directories the suite symlinks to elsewhere in the
+    same repo are covered by the commit. If path itself has uncommitted or
+    untracked changes, None is returned.
+    """
+    output = _git_output(['rev-parse', 'HEAD', '--show-prefix'], path)
+    if not output:
+        return None
+    lines = output.splitlines()
+    head = lines[0]
+    prefix = lines[1] if len(lines) > 1 else ''
+    status = _git_output(
+        ['status', '--porcelain', '--untracked-files=all', '--', '.'], path)
+    if status is None or status:
+        return None
+    key = hashlib.sha1('version %d\n' % MATRIX_INDEX_VERSION)
+    key.update('%s %s\n' % (head, prefix))
+    return key.hexdigest()
+
+
+def _git_output(args, cwd):
+    """
+    Run git with args in cwd, returning its stripped output, or None if it
+    failed.
+    """
+    try:
+        proc = subprocess.Popen(
+            ['git'] + args,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError:
+        return None
+    stdout, _ = proc.communicate()
+    if proc.returncode != 0:
+        return None
+    return stdout.strip()
+
+
+def get_matrix_index_dir():
+    """
+    Matrix indices live next to the repos managed by repo_utils
+    """
+    return os.path.join(config.src_base_path, 'matrix_index')
+
+
+def get_matrix_index_path(index_key, mincyclicity=0):
+    return os.path.join(
+        get_matrix_index_dir(),
+        '%s-%d.pickle' % (index_key, mincyclicity),
+    )
+
+
+def load_matrix(path, mincyclicity=0):
+    """
+    Like _build_matrix(), but consult an on-disk index keyed by
+    get_index_key(path), so that repeated runs against the same suite sha1 do
+    not have to parse the suite directory and rebuild the Matrix objects.
+
+    If path is not a clean git checkout, the matrix is simply built.
+    """
+    return load_indexed_matrix(path, get_index_key(path), mincyclicity)
+
+
+def load_indexed_matrix(path, index_key, mincyclicity=0):
+    """
+    Like load_matrix(), for callers which already have get_index_key(path)
+    """
+    if index_key is None:
+        return _build_matrix(path, mincyclicity)
+    index_path = get_matrix_index_path(index_key, mincyclicity)
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, 'rb') as index_file:
+                mat = pickle.load(index_file)
+            log.debug("Loaded matrix index %s", index_path)
+            return mat
+        except Exception:
+            log.warning("Ignoring unreadable matrix index %s", index_path,
+                        exc_info=True)
+    mat = _build_matrix(path, mincyclicity)
+    save_matrix(mat, index_path)
+    return mat
+
+
+def save_matrix(mat, index_path):
+    """
+    Atomically write mat to index_path. Failures are logged, not raised, since
+    the index is only an optimization.
+    """
+    index_dir = os.path.dirname(index_path)
+    try:
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        with tempfile.NamedTemporaryFile(
+                dir=index_dir, prefix='.matrix_', delete=False) as tmp:
+            pickle.dump(mat, tmp, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp.name, index_path)
+        log.debug("Wrote matrix index %s", index_path)
+    except (IOError, OSError):
+        log.warning("Could not write matrix index %s", index_path,
+                    exc_info=True)
+
+
 def _build_matrix(path, mincyclicity=0, item=''):
     if os.path.basename(path)[0] == '.':
         return None
@@ -159,13 +355,43 @@ def generate_combinations(path, mat, generate_from, generate_to):
     component will appear as a file with braces listing the selection
     of chosen subitems.
     """
-    ret = []
-    for i in range(generate_from, generate_to):
+    return list(iterate_combinations(path, mat, generate_from, generate_to))
+
+
+def iterate_combinations(path, mat, generate_from, generate_to):
+    """
+    Like generate_combinations(), but yields each (description, [file
+    list]) tuple as it is generated rather than building the whole list
+    up front.
+    """
+    for i in xrange(generate_from, generate_to):
         output = mat.index(i)
-        ret.append((
+        yield (
             matrix.generate_desc(combine_path, output),
-            matrix.generate_paths(path, output, combine_path)))
-    return ret
+            matrix.generate_paths(path, output, combine_path))
+
+
+class Combinations(object):
+    """
+    A re-iterable, lazily generated sequence of the (description, [file
+    list]) tuples in [generate_from, generate_to).
+
+    Iterating only generates as many combinations as are consumed, so
+    callers which stop early (e.g. due to --limit) never pay for the
+    rest of the matrix.
+    """
+    def __init__(self, path, mat, generate_from, generate_to):
+        self.path = path
+        self.mat = mat
+        self.generate_from = generate_from
+        self.generate_to = generate_to
+
+    def __len__(self):
+        return self.generate_to - self.generate_from
+
+    def __iter__(self):
+        return iterate_combinations(
+            self.path, self.mat, self.generate_from, self.generate_to)
 
 
 def combine_path(left, right):
@@ -0,0 +1,65 @@
+import copy
+import os
+import yaml
+
+from collections import namedtuple
+
+
+Fragment = namedtuple('Fragment', ['mtime', 'text', 'parsed', 'mergeable'])
+
+
+class FragmentCache(object):
+    """
+    Caches the text and parsed contents of suite yaml fragments, so that
+    fragments shared by many jobs are only read and parsed once.
+
+    Entries are keyed by path and are invalidated when the file's mtime
+    changes.
+    """
+    def __init__(self):
+        self._fragments = dict()
+
+    def get(self, path):
+        """
+        Return the Fragment for path, reading and parsing it if it is not
+        already cached or has changed on disk.
+        """
+        mtime = os.path.getmtime(path)
+        fragment = self._fragments.get(path)
+        if fragment is None or fragment.mtime != mtime:
+            text = file(path, 'r').read()
+            try:
+                parsed = yaml.load(text)
+            except yaml.YAMLError:
+                # e.g. an alias whose anchor lives in another fragment
+                parsed = None
+                mergeable = False
+            else:
+                mergeable = parsed is None or isinstance(parsed, dict)
+            fragment = Fragment(mtime, text, parsed, mergeable)
+            self._fragments[path] = fragment
+        return fragment
+
+    def load(self, paths):
+        """
+        Return the result of parsing the concatenation of the fragments in
+        paths.
+
+        When every fragment is a standalone mapping, loading the
+        concatenation is equivalent to updating a dict with each fragment
+        in turn (later top-level keys win), so the cached documents are
+        merged that way. Otherwise we fall back to parsing the
+        concatenated text.
+
+        :param paths: A list of fragment paths, in order
+        :returns:     A dict which the caller is free to modify
+        """
+        fragments = [self.get(path) for path in paths]
+        if not all([fragment.mergeable for fragment in fragments]):
+            return yaml.load(
+                '\n'.join([fragment.text for fragment in fragments]))
+        result = dict()
+        for fragment in fragments:
+            if fragment.parsed:
+                result.update(fragment.parsed)
+        return copy.deepcopy(result)
@@ -1,5 +1,4 @@
 import os
-import heapq
 from fractions import gcd
 
 def lcm(a, b):
@@ -216,9 +215,13 @@ class Sum(Matrix):
     an offset (position in input list) and a multiple (pseudo_size / size)
     such that the psuedo_index for index i is <offset> + i*<multiple>.
 
-    I don't have a good way to map index to pseudo index, so we'll
-    precompute a mapping in the constructor (self._i_so_sis) from
-    index to (subset_index, subset).
+    Mapping an index back to a pseudo index is done on demand: the
+    number of pseudo indices <= pi is monotonic in pi, so we binary
+    search [0, pseudo_size) for the smallest pi covering index i.  Since
+    every multiple is itself a multiple of the number of subsequences,
+    pi % len(submats) identifies the subsequence.  This avoids
+    materializing a mapping for every index, which is prohibitive for
+    large suites.
     """
     def __init__(self, item, _submats):
         assert len(_submats) > 0, \
@@ -238,22 +241,6 @@ class Sum(Matrix):
             """
             return submat.minscanlen() * multiple
 
-        def index_to_pindex_generator(submats):
-            assert len(submats) > 0, "submats must be non-empty"
-            h = []
-            for (offset, multiple), submat in submats:
-                heapq.heappush(h, (offset, 0, multiple, submat))
-            while True:
-                cur, si, multiple, submat = heapq.heappop(h)
-                heapq.heappush(
-                    h,
-                    (cur + multiple, si + 1, multiple, submat))
-                yield si, submat
-
-        self._i_to_sis = dict(
-            zip(range(self._size), index_to_pindex_generator(self._submats))
-        )
-
         self._minscanlen = self.pseudo_index_to_index(
             max(map(sm_to_pmsl, self._submats)))
 
@@ -265,6 +252,19 @@ class Sum(Matrix):
             return -1
         return (pi - offset) / multiple
 
+    def index_to_pseudo_index(self, i):
+        """
+        min(pi) s.t. pseudo_index_to_index(pi) >= i
+        """
+        lo, hi = 0, self._pseudo_size - 1
+        while lo < hi:
+            mid = (lo + hi) / 2
+            if self.pseudo_index_to_index(mid) < i:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
     def pseudo_index_to_index(self, pi):
         """
         Count all pseudoindex values <= pi with corresponding subset indices
@@ -282,8 +282,9 @@ class Sum(Matrix):
         return self._size
 
     def index(self, i):
-        si, submat = self._i_to_sis[i % self._size]
-        return (self.item, submat.index(si))
+        pi = self.index_to_pseudo_index(i % self._size)
+        (offset, multiple), submat = self._submats[pi % len(self._submats)]
+        return (self.item, submat.index((pi - offset) / multiple))
 
 def generate_lists(result):
     """
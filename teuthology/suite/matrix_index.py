@@ -0,0 +1,128 @@
+import logging
+import multiprocessing
+import os
+import yaml
+
+import teuthology
+
+from .build_matrix import (
+    Combinations, get_index_key, get_matrix_index_path, load_indexed_matrix,
+    load_matrix, _fork_map, _subset_range,
+)
+
+log = logging.getLogger(__name__)
+
+def main(args):
+    if args['--verbose']:
+        teuthology.log.setLevel(logging.DEBUG)
+    outofs = [int(outof) for outof in args['--outof']]
+    subsets_dir = args['--subsets-dir']
+    processes = args['--processes']
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    for suite_dir in args['<suite_dir>']:
+        suite_dir = os.path.expanduser(suite_dir)
+        mats = build_index(suite_dir, outofs)
+        if subsets_dir:
+            for outof in sorted(set(outofs)):
+                write_subsets(suite_dir, outof, subsets_dir, int(processes),
+                              mat=mats[outof])
+
+
+def build_index(path, outofs=()):
+    """
+    Build (or refresh) the matrix indices for the suite at path: the one used
+    when scheduling the whole suite, plus one for each value in outofs, the
+    denominators of any --subset values that will be used.
+
+    If path is not a clean git checkout, the matrices are built but not
+    indexed.
+
+    :returns: A dict mapping 0 and each value in outofs to its matrix
+    """
+    index_key = get_index_key(path)
+    if index_key is None:
+        log.warning("%s is not a clean git checkout; not indexing", path)
+    mats = dict()
+    for mincyclicity in [0] + sorted(set(outofs)):
+        mat = load_indexed_matrix(path, index_key, mincyclicity)
+        if index_key is not None:
+            log.info("%s: %d jobs indexed in %s", path, mat.size(),
+                     get_matrix_index_path(index_key, mincyclicity))
+        mats[mincyclicity] = mat
+    return mats
+
+
+def write_subsets(path, outof, output_dir, processes=1, mat=None):
+    """
+    Write the job list for every subset i/outof of the suite at path to
+    <output_dir>/<suite>-<i>-of-<outof>.yaml, for use with
+    'teuthology-suite --subset-file'. Each subset is generated and written by
+    its own worker process, so no process ever holds more than one subset's
+    jobs.
+
+    Each file contains a list of dicts with 'description' and 'fragments'
+    keys. Fragment paths are relative to the suite, so the files may be used
+    with any checkout of it; see load_subset().
+
+    :param mat: The suite's matrix for mincyclicity outof, if the caller
+                already has it
+    :returns:   A list of the paths written
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    suite_name = os.path.basename(os.path.normpath(path))
+    if mat is None:
+        mat = load_matrix(path, mincyclicity=outof)
+    subset_paths = [
+        os.path.join(output_dir, '%s-%d-of-%d.yaml' % (suite_name, index, outof))
+        for index in range(outof)
+    ]
+    args_list = [
+        (path, mat, index, outof, subset_path)
+        for index, subset_path in enumerate(subset_paths)
+    ]
+    counts = _fork_map(write_subset, args_list, processes)
+    for subset_path, count in zip(subset_paths, counts):
+        log.info("Wrote %d jobs to %s", count, subset_path)
+    return subset_paths
+
+
+def write_subset(path, mat, index, outof, subset_path):
+    """
+    Write the job list for subset index/outof of mat to subset_path, one job
+    at a time
+
+    :returns: The number of jobs written
+    """
+    first, matlimit = _subset_range(mat, index, outof)
+    count = 0
+    with open(subset_path, 'w') as subset_file:
+        for description, fragment_paths in Combinations(path, mat, first,
+                                                        matlimit):
+            # a list dumped one item at a time is still one YAML list
+            fragments = [os.path.relpath(fragment_path, path)
+                         for fragment_path in fragment_paths]
+            yaml.safe_dump(
+                [dict(description=description, fragments=fragments)],
+                subset_file, default_flow_style=False)
+            count += 1
+        if not count:
+            subset_file.write('[]\n')
+    return count
+
+
+def load_subset(path, subset_path):
+    """
+    Read a job list written by write_subset() for the suite at path
+
+    :returns: A list of (description, [file list]) tuples, as build_matrix()
+              would return for the same subset
+    """
+    with open(subset_path) as subset_file:
+        jobs = yaml.safe_load(subset_file)
+    return [
+        (job['description'],
+         [os.path.join(path, fragment) for fragment in job['fragments']])
+        for job in jobs
+    ]
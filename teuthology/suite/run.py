@@ -3,12 +3,11 @@ import logging
 import os
 import pwd
 import re
-import time
-import yaml
 
 from datetime import datetime
 from tempfile import NamedTemporaryFile
 
+from .. import schedule
 from ..config import config, JobConfig
 from ..exceptions import (
     BranchNotFoundError, CommitNotFoundError, VersionNotFoundError
@@ -18,6 +17,8 @@ from ..orchestra.opsys import OS
 
 from . import util
 from .build_matrix import combine_path, build_matrix
+from .matrix_index import load_subset
+from .fragment import FragmentCache
 from .placeholder import substitute_placeholders, dict_templ
 
 log = logging.getLogger(__name__)
@@ -29,6 +30,7 @@ class Run(object):
     __slots__ = (
         'args', 'name', 'base_config', 'suite_repo_path', 'base_yaml_paths',
         'base_args', 'package_versions', 'kernel_dict', 'config_input',
+        'fragment_cache',
     )
 
     def __init__(self, args):
@@ -46,6 +48,8 @@ class Run(object):
         self.base_config = self.create_initial_config()
         # caches package versions to minimize requests to gbs
         self.package_versions = dict()
+        # caches parsed yaml fragments, which are shared by many jobs
+        self.fragment_cache = FragmentCache()
 
         if self.args.suite_dir:
             self.suite_repo_path = self.args.suite_dir
@@ -329,12 +333,13 @@ class Run(object):
     def collect_jobs(self, arch, configs, newest=False):
         jobs_to_schedule = []
         jobs_missing_packages = []
+        candidates = []
         for description, fragment_paths in configs:
             base_frag_paths = [
                 util.strip_fragment_path(x) for x in fragment_paths
             ]
             limit = self.args.limit
-            if limit > 0 and len(jobs_to_schedule) >= limit:
+            if limit > 0 and len(candidates) >= limit:
                 log.info(
                     'Stopped after {limit} jobs due to --limit={limit}'.format(
                         limit=limit))
@@ -364,9 +369,7 @@ class Run(object):
                 if all_filt_val:
                     continue
 
-            raw_yaml = '\n'.join([file(a, 'r').read() for a in fragment_paths])
-
-            parsed_yaml = yaml.load(raw_yaml)
+            parsed_yaml = self.fragment_cache.load(fragment_paths)
             os_type = parsed_yaml.get('os_type') or self.base_config.os_type
             os_version = parsed_yaml.get('os_version') or self.base_config.os_version
             exclude_arch = parsed_yaml.get('exclude_arch')
@@ -396,11 +399,26 @@ class Run(object):
                 args=arg
             )
 
-            sha1 = self.base_config.sha1
+            flavor = None
             if config.suite_verify_ceph_hash:
                 full_job_config = copy.deepcopy(self.base_config.to_dict())
                 deep_merge(full_job_config, parsed_yaml)
                 flavor = util.get_install_task_flavor(full_job_config)
+            candidates.append((job, os_type, os_version, flavor))
+
+        sha1 = self.base_config.sha1
+        if config.suite_verify_ceph_hash and not newest:
+            # Look up every distinct os_type/os_version/flavor concurrently
+            # instead of making one blocking request per new combination
+            # in the loop below. In newest mode the first job missing
+            # packages ends the search, so they are looked up one at a time.
+            self.package_versions = util.prefetch_package_versions(
+                [(sha1, ) + candidate[1:] for candidate in candidates],
+                self.package_versions,
+            )
+
+        for job, os_type, os_version, flavor in candidates:
+            if config.suite_verify_ceph_hash:
                 # Get package versions for this sha1, os_type and flavor. If
                 # we've already retrieved them in a previous loop, they'll be
                 # present in package_versions and gitbuilder will not be asked
@@ -431,6 +449,7 @@ class Run(object):
         return jobs_missing_packages, jobs_to_schedule
 
     def schedule_jobs(self, jobs_missing_packages, jobs_to_schedule, name):
+        job_configs = []
         for job in jobs_to_schedule:
             log.info(
                 'Scheduling %s', job['desc']
@@ -448,16 +467,49 @@ class Run(object):
                         "hash {sha1}.".format(sha1=self.base_config.sha1),
                         name,
                     )
-            util.teuthology_schedule(
-                args=job['args'],
-                dry_run=self.args.dry_run,
-                verbose=self.args.verbose,
-                log_prefix=log_prefix,
+            if self.args.dry_run:
+                util.teuthology_schedule(
+                    args=job['args'],
+                    dry_run=self.args.dry_run,
+                    verbose=self.args.verbose,
+                    log_prefix=log_prefix,
+                )
+            else:
+                job_configs.append(self.build_job_config(job))
+
+        if job_configs:
+            # Schedule everything from this process, sharing one beanstalk
+            # connection and results server session, rather than running
+            # teuthology-schedule once per job
+            schedule.schedule_jobs(
+                job_configs,
+                num=self.args.num,
+                throttle=self.args.throttle,
             )
-            throttle = self.args.throttle
-            if not self.args.dry_run and throttle:
-                log.info("pause between jobs : --throttle " + str(throttle))
-                time.sleep(int(throttle))
+
+    def build_job_config(self, job):
+        """
+        Build the job config that teuthology-schedule would build when given
+        job['args'].
+        """
+        job_args = job['args']
+        conf_files = job_args[job_args.index('--') + 1:]
+        priority = self.args.priority
+        if priority is None:
+            priority = 1000
+        schedule_args = {
+            '--name': self.name,
+            '--description': job['desc'],
+            '--owner': self.args.owner,
+            '--worker': util.get_worker(self.args.machine_type),
+            '--priority': priority,
+            '--verbose': bool(self.args.verbose),
+            '--last-in-suite': False,
+            '--email': None,
+            '--timeout': None,
+            '<conf_file>': conf_files,
+        }
+        return schedule.build_config(schedule_args)
 
     def schedule_suite(self):
         """
@@ -473,10 +525,14 @@ class Run(object):
             self.base_config.suite.replace(':', '/'),
         ))
         log.debug('Suite %s in %s' % (suite_name, suite_path))
-        configs = [
-            (combine_path(suite_name, item[0]), item[1]) for item in
-            build_matrix(suite_path, subset=self.args.subset)
-        ]
+        if self.args.subset_file:
+            # written by teuthology-matrix-index --subsets-dir
+            configs = load_subset(suite_path, self.args.subset_file)
+        else:
+            # configs are generated lazily, so that --limit and the filters
+            # can stop before the whole matrix has been expanded
+            configs = build_matrix(suite_path, subset=self.args.subset,
+                                   lazy=True, use_index=True)
         log.info('Suite %s in %s generated %d jobs (not yet filtered)' % (
             suite_name, suite_path, len(configs)))
 
@@ -496,8 +552,12 @@ class Run(object):
         backtrack = 0
         limit = self.args.newest
         while backtrack <= limit:
+            suite_configs = (
+                (combine_path(suite_name, desc), fragment_paths)
+                for (desc, fragment_paths) in configs
+            )
             jobs_missing_packages, jobs_to_schedule = \
-                self.collect_jobs(arch, configs, self.args.newest)
+                self.collect_jobs(arch, suite_configs, self.args.newest)
             if jobs_missing_packages and self.args.newest:
                 new_sha1 = \
                     util.find_git_parent('ceph', self.base_config.sha1)
@@ -1,8 +1,12 @@
+import os
 import random
+import subprocess
+import yaml
 
 from mock import patch, MagicMock
 
-from teuthology.suite import build_matrix
+from teuthology.config import config
+from teuthology.suite import build_matrix, matrix_index
 from teuthology.test.fake_fs import make_fake_fstools
 
 
@@ -16,6 +20,125 @@ class TestBuildMatrixSimple(object):
         assert result == "/path/to/left"
 
 
+class TestMatrixIndex(object):
+    def setup(self):
+        self.orig_src_base_path = config.src_base_path
+
+    def teardown(self):
+        config.src_base_path = self.orig_src_base_path
+
+    def make_suite(self, tmpdir):
+        config.src_base_path = str(tmpdir.join('src'))
+        suite = tmpdir.join('suite')
+        suite.join('%').write('', ensure=True)
+        for facet in ('a', 'b'):
+            for i in range(3):
+                suite.join(facet, '%s%d.yaml' % (facet, i)).write(
+                    '', ensure=True)
+        git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@test']
+        subprocess.check_call(git + ['init', '-q'], cwd=str(suite))
+        subprocess.check_call(git + ['add', '.'], cwd=str(suite))
+        subprocess.check_call(git + ['commit', '-q', '-m', 'suite'],
+                              cwd=str(suite))
+        return str(suite)
+
+    def test_index_written_and_used(self, tmpdir):
+        path = self.make_suite(tmpdir)
+        expected = build_matrix.build_matrix(path, subset=(1, 4))
+        index_key = build_matrix.get_index_key(path)
+        index_path = build_matrix.get_matrix_index_path(index_key, 4)
+        assert not os.path.exists(index_path)
+        result = build_matrix.build_matrix(path, subset=(1, 4),
+                                           use_index=True)
+        assert result == expected
+        assert os.path.exists(index_path)
+        with patch.object(build_matrix, '_build_matrix') as m_build_matrix:
+            result = build_matrix.build_matrix(path, subset=(1, 4),
+                                               use_index=True)
+            m_build_matrix.assert_not_called()
+        assert result == expected
+
+    def test_index_key(self, tmpdir):
+        path = self.make_suite(tmpdir)
+        git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@test']
+        first = build_matrix.get_index_key(path)
+        assert first is not None
+        open(os.path.join(path, 'a', 'a3.yaml'), 'w').close()
+        assert build_matrix.get_index_key(path) is None
+        subprocess.check_call(git + ['add', '.'], cwd=path)
+        subprocess.check_call(git + ['commit', '-q', '-m', 'a3'], cwd=path)
+        second = build_matrix.get_index_key(path)
+        assert second not in (None, first)
+        # other suites in the same repo get their own indices
+        assert build_matrix.get_index_key(os.path.join(path, 'a')) \
+            not in (None, second)
+        with patch.object(build_matrix, 'MATRIX_INDEX_VERSION', 0):
+            assert build_matrix.get_index_key(path) != second
+
+    @patch.object(build_matrix, '_git_output')
+    def test_index_key_cost(self, m_git_output, tmpdir):
+        path = self.make_suite(tmpdir)
+        m_git_output.side_effect = ['0' * 40, '']
+        assert build_matrix.get_index_key(path) is not None
+        assert m_git_output.call_count == 2
+
+    def test_build_index(self, tmpdir):
+        path = self.make_suite(tmpdir)
+        mats = matrix_index.build_index(path, [4, 2, 4])
+        assert sorted(mats.keys()) == [0, 2, 4]
+        index_key = build_matrix.get_index_key(path)
+        for mincyclicity, mat in mats.items():
+            assert os.path.exists(
+                build_matrix.get_matrix_index_path(index_key, mincyclicity))
+            assert mat.size() >= 9
+
+    def test_write_subsets(self, tmpdir):
+        path = self.make_suite(tmpdir)
+        written = matrix_index.write_subsets(
+            path, 2, str(tmpdir.join('subsets')), processes=2)
+        assert [os.path.basename(p) for p in written] == \
+            ['suite-0-of-2.yaml', 'suite-1-of-2.yaml']
+        for i, subset_path in enumerate(written):
+            with open(subset_path) as subset_file:
+                jobs = yaml.safe_load(subset_file)
+            # fragments are stored relative to the suite...
+            assert not any(os.path.isabs(fragment)
+                           for job in jobs for fragment in job['fragments'])
+            # ...and resolved against wherever it is checked out
+            assert matrix_index.load_subset(path, subset_path) == \
+                build_matrix.build_matrix(path, subset=(i, 2))
+
+    def test_main_loads_matrix_once(self, tmpdir):
+        path = self.make_suite(tmpdir)
+        args = {
+            '--verbose': False,
+            '--outof': ['2', '3'],
+            '--subsets-dir': str(tmpdir.join('subsets')),
+            '--processes': '1',
+            '<suite_dir>': [path],
+        }
+        with patch.object(build_matrix, '_git_output',
+                          wraps=build_matrix._git_output) as m_git_output:
+            with patch.object(build_matrix, '_build_matrix',
+                              wraps=build_matrix._build_matrix) as m_build:
+                matrix_index.main(args)
+        # one get_index_key() (two git commands) for the suite, and one
+        # matrix per mincyclicity
+        assert m_git_output.call_count == 2
+        top_level = [c for c in m_build.call_args_list if c[0][0] == path]
+        assert sorted(c[0][1] for c in top_level) == [0, 2, 3]
+        assert len(os.listdir(str(tmpdir.join('subsets')))) == 5
+
+    def test_dirty_tree_not_indexed(self, tmpdir):
+        path = self.make_suite(tmpdir)
+        assert build_matrix.get_index_key(path) is not None
+        open(os.path.join(path, 'a', 'a3.yaml'), 'w').close()
+        assert build_matrix.get_index_key(path) is None
+        result = build_matrix.build_matrix(path, use_index=True)
+        assert len(result) == 12
+        assert not os.path.exists(config.src_base_path)
+
+
 class TestBuildMatrix(object):
 
     patchpoints = [
@@ -98,6 +221,29 @@ class TestBuildMatrix(object):
         assert len(result) == 4
         assert self.fragment_occurences(result, 'd1_1_1.yaml') == 0.5
 
+    def test_lazy_2x2(self):
+        fake_fs = {
+            'd0_0': {
+                '%': None,
+                'd1_0': {
+                    'd1_0_0.yaml': None,
+                    'd1_0_1.yaml': None,
+                },
+                'd1_1': {
+                    'd1_1_0.yaml': None,
+                    'd1_1_1.yaml': None,
+                },
+            },
+        }
+        self.start_patchers(fake_fs)
+        expected = build_matrix.build_matrix('d0_0')
+        result = build_matrix.build_matrix('d0_0', lazy=True)
+        assert len(result) == 4
+        # Combinations may be iterated more than once
+        assert list(result) == expected
+        assert list(result) == expected
+        assert next(iter(result)) == expected[0]
+
     def test_convolve_2x2x2(self):
         fake_fs = {
             'd0_0': {
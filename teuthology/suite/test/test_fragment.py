@@ -0,0 +1,49 @@
+import os
+import yaml
+
+from teuthology.suite.fragment import FragmentCache
+
+
+class TestFragmentCache(object):
+    def setup(self):
+        self.cache = FragmentCache()
+
+    def write_fragments(self, tmpdir, texts):
+        paths = []
+        for i, text in enumerate(texts):
+            path = tmpdir.join('frag%d.yaml' % i)
+            path.write(text)
+            paths.append(str(path))
+        return paths
+
+    def test_matches_concatenation(self, tmpdir):
+        texts = [
+            'tasks:\n- install:\n',
+            '# a comment only\n',
+            'overrides:\n  ceph:\n    fs: xfs\n',
+            'tasks:\n- ceph:\n- rados:\n',
+        ]
+        paths = self.write_fragments(tmpdir, texts)
+        assert self.cache.load(paths) == yaml.load('\n'.join(texts))
+
+    def test_parsed_once(self, tmpdir):
+        paths = self.write_fragments(tmpdir, ['a: 1\n'])
+        fragment = self.cache.get(paths[0])
+        assert self.cache.get(paths[0]) is fragment
+
+    def test_result_is_a_copy(self, tmpdir):
+        paths = self.write_fragments(tmpdir, ['a:\n  b: 1\n'])
+        self.cache.load(paths)['a']['b'] = 2
+        assert self.cache.load(paths) == dict(a=dict(b=1))
+
+    def test_invalidated_by_mtime(self, tmpdir):
+        paths = self.write_fragments(tmpdir, ['a: 1\n'])
+        assert self.cache.load(paths) == dict(a=1)
+        tmpdir.join('frag0.yaml').write('a: 2\n')
+        os.utime(paths[0], (0, 0))
+        assert self.cache.load(paths) == dict(a=2)
+
+    def test_cross_fragment_alias(self, tmpdir):
+        texts = ['a: &anchor 1\n', 'b: *anchor\n']
+        paths = self.write_fragments(tmpdir, texts)
+        assert self.cache.load(paths) == dict(a=1, b=1)
@@ -2,13 +2,15 @@ import os
 
 from copy import deepcopy
 
-from mock import patch, Mock, DEFAULT
+from mock import patch, Mock, ANY, DEFAULT
 
 from teuthology import suite
 from scripts.suite import main
 from teuthology.config import config
 
 import pytest
+import shutil
+import tempfile
 import time
 
 
@@ -104,6 +106,15 @@ def test_wait_fails(m_get_jobs):
 
 
 class TestSuiteMain(object):
+    def setup(self):
+        # keep matrix indices out of the real src_base_path
+        self.orig_src_base_path = config.src_base_path
+        config.src_base_path = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(config.src_base_path)
+        config.src_base_path = self.orig_src_base_path
+
     def test_main(self):
         suite_name = 'SUITE'
         throttle = '3'
@@ -151,7 +162,9 @@ class TestSuiteMain(object):
             get_gitbuilder_hash=DEFAULT,
             git_ls_remote=lambda *args: '1234',
             package_version_for_hash=DEFAULT,
-        ) as m:
+        ) as m, patch(
+            'teuthology.suite.run.schedule.schedule_jobs',
+        ) as m_schedule_jobs:
             m['package_version_for_hash'].return_value = 'fake-9.5'
             config.suite_verify_ceph_hash = False
             main([
@@ -162,7 +175,8 @@ class TestSuiteMain(object):
                 '--throttle', throttle,
                 '--machine-type', machine_type
             ])
-            m_sleep.assert_called_with(int(throttle))
+            m_schedule_jobs.assert_called_once_with(
+                ANY, num=1, throttle=throttle)
             m['get_gitbuilder_hash'].assert_not_called()
 
     def test_schedule_suite(self):
@@ -179,7 +193,9 @@ class TestSuiteMain(object):
             get_gitbuilder_hash=DEFAULT,
             git_ls_remote=lambda *args: '12345',
             package_version_for_hash=DEFAULT,
-        ) as m:
+        ) as m, patch(
+            'teuthology.suite.run.schedule.schedule_jobs',
+        ) as m_schedule_jobs:
             m['package_version_for_hash'].return_value = 'fake-9.5'
             config.suite_verify_ceph_hash = True
             main([
@@ -190,4 +206,5 @@ class TestSuiteMain(object):
                 '--throttle', throttle,
                 '--machine-type', machine_type
             ])
-            m_sleep.assert_called_with(int(throttle))
+            m_schedule_jobs.assert_called_once_with(
+                ANY, num=1, throttle=throttle)
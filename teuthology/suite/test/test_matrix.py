@@ -72,3 +72,17 @@ class TestMatrix(object):
                             mbs(5, range(4))])
                     ]
                 ))
+
+    def test_sum_index_order(self):
+        # The ith index of a Sum must follow the order obtained by merging
+        # the pseudo indices of its submats
+        submats = [mbs(1, range(6)), mbs(2, range(4)), mbs(3, range(9))]
+        res = matrix.Sum(1, submats)
+        expected = sorted(
+            (offset + k * (res._pseudo_size / s.size()), s.index(k))
+            for (offset, s) in enumerate(submats)
+            for k in range(s.size())
+        )
+        for i, (_, item) in enumerate(expected):
+            assert res.index(i) == (1, item)
+            assert res.index(i + res.size()) == (1, item)
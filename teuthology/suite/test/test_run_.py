@@ -200,6 +200,7 @@ class TestScheduleSuite(object):
     @patch('teuthology.suite.util.get_package_versions')
     @patch('teuthology.suite.util.get_install_task_flavor')
     @patch('__builtin__.file')
+    @patch('teuthology.suite.fragment.os.path.getmtime')
     @patch('teuthology.suite.run.build_matrix')
     @patch('teuthology.suite.util.git_ls_remote')
     @patch('teuthology.suite.util.package_version_for_hash')
@@ -210,6 +211,7 @@ class TestScheduleSuite(object):
         m_package_version_for_hash,
         m_git_ls_remote,
         m_build_matrix,
+        m_getmtime,
         m_file,
         m_get_install_task_flavor,
         m_get_package_versions,
@@ -231,6 +233,7 @@ class TestScheduleSuite(object):
             StringIO(frag1_read_output),
             StringIO(frag2_read_output),
         ]
+        m_getmtime.return_value = 0
         m_get_install_task_flavor.return_value = 'basic'
         m_get_package_versions.return_value = dict()
         m_has_packages_for_distro.return_value = True
@@ -264,12 +267,60 @@ class TestScheduleSuite(object):
             [call([], [expected_job], runobj.name)],
         )
 
+    @patch('teuthology.suite.run.Run.schedule_jobs')
+    @patch('teuthology.suite.util.has_packages_for_distro')
+    @patch('teuthology.suite.util.get_package_versions')
+    @patch('teuthology.suite.util.get_install_task_flavor')
+    @patch('__builtin__.file')
+    @patch('teuthology.suite.fragment.os.path.getmtime')
+    @patch('teuthology.suite.run.load_subset')
+    @patch('teuthology.suite.run.build_matrix')
+    @patch('teuthology.suite.util.git_ls_remote')
+    @patch('teuthology.suite.util.package_version_for_hash')
+    @patch('teuthology.suite.util.git_validate_sha1')
+    def test_schedule_subset_file(
+        self,
+        m_git_validate_sha1,
+        m_package_version_for_hash,
+        m_git_ls_remote,
+        m_build_matrix,
+        m_load_subset,
+        m_getmtime,
+        m_file,
+        m_get_install_task_flavor,
+        m_get_package_versions,
+        m_has_packages_for_distro,
+        m_schedule_jobs,
+    ):
+        m_git_validate_sha1.return_value = self.args.ceph_sha1
+        m_package_version_for_hash.return_value = 'ceph_version'
+        m_git_ls_remote.return_value = 'suite_hash'
+        m_load_subset.return_value = [('desc', ['frag.yml'])]
+        m_file.side_effect = [StringIO('field1: val1')]
+        m_getmtime.return_value = 0
+        m_get_install_task_flavor.return_value = 'basic'
+        m_get_package_versions.return_value = dict()
+        m_has_packages_for_distro.return_value = True
+
+        self.args.newest = 0
+        self.args.subset_file = '/subsets/suite-1-of-2.yaml'
+        runobj = self.klass(self.args)
+        runobj.base_args = list()
+        count = runobj.schedule_suite()
+        assert count == 1
+        m_build_matrix.assert_not_called()
+        m_load_subset.assert_called_once_with(
+            ANY, '/subsets/suite-1-of-2.yaml')
+        assert m_schedule_jobs.call_args[0][1][0]['desc'] == \
+            os.path.join(self.args.suite, 'desc')
+
     @patch('teuthology.suite.util.find_git_parent')
     @patch('teuthology.suite.run.Run.schedule_jobs')
     @patch('teuthology.suite.util.has_packages_for_distro')
     @patch('teuthology.suite.util.get_package_versions')
     @patch('teuthology.suite.util.get_install_task_flavor')
     @patch('__builtin__.file')
+    @patch('teuthology.suite.fragment.os.path.getmtime')
     @patch('teuthology.suite.run.build_matrix')
     @patch('teuthology.suite.util.git_ls_remote')
     @patch('teuthology.suite.util.package_version_for_hash')
@@ -280,6 +331,7 @@ class TestScheduleSuite(object):
         m_package_version_for_hash,
         m_git_ls_remote,
         m_build_matrix,
+        m_getmtime,
         m_file,
         m_get_install_task_flavor,
         m_get_package_versions,
@@ -296,7 +348,9 @@ class TestScheduleSuite(object):
             (build_matrix_desc, build_matrix_frags),
         ]
         m_build_matrix.return_value = build_matrix_output
-        m_file.side_effect = [StringIO('field: val\n') for i in xrange(11)]
+        # fragments are cached, so are only read once
+        m_file.side_effect = [StringIO('field: val\n')]
+        m_getmtime.return_value = 0
         m_get_install_task_flavor.return_value = 'basic'
         m_get_package_versions.return_value = dict()
         m_has_packages_for_distro.side_effect = [
@@ -315,12 +369,14 @@ class TestScheduleSuite(object):
             [call('ceph', 'ceph_sha1' + i * '^') for i in xrange(10)]
         )
 
+    @patch('teuthology.suite.util.prefetch_package_versions')
     @patch('teuthology.suite.util.find_git_parent')
     @patch('teuthology.suite.run.Run.schedule_jobs')
     @patch('teuthology.suite.util.has_packages_for_distro')
     @patch('teuthology.suite.util.get_package_versions')
     @patch('teuthology.suite.util.get_install_task_flavor')
     @patch('__builtin__.file')
+    @patch('teuthology.suite.fragment.os.path.getmtime')
     @patch('teuthology.suite.run.build_matrix')
     @patch('teuthology.suite.util.git_ls_remote')
     @patch('teuthology.suite.util.package_version_for_hash')
@@ -331,12 +387,14 @@ class TestScheduleSuite(object):
         m_package_version_for_hash,
         m_git_ls_remote,
         m_build_matrix,
+        m_getmtime,
         m_file,
         m_get_install_task_flavor,
         m_get_package_versions,
         m_has_packages_for_distro,
         m_schedule_jobs,
         m_find_git_parent,
+        m_prefetch_package_versions,
     ):
         # rig has_packages_for_distro to fail this many times, so
         # everything will run NUM_FAILS+1 times
@@ -350,11 +408,12 @@ class TestScheduleSuite(object):
             (build_matrix_desc, build_matrix_frags),
         ]
         m_build_matrix.return_value = build_matrix_output
-        m_file.side_effect = [
-            StringIO('field: val\n') for i in xrange(NUM_FAILS+1)
-        ]
+        m_file.side_effect = [StringIO('field: val\n')]
+        m_getmtime.return_value = 0
         m_get_install_task_flavor.return_value = 'basic'
         m_get_package_versions.return_value = dict()
+        m_prefetch_package_versions.side_effect = \
+            lambda probes, package_versions: package_versions
         # NUM_FAILS, then success
         m_has_packages_for_distro.side_effect = \
             [False for i in xrange(NUM_FAILS)] + [True]
@@ -373,3 +432,6 @@ class TestScheduleSuite(object):
         m_find_git_parent.assert_has_calls(
             [call('ceph', 'ceph_sha1' + i * '^') for i in xrange(NUM_FAILS)]
         )
+        # newest mode stops at the first job missing packages, so nothing is
+        # looked up ahead of time
+        m_prefetch_package_versions.assert_not_called()
@@ -296,6 +296,45 @@ class TestMissingPackages(object):
             "basic",)
         assert not result
 
+    @patch("teuthology.suite.util.package_version_for_hash")
+    def test_prefetch_package_versions(self, m_package_version_for_hash):
+        m_package_version_for_hash.return_value = "1.1"
+        probes = [
+            ("sha1", "ubuntu", "14.04", "basic"),
+            ("sha1", "rhel", "7.0", "basic"),
+            ("sha1", "rhel", "7.0", "basic"),
+            ("sha1", "rhel", "7.0", "notcmalloc"),
+        ]
+        result = util.prefetch_package_versions(
+            probes, package_versions=self.pv)
+        assert m_package_version_for_hash.call_count == 2
+        assert result['sha1']['ubuntu'] == {'14.04': {'basic': '1.0'}}
+        assert result['sha1']['rhel'] == {
+            '7.0': {'basic': '1.1', 'notcmalloc': '1.1'},
+        }
+
+    @patch("teuthology.suite.util.package_version_for_hash")
+    def test_prefetch_package_versions_not_found(
+            self, m_package_version_for_hash):
+        m_package_version_for_hash.side_effect = \
+            util.VersionNotFoundError("http://example.com")
+        result = util.prefetch_package_versions(
+            [("sha1", "rhel", "7.0", "basic")], package_versions=self.pv)
+        assert not util.has_packages_for_distro(
+            "sha1", "rhel", "7.0", "basic", package_versions=result)
+        # the miss is remembered
+        util.get_package_versions(
+            "sha1", "rhel", "7.0", "basic", package_versions=result)
+        assert m_package_version_for_hash.call_count == 1
+
+    @patch("teuthology.suite.util.package_version_for_hash")
+    def test_prefetch_package_versions_error(
+            self, m_package_version_for_hash):
+        m_package_version_for_hash.side_effect = RuntimeError()
+        result = util.prefetch_package_versions(
+            [("sha1", "rhel", "7.0", "basic")], package_versions=self.pv)
+        assert 'rhel' not in result['sha1']
+
 
 class TestDistroDefaults(object):
     def setup(self):
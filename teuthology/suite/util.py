@@ -1,4 +1,5 @@
 import copy
+import gevent.pool
 import logging
 import os
 import requests
@@ -13,7 +14,9 @@ from .. import lock
 from .. import repo_utils
 
 from ..config import config
-from ..exceptions import BranchNotFoundError, ScheduleFailError
+from ..exceptions import (
+    BranchNotFoundError, ScheduleFailError, VersionNotFoundError
+)
 from ..misc import deep_merge
 from ..repo_utils import fetch_qa_suite, fetch_teuthology
 from ..orchestra.opsys import OS
@@ -367,24 +370,96 @@ def get_package_versions(sha1, os_type, os_version, flavor,
 
     os_type = str(os_type)
 
-    os_types = package_versions.get(sha1, dict())
-    os_versions = os_types.get(os_type, dict())
-    flavors = os_versions.get(os_version, dict())
-    if flavor not in flavors:
+    if not _has_package_version(
+            package_versions, sha1, os_type, os_version, flavor):
         package_version = package_version_for_hash(
             sha1,
             flavor,
             distro=os_type,
             distro_version=os_version,
         )
-        flavors[flavor] = package_version
-        os_versions[os_version] = flavors
-        os_types[os_type] = os_versions
-        package_versions[sha1] = os_types
+        _set_package_version(
+            package_versions, sha1, os_type, os_version, flavor,
+            package_version)
 
     return package_versions
 
 
+def prefetch_package_versions(probes, package_versions=None,
+                              concurrency=None):
+    """
+    Concurrently retrieve the package versions for many (sha1, os_type,
+    os_version, flavor) tuples, so that later calls to
+    get_package_versions() and has_packages_for_distro() are answered from
+    package_versions instead of each making a blocking request.
+
+    Tuples which are already present in package_versions are skipped, as are
+    duplicates. A tuple for which no packages exist is recorded with a
+    version of None. Any other error is logged and the tuple left unresolved,
+    so that get_package_versions() will retry it and raise as usual.
+
+    :param probes:           An iterable of (sha1, os_type, os_version,
+                             flavor) tuples
+    :param package_versions: See get_package_versions()
+    :param concurrency:      The maximum number of requests in flight.
+                             Defaults to config.suite_package_probe_concurrency
+    :returns:                The updated package_versions dict
+    """
+    if package_versions is None:
+        package_versions = dict()
+    if concurrency is None:
+        concurrency = config.suite_package_probe_concurrency
+
+    todo = set()
+    for (sha1, os_type, os_version, flavor) in probes:
+        os_type = str(os_type)
+        if not _has_package_version(
+                package_versions, sha1, os_type, os_version, flavor):
+            todo.add((sha1, os_type, os_version, flavor))
+    if not todo:
+        return package_versions
+    log.info("Looking up packages for %d sha1/distro/flavor combinations",
+             len(todo))
+
+    def probe(sha1, os_type, os_version, flavor):
+        try:
+            version = package_version_for_hash(
+                sha1,
+                flavor,
+                distro=os_type,
+                distro_version=os_version,
+            )
+        except VersionNotFoundError:
+            version = None
+        except Exception:
+            log.exception(
+                "Failed to look up packages for %s %s %s %s",
+                sha1, os_type, os_version, flavor)
+            return
+        _set_package_version(
+            package_versions, sha1, os_type, os_version, flavor, version)
+
+    pool = gevent.pool.Pool(max(1, concurrency))
+    for args in sorted(todo):
+        pool.spawn(probe, *args)
+    pool.join()
+    return package_versions
+
+
+def _has_package_version(package_versions, sha1, os_type, os_version,
+                         flavor):
+    return flavor in package_versions.get(sha1, dict()).get(
+        os_type, dict()).get(os_version, dict())
+
+
+def _set_package_version(package_versions, sha1, os_type, os_version, flavor,
+                         version):
+    os_types = package_versions.setdefault(sha1, dict())
+    os_versions = os_types.setdefault(os_type, dict())
+    flavors = os_versions.setdefault(os_version, dict())
+    flavors[flavor] = version
+
+
 def has_packages_for_distro(sha1, os_type, os_version, flavor,
                             package_versions=None):
     """
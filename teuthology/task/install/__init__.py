@@ -59,6 +59,27 @@ def verify_package_version(ctx, config, remote):
         )
 
 
+# Also used by teuthology-nuke
+PURGE_DATA_ARGS = [
+    'sudo',
+    'rm', '-rf', '--one-file-system', '--', '/var/lib/ceph',
+    run.Raw('||'),
+    'true',
+    run.Raw(';'),
+    'test', '-d', '/var/lib/ceph',
+    run.Raw('&&'),
+    'sudo',
+    'find', '/var/lib/ceph',
+    '-mindepth', '1',
+    '-maxdepth', '2',
+    '-type', 'd',
+    '-exec', 'umount', '{}', ';',
+    run.Raw(';'),
+    'sudo',
+    'rm', '-rf', '--one-file-system', '--', '/var/lib/ceph',
+]
+
+
 def purge_data(ctx):
     """
     Purge /var/lib/ceph on every remote in ctx.
@@ -77,24 +98,8 @@ def _purge_data(remote):
     :param remote: the teuthology.orchestra.remote.Remote object
     """
     log.info('Purging /var/lib/ceph on %s', remote)
-    remote.run(args=[
-        'sudo',
-        'rm', '-rf', '--one-file-system', '--', '/var/lib/ceph',
-        run.Raw('||'),
-        'true',
-        run.Raw(';'),
-        'test', '-d', '/var/lib/ceph',
-        run.Raw('&&'),
-        'sudo',
-        'find', '/var/lib/ceph',
-        '-mindepth', '1',
-        '-maxdepth', '2',
-        '-type', 'd',
-        '-exec', 'umount', '{}', ';',
-        run.Raw(';'),
-        'sudo',
-        'rm', '-rf', '--one-file-system', '--', '/var/lib/ceph',
-    ])
+    remote.run(args=PURGE_DATA_ARGS)
+
 
 def install_packages(ctx, pkgs, config):
     """
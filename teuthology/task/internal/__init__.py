@@ -19,6 +19,7 @@ from teuthology.config import config as teuth_config
 from teuthology.exceptions import VersionNotFoundError
 from teuthology.job_status import get_status, set_status
 from teuthology.orchestra import cluster, remote, run
+from teuthology.orchestra.log_shipper import LogShipper
 
 log = logging.getLogger(__name__)
 
@@ -343,6 +344,23 @@ def archive(ctx, config):
         )
     )
 
+    # Unless archives are only kept for failed jobs, copy the archive
+    # directories' contents as they grow, so that only what's left needs
+    # copying at the end, and logs survive nodes dying
+    shippers = dict()
+    logdir = None
+    if ctx.archive is not None:
+        logdir = os.path.join(ctx.archive, 'remote')
+        if teuth_config.log_ship_interval and \
+                not ctx.config.get('archive-on-error'):
+            if not os.path.exists(logdir):
+                os.mkdir(logdir)
+            for rem in ctx.cluster.remotes.iterkeys():
+                shipper = LogShipper(rem, archive_dir,
+                                     os.path.join(logdir, rem.shortname))
+                shipper.start(teuth_config.log_ship_interval)
+                shippers[rem] = shipper
+
     try:
         yield
     except Exception:
@@ -350,18 +368,31 @@ def archive(ctx, config):
         set_status(ctx.summary, 'fail')
         raise
     finally:
+        for shipper in shippers.values():
+            shipper.stop()
         passed = get_status(ctx.summary) == 'pass'
         if ctx.archive is not None and \
                 not (ctx.config.get('archive-on-error') and passed):
             log.info('Transferring archived files...')
-            logdir = os.path.join(ctx.archive, 'remote')
             if (not os.path.exists(logdir)):
                 os.mkdir(logdir)
-            for rem in ctx.cluster.remotes.iterkeys():
+
+            def transfer(rem):
                 path = os.path.join(logdir, rem.shortname)
-                misc.pull_directory(rem, archive_dir, path)
+                if rem in shippers:
+                    stats = shippers[rem].sync(prune=True)
+                else:
+                    stats = misc.pull_directory(rem, archive_dir, path)
                 # Check for coredumps and pull binaries
                 fetch_binaries_for_coredumps(path, rem)
+                return rem.shortname, stats
+
+            ctx.summary['archive_transfer'] = dict(
+                ctx.cluster.for_each_remote(
+                    transfer,
+                    concurrency=teuth_config.archive_concurrency,
+                )
+            )
 
         log.info('Removing archive directory...')
         run.wait(
@@ -1,6 +1,6 @@
 import logging
 
-from teuthology import lockstatus
+from teuthology.lock_client import client
 
 from teuthology.config import config as teuth_config
 
@@ -15,8 +15,8 @@ def check_lock(ctx, config, check_up=True):
         log.info('Lock checking disabled.')
         return
     log.info('Checking locks...')
-    for machine in ctx.config['targets'].iterkeys():
-        status = lockstatus.get_status(machine)
+    statuses = client.get_statuses(ctx.config['targets'].keys(), cached=False)
+    for machine, status in statuses.items():
         log.debug('machine status is %s', repr(status))
         assert status is not None, \
             'could not read lock status for {name}'.format(name=machine)
@@ -4,13 +4,13 @@ import time
 import yaml
 
 from teuthology import lock
-from teuthology import lockstatus
 from teuthology import misc
 from teuthology import provision
 from teuthology import report
 
 from teuthology.config import config as teuth_config
 from teuthology.job_status import get_status, set_status
+from teuthology.lock_client import client
 
 log = logging.getLogger(__name__)
 
@@ -115,9 +115,9 @@ def lock_machines(ctx, config):
                                 provision.create_if_vm(ctx, full_name)
                 if lock.do_update_keys(keys_dict):
                     log.info("Error in virtual machine keys")
+                statuses = client.get_statuses(all_locked.keys())
                 newscandict = {}
-                for dkey in all_locked.iterkeys():
-                    stats = lockstatus.get_status(dkey)
+                for dkey, stats in statuses.items():
                     newscandict[dkey] = stats['ssh_pub_key']
                 ctx.config['targets'] = newscandict
             else:
@@ -154,5 +154,5 @@ def lock_machines(ctx, config):
         )
         if get_status(ctx.summary) == 'pass' or unlock_on_failure:
             log.info('Unlocking machines...')
-            for machine in ctx.config['targets'].iterkeys():
-                lock.unlock_one(ctx, machine, ctx.owner, ctx.archive)
+            lock.unlock_nodes(ctx, ctx.config['targets'].keys(), ctx.owner,
+                              ctx.archive)
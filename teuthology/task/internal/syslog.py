@@ -45,9 +45,13 @@ def syslog(ctx, config):
     try:
         for rem in ctx.cluster.remotes.iterkeys():
             log_context = 'system_u:object_r:var_log_t:s0'
+            commands = []
             for log_path in (kern_log, misc_log):
-                rem.run(args='touch %s' % log_path)
-                rem.chcon(log_path, log_context)
+                commands.append('touch %s' % log_path)
+                chcon = rem.chcon_command(log_path, log_context)
+                if chcon is not None:
+                    commands.append(chcon)
+            rem.run_batch(commands)
             misc.sudo_write_file(
                 remote=rem,
                 path=CONF,
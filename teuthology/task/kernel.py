@@ -11,7 +11,7 @@ import urlparse
 
 from teuthology import misc as teuthology
 from teuthology.config import config as teuth_config
-from ..orchestra import run
+from ..orchestra import reboot, run
 from ..exceptions import (
     UnsupportedPackageTypeError,
     ConfigError,
@@ -641,19 +641,32 @@ def enable_disable_kdb(ctx, config):
             except run.CommandFailedError:
                 log.warn('Kernel does not support kdb')
 
-def wait_for_reboot(ctx, need_install, timeout, distro=False):
+def wait_for_reboot(ctx, need_install, timeout, distro=False, boot_ids=None):
     """
-    Loop reconnecting and checking kernel versions until
-    they're all correct or the timeout is exceeded.
+    Wait for the nodes to come back, then check kernel versions, reconnecting
+    and checking again until they're all correct or the timeout is exceeded.
+    Only the first pass waits for the nodes to reboot; later ones just
+    reconnect.
 
     :param ctx: Context
     :param need_install: list of packages that we need to reinstall.
     :param timeout: number of second before we timeout.
+    :param boot_ids: dict mapping remotes to their boot ids from before they
+                     were rebooted, so that nodes which haven't gone down yet
+                     aren't mistaken for ones which are back.
     """
     import time
     starttime = time.time()
+    rebooted = False
     while need_install:
-        teuthology.reconnect(ctx, timeout)
+        remotes = [remote for client in need_install.keys()
+                   for remote in ctx.cluster.only(client).remotes.keys()]
+        remaining = max(0, timeout - (time.time() - starttime))
+        if not rebooted:
+            reboot.wait_for_reboot(remotes, remaining, boot_ids=boot_ids)
+            rebooted = True
+        else:
+            teuthology.reconnect(ctx, remaining, remotes)
         for client in need_install.keys():
             if 'distro' in str(need_install[client]):
                  distro = True
@@ -1275,7 +1288,10 @@ def task(ctx, config):
     if need_install:
         install_firmware(ctx, need_install)
         download_kernel(ctx, need_install)
+        boot_ids = reboot.get_boot_ids(
+            [remote for role in need_install.keys()
+             for remote in ctx.cluster.only(role).remotes.keys()])
         install_and_reboot(ctx, need_install)
-        wait_for_reboot(ctx, need_version, timeout)
+        wait_for_reboot(ctx, need_version, timeout, boot_ids=boot_ids)
 
     enable_disable_kdb(ctx, kdb)
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import yaml
+
+from teuthology import command_stats
+
+
+class TestCommandStats(object):
+    def setup(self):
+        self.stats = command_stats.CommandStats()
+
+    def test_data_empty(self):
+        assert self.stats.data == dict(hosts=dict(), tasks=dict(),
+                                       slowest=list())
+
+    def test_totals(self):
+        self.stats.task = 'install'
+        self.stats.record('host1', 'true', 1.0, first_byte=0.25,
+                          bytes_out=10)
+        self.stats.record('host2', 'false', 2.0, exitstatus=1, bytes_in=5)
+        self.stats.task = 'ceph'
+        self.stats.record('host1', 'ls', 3.0, first_byte=0.75, bytes_out=7,
+                          exitstatus=0)
+        data = self.stats.data
+        assert data['hosts']['host1'] == dict(
+            commands=2,
+            failed=1,
+            seconds=4.0,
+            max_seconds=3.0,
+            first_byte_seconds=0.5,
+            bytes_in=0,
+            bytes_out=17,
+        )
+        assert data['hosts']['host2']['failed'] == 1
+        assert data['hosts']['host2']['bytes_in'] == 5
+        assert data['tasks']['install']['commands'] == 2
+        assert data['tasks']['ceph']['seconds'] == 3.0
+
+    def test_slowest(self):
+        self.stats.slowest_count = 3
+        for seconds in [5, 1, 4, 2, 3]:
+            self.stats.record('host', 'sleep %d' % seconds, seconds,
+                              exitstatus=0)
+        slowest = self.stats.data['slowest']
+        assert [c['command'] for c in slowest] == \
+            ['sleep 5', 'sleep 4', 'sleep 3']
+
+    def test_write(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'command_stats.yaml')
+            self.stats.record('host', 'x' * 1000, 1.0, exitstatus=0)
+            self.stats.write(path)
+            with open(path) as f:
+                data = yaml.safe_load(f)
+            assert data == self.stats.data
+            assert len(data['slowest'][0]['command']) == \
+                self.stats.command_length
+        finally:
+            shutil.rmtree(tmp_dir)
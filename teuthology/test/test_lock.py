@@ -1,3 +1,7 @@
+import requests
+
+from mock import patch, Mock
+
 from teuthology import lock
 
 
@@ -6,3 +10,176 @@ class TestLock(object):
     def test_locked_since_seconds(self):
         node = { "locked_since": "2013-02-07 19:33:55.000000" }
         assert lock.locked_since_seconds(node) > 3600
+
+
+class TestFindStaleLocks(object):
+    def setup(self):
+        self.p_list_locks = patch.object(lock, 'list_locks')
+        self.m_list_locks = self.p_list_locks.start()
+        self.m_list_locks.return_value = [
+            self.node('n1', '/archive/run1/1'),
+            self.node('n2', '/archive/run1/2'),
+            self.node('n3', '/archive/run2/3'),
+            self.node('n4', '/archive/run3/4'),
+            self.node('n5', 'manual'),
+            self.node('n6', '/archive/run1/9', owner='other'),
+        ]
+        self.jobs = dict(
+            run1=[dict(job_id='1', status='running'),
+                  dict(job_id='2', status='dead')],
+            run2=[],
+        )
+        self.reporter = Mock()
+        self.reporter.get_jobs.side_effect = self.get_jobs
+
+    def teardown(self):
+        self.p_list_locks.stop()
+
+    def node(self, name, description, owner='owner'):
+        return dict(name=name, description=description, locked=True,
+                    locked_by=owner)
+
+    def get_jobs(self, run_name, fields=None):
+        if run_name not in self.jobs:
+            response = Mock(status_code=500)
+            raise requests.HTTPError(response=response)
+        return self.jobs[run_name]
+
+    def make_cache(self):
+        cache = lock.JobStatusCache()
+        cache._reporter = self.reporter
+        return cache
+
+    def test_one_query_per_run(self):
+        stale = lock.find_stale_locks('owner', cache=self.make_cache())
+        # n3's job is missing from its run; run3 couldn't be looked up
+        assert [node['name'] for node in stale] == ['n2', 'n3']
+        assert self.reporter.get_jobs.call_count == 3
+
+    def test_missing_run(self):
+        response = Mock(status_code=404)
+        self.reporter.get_jobs.side_effect = \
+            requests.HTTPError(response=response)
+        stale = lock.find_stale_locks('owner', cache=self.make_cache())
+        assert [node['name'] for node in stale] == ['n1', 'n2', 'n3', 'n4']
+
+    def test_cached(self):
+        cache = self.make_cache()
+        lock.find_stale_locks('owner', cache=cache)
+        lock.find_stale_locks('owner', cache=cache)
+        # only run3, which failed, is queried again
+        assert self.reporter.get_jobs.call_count == 4
+
+    def test_expiry(self):
+        cache = self.make_cache()
+        cache.put('run', '1', True)
+        cache.put('run', '2', False)
+        assert cache.get('run', '1') is True
+        assert cache.get('run', '2') is False
+        later = lock.time.time() + cache.active_ttl + 1
+        with patch.object(lock.time, 'time') as m_time:
+            m_time.return_value = later
+            assert cache.get('run', '1') is None
+            assert cache.get('run', '2') is False
+
+    def test_fetch_prunes(self):
+        cache = self.make_cache()
+        cache.put('run', '1', True)
+        cache.put('run', '2', False)
+        later = lock.time.time() + cache.active_ttl + 1
+        with patch.object(lock.time, 'time') as m_time:
+            m_time.return_value = later
+            cache.fetch([])
+        assert cache._entries.keys() == [('run', '2')]
+
+
+class TestUnlock(object):
+    def setup(self):
+        self.statuses = dict(
+            n1=dict(name='n1', locked=True, is_vm=False),
+            n2=dict(name='n2', locked=True, is_vm=False),
+            v1=dict(name='v1', locked=True, is_vm=True),
+        )
+        self.patchers = dict(
+            get_status=patch.object(lock, 'get_status'),
+            get_statuses=patch.object(lock.client, 'get_statuses'),
+            unlock_many=patch.object(lock, 'unlock_many'),
+            unlock_one=patch.object(lock, 'unlock_one'),
+        )
+        self.mocks = dict(
+            (name, patcher.start())
+            for name, patcher in self.patchers.items())
+        self.mocks['get_status'].side_effect = \
+            lambda name: self.statuses[name]
+        self.mocks['get_statuses'].side_effect = lambda names: dict(
+            (name, self.statuses[name]) for name in names)
+        self.mocks['unlock_many'].return_value = True
+        self.mocks['unlock_one'].return_value = True
+        self.ctx = Mock()
+
+    def teardown(self):
+        for patcher in self.patchers.values():
+            patcher.stop()
+
+    def unlocked_one_at_a_time(self):
+        return [call[0][1] for call in
+                self.mocks['unlock_one'].call_args_list]
+
+    def test_unlock_nodes(self):
+        assert lock.unlock_nodes(self.ctx, ['n1', 'v1', 'n2'], 'owner')
+        self.mocks['unlock_many'].assert_called_once_with(
+            ['n1', 'n2'], 'owner')
+        self.mocks['unlock_one'].assert_called_once_with(
+            self.ctx, 'v1', 'owner', None)
+
+    def test_unlock_nodes_description(self):
+        assert lock.unlock_nodes(self.ctx, ['n1', 'v1', 'n2'], 'owner',
+                                 '/archive/run/1')
+        assert not self.mocks['unlock_many'].called
+        assert self.unlocked_one_at_a_time() == ['n1', 'v1', 'n2']
+        for call in self.mocks['unlock_one'].call_args_list:
+            assert call[0][3] == '/archive/run/1'
+
+    def test_unlock_nodes_unlock_many_fails(self):
+        def unlock_many(names, user):
+            self.statuses['n1']['locked'] = False
+            return False
+        self.mocks['unlock_many'].side_effect = unlock_many
+        self.mocks['unlock_one'].side_effect = \
+            lambda ctx, name, *args: name != 'v1'
+        assert not lock.unlock_nodes(self.ctx, ['n1', 'v1', 'n2'], 'owner')
+        # n1 was unlocked after all, so only n2 is retried
+        assert self.unlocked_one_at_a_time() == ['n2', 'v1']
+
+    def make_main_ctx(self, machines, f=False):
+        return Mock(
+            verbose=False, owner='owner', machines=machines, targets=None,
+            f=f, lock=False, unlock=True, list=False, list_targets=False,
+            brief=False, summary=False, update=False, all=False,
+            num_to_lock=None, desc=None, status=None,
+        )
+
+    @patch.object(lock.misc, 'canonicalize_hostname')
+    @patch.object(lock, 'set_config_attr')
+    def test_main_unlock(self, m_set_config_attr, m_canonicalize_hostname):
+        m_canonicalize_hostname.side_effect = lambda name, user: name
+        ctx = self.make_main_ctx(['n1', 'v1', 'n2'])
+        assert lock.main(ctx) == 0
+        self.mocks['unlock_many'].assert_called_once_with(
+            ['n1', 'n2'], 'owner')
+        assert self.unlocked_one_at_a_time() == ['v1']
+
+    @patch.object(lock.misc, 'canonicalize_hostname')
+    @patch.object(lock, 'set_config_attr')
+    def test_main_unlock_fails(self, m_set_config_attr,
+                               m_canonicalize_hostname):
+        m_canonicalize_hostname.side_effect = lambda name, user: name
+        self.mocks['unlock_many'].return_value = False
+        self.mocks['unlock_one'].side_effect = \
+            lambda ctx, name, *args: name != 'n1'
+        assert lock.main(self.make_main_ctx(['n1', 'v1', 'n2'])) == 1
+        assert self.unlocked_one_at_a_time() == ['n1', 'n2']
+        # with -f, carry on to the VMs
+        self.mocks['unlock_one'].reset_mock()
+        assert lock.main(self.make_main_ctx(['n1', 'v1', 'n2'], f=True)) == 1
+        assert self.unlocked_one_at_a_time() == ['n1', 'n2', 'v1']
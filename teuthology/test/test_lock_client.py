@@ -0,0 +1,83 @@
+from mock import patch, Mock
+from pytest import raises
+from requests.packages.urllib3.exceptions import (
+    ConnectTimeoutError, ReadTimeoutError)
+
+from teuthology import lock_client
+from teuthology.misc import canonicalize_hostname
+
+
+class TestLockClient(object):
+    def setup(self):
+        self.client = lock_client.LockClient(base_uri='http://lock/')
+        self.client.session = Mock()
+        self.client.session.get.side_effect = self.get
+        self.client.session.put.return_value = Mock(ok=True)
+
+    def get(self, uri):
+        name = uri.rstrip('/').split('/')[-1]
+        return Mock(ok=True, json=Mock(return_value=dict(name=name)))
+
+    def test_retries(self):
+        client = lock_client.LockClient(base_uri='http://lock/')
+        retry = client.session.get_adapter('http://lock/').max_retries
+        assert retry.total == 5
+        # Locking isn't idempotent, so a sent PUT or POST mustn't be repeated
+        for method in ('PUT', 'POST'):
+            assert not retry.is_retry(method, 502)
+            with raises(ReadTimeoutError):
+                retry.increment(method, '/nodes/host/lock/',
+                                error=ReadTimeoutError(None, '/', 'timeout'))
+        assert retry.is_retry('GET', 502)
+        # ...but one which never connected can be
+        assert retry.increment(
+            'PUT', '/nodes/host/lock/',
+            error=ConnectTimeoutError(),
+        ).total == 4
+
+    def test_uri(self):
+        assert self.client.uri('nodes', 'host') == 'http://lock/nodes/host/'
+
+    def test_status_cached(self):
+        status = self.client.get_status('host')
+        assert status == dict(name=canonicalize_hostname('host', user=None))
+        assert self.client.get_status('host') == status
+        assert self.client.session.get.call_count == 1
+        self.client.get_status('host', cached=False)
+        assert self.client.session.get.call_count == 2
+
+    def test_status_expiry(self):
+        self.client.get_status('host')
+        later = lock_client.time.time() + self.client.status_ttl + 1
+        with patch.object(lock_client.time, 'time') as m_time:
+            m_time.return_value = later
+            self.client.get_status('host')
+        assert self.client.session.get.call_count == 2
+
+    def test_status_failed(self):
+        self.client.session.get.side_effect = None
+        self.client.session.get.return_value = Mock(ok=False)
+        assert self.client.get_status('host') is None
+        assert self.client.get_status('host') is None
+        assert self.client.session.get.call_count == 2
+
+    def test_update_invalidates(self):
+        self.client.get_status('host')
+        self.client.update('host', dict(up=False))
+        self.client.get_status('host')
+        assert self.client.session.get.call_count == 2
+
+    def test_get_statuses(self):
+        names = [canonicalize_hostname(name, user=None) for name in 'ab']
+        statuses = self.client.get_statuses(names)
+        assert statuses == dict((name, dict(name=name)) for name in names)
+
+    def test_update_many(self):
+        self.client.session.put.side_effect = \
+            lambda uri, data: Mock(ok='bad' not in uri)
+        results = self.client.update_many({
+            'good.example.com': dict(up=True),
+            'bad.example.com': dict(up=True),
+        })
+        assert results == {'good.example.com': True,
+                           'bad.example.com': False}
@@ -1,4 +1,7 @@
 import argparse
+import os
+import tarfile
+from cStringIO import StringIO
 from datetime import datetime
 
 from mock import Mock, patch
@@ -75,6 +78,22 @@ def test_wait_until_osds_up():
         misc.wait_until_osds_up(ctx, ctx.cluster, remote)
 
 
+@patch.object(misc.time, 'sleep')
+def test_reconnect(m_sleep):
+    up = Mock()
+    up.name = 'up'
+    up.reconnect.return_value = True
+    later = Mock()
+    later.name = 'later'
+    later.reconnect.side_effect = [False, True]
+    ctx = argparse.Namespace()
+    ctx.cluster = cluster.Cluster(remotes=[(up, []), (later, [])])
+    # reachable hosts needn't go down first
+    misc.reconnect(ctx, 3)
+    assert up.reconnect.call_count == 1
+    assert later.reconnect.call_count == 2
+
+
 def test_get_clients_simple():
     ctx = argparse.Namespace()
     remote = FakeRemote()
@@ -256,6 +275,28 @@ def test_split_role():
         actual_split = misc.split_role(role)
         assert actual_split == expected_split
 
+def test_pull_directory(tmpdir):
+    tar_buf = StringIO()
+    tar = tarfile.open(mode='w|gz', fileobj=tar_buf)
+    for name, data in (('./a.log', 'aaaa'), ('./sub/b.log', 'bb')):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, StringIO(data))
+    tar.close()
+    remote = FakeRemote()
+    remote.shortname = 'remote'
+    remote.get_tar_stream = Mock()
+    remote.get_tar_stream.return_value.stdout = StringIO(tar_buf.getvalue())
+    localdir = str(tmpdir.join('remote'))
+    stats = misc.pull_directory(remote, '/archive', localdir)
+    remote.get_tar_stream.assert_called_once_with(
+        '/archive', sudo=True, fast=True)
+    assert open(os.path.join(localdir, 'sub', 'b.log')).read() == 'bb'
+    assert stats['files'] == 2
+    assert stats['bytes'] == 6
+    assert stats['transferred_bytes'] == len(tar_buf.getvalue())
+
+
 class TestHostnames(object):
     def setup(self):
         config._conf = dict()
@@ -2,13 +2,21 @@ import datetime
 import json
 import os
 import pytest
+import shutil
 import subprocess
+import sys
+import tempfile
 
+from collections import OrderedDict
+from distutils.spawn import find_executable
 from mock import patch, Mock, DEFAULT
 
 from teuthology import nuke
 from teuthology import misc
 from teuthology.config import config
+from teuthology.exceptions import CommandFailedError
+from teuthology.nuke import actions, reclaim, script
+from teuthology.orchestra import cluster, run
 
 
 class TestNuke(object):
@@ -230,3 +238,244 @@ class TestNuke(object):
                 misc.canonicalize_hostname(name, user=None): {},
             })
             m['destroy'].assert_not_called()
+
+
+class TestNukeScript(object):
+    def run_batch(self, commands, **kwargs):
+        """
+        Run a batch locally, the way Remote.run_batch() would remotely
+        """
+        script = run.build_batch_script(commands, 'marker')
+        proc = subprocess.Popen(['sh', '-c', script], stdout=subprocess.PIPE)
+        output = proc.communicate()[0]
+        return run.parse_batch_output(output, 'marker', commands)
+
+    def test_build_command(self):
+        commands = [
+            actions.Command(['echo', 'a b'], True, None),
+            actions.Command('echo oops >&2; exit 3', True, 10),
+            actions.Command(['sleep', '5'], True, 1),
+        ]
+        results = self.run_batch(map(script.build_command, commands))
+        assert results[0].stdout == 'a b\n'
+        stderr, elapsed = script.split_elapsed(results[0].stderr)
+        assert stderr == ''
+        assert 0 <= elapsed < 5
+        assert results[1].exitstatus == 3
+        assert script.split_elapsed(results[1].stderr)[0] == 'oops\n'
+        # timed out
+        assert results[2].exitstatus == 124
+        assert script.split_elapsed(results[2].stderr)[1] < 5
+
+    def test_run_steps(self):
+        remote = Mock(shortname='host')
+        remote.run_batch.side_effect = self.run_batch
+        steps = OrderedDict([
+            ('ok', lambda remote: [actions.Command('true', True, None)]),
+            ('ignored', lambda remote: [actions.Command('false', False, 5)]),
+        ])
+        assert script.run_steps(remote, steps)
+        steps['failed'] = lambda remote: [actions.Command('false', True, 5)]
+        assert not script.run_steps(remote, steps)
+        assert remote.run_batch.call_count == 2
+
+    def test_run_cluster_steps_script_fails(self):
+        remote = Mock(shortname='host')
+        remote.name = 'host'
+        remote.run_batch.side_effect = ValueError("Malformed output")
+        ctx = Mock()
+        ctx.cluster = cluster.Cluster(remotes=[(remote, [])])
+        assert not script.run_cluster_steps(ctx, script.PRE_REBOOT_STEPS)
+
+
+    # Stands in for pkill: it only kills the processes matching the pattern
+    # which are its own ancestors, i.e. the script running it, which is what
+    # a pattern matching itself would do
+    PKILL_STUB = """#!{python}
+import os
+import signal
+import subprocess
+import sys
+
+proc = subprocess.Popen(['{pgrep}', '-f', sys.argv[-1]],
+                        stdout=subprocess.PIPE)
+matched = set(int(pid) for pid in proc.communicate()[0].split())
+ancestors = set()
+pid = os.getppid()
+while pid > 1:
+    ancestors.add(pid)
+    with open('/proc/%d/stat' % pid) as stat:
+        pid = int(stat.read().rsplit(')', 1)[1].split()[1])
+for pid in matched & ancestors:
+    os.kill(pid, signal.SIGKILL)
+"""
+
+    # Stands in for sudo: only pkill is actually run
+    SUDO_STUB = """#!/bin/sh
+case "$1" in
+    pkill) exec "$@" ;;
+esac
+"""
+
+    @pytest.mark.skipif(not os.path.isdir('/proc/self'),
+                        reason="needs /proc")
+    @pytest.mark.parametrize('steps', ['PRE_REBOOT_STEPS',
+                                       'POST_REBOOT_STEPS'])
+    def test_steps_script_survives(self, steps):
+        """
+        Run the real cleanup script under a local sh, with a PATH in which
+        nothing but the commands the batch framing needs, and pkill, exists
+        """
+        tmp = tempfile.mkdtemp()
+        try:
+            bin_dir = os.path.join(tmp, 'bin')
+            os.mkdir(bin_dir)
+            for name in ('sh', 'date', 'timeout', 'mktemp', 'cat', 'wc'):
+                os.symlink(find_executable(name),
+                           os.path.join(bin_dir, name))
+            for name, stub in (
+                    ('pkill', self.PKILL_STUB.format(
+                        python=sys.executable,
+                        pgrep=find_executable('pgrep'))),
+                    ('sudo', self.SUDO_STUB)):
+                path = os.path.join(bin_dir, name)
+                with open(path, 'w') as f:
+                    f.write(stub)
+                os.chmod(path, 0o755)
+            env = dict(PATH=bin_dir, TMPDIR=tmp)
+
+            def run_batch(commands, **kwargs):
+                script = run.build_batch_script(commands, 'marker')
+                proc = subprocess.Popen([os.path.join(bin_dir, 'sh'), '-c',
+                                         script],
+                                        stdout=subprocess.PIPE, env=env)
+                output = proc.communicate()[0]
+                assert proc.returncode == 0
+                return run.parse_batch_output(output, 'marker', commands)
+
+            remote = Mock(shortname='host')
+            remote.os.package_type = 'deb'
+            remote.run_batch.side_effect = run_batch
+            script.run_steps(remote, getattr(script, steps))
+            assert remote.run_batch.call_count == 1
+        finally:
+            shutil.rmtree(tmp)
+
+
+class TestNeedsReboot(object):
+    def make_remote(self, found):
+        remote = Mock(shortname='host')
+        remote.run_batch.return_value = [
+            run.CommandResult(command, 0 if name in found else 1, '', '')
+            for name, command in actions.REBOOT_PROBES.items()
+        ]
+        return remote
+
+    def test_clean(self):
+        remote = self.make_remote([])
+        assert not actions.needs_reboot(remote)
+        assert remote.run_batch.call_count == 1
+
+    def test_dirty(self):
+        assert actions.needs_reboot(self.make_remote(['leftover daemons']))
+
+    def test_probe_failed(self):
+        remote = Mock(shortname='host')
+        remote.run_batch.side_effect = RuntimeError()
+        assert actions.needs_reboot(remote)
+
+    def test_probes_are_valid_shell(self):
+        for command in actions.REBOOT_PROBES.values():
+            assert subprocess.call(['sh', '-n', '-c', command]) == 0
+
+
+class TestCleanWithoutReboot(object):
+    def make_remote(self, name):
+        remote = Mock(shortname=name)
+        remote.name = name
+        return remote
+
+    @patch.object(nuke, 'needs_reboot')
+    @patch.object(nuke, 'post_reboot_cleanup')
+    def test_cleanup_fails(self, m_post_reboot_cleanup, m_needs_reboot):
+        remotes = [self.make_remote(name) for name in ('a', 'b', 'c')]
+        ctx = Mock()
+        ctx.cluster = cluster.Cluster(
+            remotes=[(remote, []) for remote in remotes])
+        cleaned = []
+
+        def post_reboot_cleanup(ctx):
+            (remote,) = ctx.cluster.remotes.keys()
+            if remote.name == 'a':
+                raise CommandFailedError('remove_ceph_data', 1)
+            cleaned.append(remote)
+
+        m_post_reboot_cleanup.side_effect = post_reboot_cleanup
+        m_needs_reboot.side_effect = lambda remote: remote.name == 'c'
+        to_reboot = nuke.clean_without_reboot(ctx)
+        assert set(to_reboot) == set([remotes[0], remotes[2]])
+        # the failure on a didn't stop b and c from being cleaned up
+        assert set(cleaned) == set(remotes[1:])
+        assert len(ctx.cluster.remotes) == 3
+
+
+class TestReclaimer(object):
+    def setup(self):
+        self.nodes = [
+            dict(name='n%s' % i, description='/archive/run/%s' % i,
+                 locked=True, locked_by='owner', ssh_pub_key='key')
+            for i in range(5)
+        ]
+        self.reclaimer = reclaim.Reclaimer(concurrency=2)
+        self.reclaimer.find = Mock(return_value=self.nodes)
+        self.p_get_status = patch.object(reclaim, 'get_status')
+        self.m_get_status = self.p_get_status.start()
+        self.m_get_status.side_effect = lambda name, cached: dict(
+            (node['name'], node) for node in self.nodes)[name]
+        self.p_nuke_one = patch.object(reclaim, 'nuke_one')
+        self.m_nuke_one = self.p_nuke_one.start()
+        self.m_nuke_one.return_value = None
+
+    def teardown(self):
+        self.p_get_status.stop()
+        self.p_nuke_one.stop()
+
+    def test_run_once(self):
+        self.m_nuke_one.side_effect = \
+            lambda ctx, target, *args: target if 'n3' in target else None
+        assert self.reclaimer.run_once() == ['n3']
+        assert self.m_nuke_one.call_count == 5
+        ctx = self.m_nuke_one.call_args[0][0]
+        assert ctx.owner == 'owner'
+        metrics = self.reclaimer.metrics
+        assert metrics['n0']['reclaimed'] == 1
+        assert metrics['n3']['failed'] == 1
+        assert metrics['n3']['last_description'] == '/archive/run/3'
+
+    def test_run_once_errors(self):
+        def nuke_one(ctx, target, *args):
+            if 'n1' in target:
+                raise RuntimeError("lost connection")
+        self.m_nuke_one.side_effect = nuke_one
+        self.m_get_status.side_effect = lambda name, cached: dict(
+            (node['name'], node) for node in self.nodes
+            if node['name'] != 'n2')[name]
+        assert sorted(self.reclaimer.run_once()) == ['n1', 'n2']
+        assert self.m_nuke_one.call_count == 4
+        metrics = self.reclaimer.metrics
+        assert metrics['n0']['reclaimed'] == 1
+        assert metrics['n1']['failed'] == 1
+        assert metrics['n2']['failed'] == 1
+
+    def test_changed_hands(self):
+        self.m_get_status.side_effect = lambda name, cached: dict(
+            name=name, locked=True, locked_by='owner',
+            description='/archive/newrun/1')
+        assert self.reclaimer.run_once() == []
+        assert self.m_nuke_one.call_count == 0
+        assert self.reclaimer.metrics['n0']['skipped'] == 1
+
+    def test_dry_run(self):
+        self.reclaimer.dry_run = True
+        self.reclaimer.run_once()
+        assert self.m_nuke_one.call_count == 0
@@ -1,6 +1,7 @@
 import logging
 import os
 import os.path
+from mock import patch
 from pytest import raises, mark
 import shutil
 import subprocess
@@ -180,3 +181,91 @@ class TestRepoUtils(object):
     @mark.parametrize("input_, expected", URLS_AND_DIRNAMES)
     def test_url_to_dirname(self, input_, expected):
         assert repo_utils.url_to_dirname(input_) == expected
+
+
+class TestCheckoutCache(object):
+    def setup_method(self, method):
+        self.temp_path = tempfile.mkdtemp(prefix='test_checkout_cache-')
+        self.src_path = os.path.join(self.temp_path, 'src')
+        self.repo_url = 'file://' + self.src_path
+        self.git('init', self.src_path, cwd=self.temp_path)
+        self.git('config', 'user.email', 'test@ceph.com')
+        self.git('config', 'user.name', 'Test User')
+        self.git('checkout', '-b', 'master')
+        self.sha1s = [self.commit('one'), self.commit('two')]
+        self.cache = repo_utils.CheckoutCache(
+            base_path=os.path.join(self.temp_path, 'cache'),
+            size=1,
+        )
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.temp_path)
+
+    def git(self, *args, **kwargs):
+        return subprocess.check_output(
+            ('git',) + args,
+            cwd=kwargs.get('cwd', self.src_path),
+        ).strip()
+
+    def commit(self, content):
+        with open(os.path.join(self.src_path, 'file'), 'w') as f:
+            f.write(content)
+        self.git('add', 'file')
+        self.git('commit', '-m', content)
+        return self.git('rev-parse', 'HEAD')
+
+    def read(self, path):
+        with open(os.path.join(path, 'file')) as f:
+            return f.read()
+
+    def test_get_branch(self):
+        path = self.cache.get(self.repo_url, 'master')
+        assert path == self.cache.worktree_path(self.repo_url, self.sha1s[1])
+        assert self.read(path) == 'two'
+
+    def test_get_sha1(self):
+        path = self.cache.get(self.repo_url, 'master', self.sha1s[0])
+        assert self.read(path) == 'one'
+
+    def test_get_again_runs_no_git(self):
+        path = self.cache.get(self.repo_url, 'master', self.sha1s[1])
+        with patch('subprocess.Popen') as m_popen:
+            assert self.cache.get(self.repo_url, 'master') == path
+            assert self.cache.get(
+                self.repo_url, 'master', self.sha1s[1]) == path
+        assert not m_popen.called
+
+    def test_get_unknown_sha1(self):
+        path = self.cache.get(self.repo_url, 'master', 'f' * 40)
+        assert self.read(path) == 'two'
+
+    def test_get_non_existing_branch(self):
+        with raises(BranchNotFoundError):
+            self.cache.get(self.repo_url, 'nobranch')
+
+    def test_get_evicted(self):
+        path = self.cache.get(self.repo_url, 'master', self.sha1s[0])
+        # As if another process evicted it after it was found to be ready
+        shutil.rmtree(path)
+        assert self.cache.get(self.repo_url, 'master', self.sha1s[0]) == path
+        assert self.read(path) == 'one'
+        os.remove(path + '.ready')
+        assert not self.cache._mark_used(path)
+        assert self.cache.get(self.repo_url, 'master', self.sha1s[0]) == path
+        assert os.path.exists(path + '.ready')
+
+    @patch('teuthology.repo_utils.config')
+    def test_evict(self, m_config):
+        m_config.max_job_time = -10
+        first = self.cache.get(self.repo_url, 'master', self.sha1s[0])
+        os.utime(first + '.ready', (0, 0))
+        second = self.cache.get(self.repo_url, 'master', self.sha1s[1])
+        assert not os.path.exists(first)
+        assert self.read(second) == 'two'
+
+    @patch('teuthology.repo_utils.config')
+    def test_evict_in_use(self, m_config):
+        m_config.max_job_time = 3600
+        first = self.cache.get(self.repo_url, 'master', self.sha1s[0])
+        self.cache.get(self.repo_url, 'master', self.sha1s[1])
+        assert self.read(first) == 'one'
@@ -1,6 +1,8 @@
 import yaml
 import json
 import fake_archive
+import requests
+from mock import Mock
 from .. import report
 
 
@@ -75,3 +77,46 @@ class TestSerializer(object):
         assert full_obj == out_obj
 
 
+
+
+class TestHeartbeat(object):
+    def setup(self):
+        self.reporter = Mock()
+        self.reporter.base_uri = 'http://results'
+        self.heartbeat = report.Heartbeat(reporter=self.reporter)
+
+    def test_flush_coalesces(self):
+        self.heartbeat.queue(dict(name='run', job_id='1', n=1))
+        self.heartbeat.queue(dict(name='run', job_id='2'))
+        self.heartbeat.queue(dict(name='run', job_id='1', n=2))
+        assert self.heartbeat.flush() == 2
+        calls = [call[0] for call in self.reporter.report_job.call_args_list]
+        assert calls == [
+            ('run', '1', dict(name='run', job_id='1', n=2)),
+            ('run', '2', dict(name='run', job_id='2')),
+        ]
+        assert not self.heartbeat.pending
+        assert self.heartbeat.backoff == 0
+
+    def test_flush_backs_off(self):
+        self.reporter.report_job.side_effect = \
+            requests.exceptions.ConnectionError()
+        self.heartbeat.queue(dict(name='run', job_id='1'))
+        self.heartbeat.queue(dict(name='run', job_id='2'))
+        assert self.heartbeat.flush() == 0
+        # stop at the first failure, keeping what wasn't sent
+        assert self.reporter.report_job.call_count == 1
+        assert self.heartbeat.pending.keys() == ['2', '1']
+        assert self.heartbeat.backoff == report.Heartbeat.min_backoff
+        self.heartbeat.flush()
+        assert self.heartbeat.backoff == report.Heartbeat.min_backoff * 2
+        self.reporter.report_job.side_effect = None
+        assert self.heartbeat.flush() == 2
+        assert self.heartbeat.backoff == 0
+
+    def test_discard(self):
+        self.heartbeat.queue(dict(name='run', job_id='1'))
+        self.heartbeat.discard('1')
+        self.heartbeat.discard('2')
+        assert self.heartbeat.flush() == 0
+        assert not self.reporter.report_job.called
@@ -1,4 +1,6 @@
-from ..schedule import build_config
+from mock import patch, call, ANY
+
+from ..schedule import build_config, schedule_jobs
 from ..misc import get_user
 
 
@@ -41,3 +43,28 @@ class TestSchedule(object):
         job_dict = build_config(self.basic_args)
         assert job_dict['owner'] == 'scheduled_%s' % get_user()
 
+
+    @patch('teuthology.schedule.time.sleep')
+    @patch('teuthology.schedule.report.try_push_job_info')
+    @patch('teuthology.schedule.teuthology.beanstalk.connect')
+    def test_schedule_jobs(self, m_connect, m_try_push_job_info, m_sleep):
+        beanstalk = m_connect.return_value
+        beanstalk.put.side_effect = range(1, 4)
+        job_configs = [
+            dict(name='NAME', priority=99, tube='tala', description=desc)
+            for desc in ('a', 'b', 'c')
+        ]
+        assert schedule_jobs(job_configs, throttle='3') == 3
+        m_connect.assert_called_once_with()
+        assert beanstalk.put.call_count == 3
+        beanstalk.use.assert_has_calls([call('tala')] * 3)
+        assert [c['job_id'] for c in job_configs] == ['1', '2', '3']
+        reporters = set(
+            c[1]['reporter'] for c in m_try_push_job_info.call_args_list)
+        assert len(reporters) == 1
+        m_try_push_job_info.assert_called_with(
+            job_configs[-1], dict(status='queued'), reporter=ANY)
+        # throttle only applies between jobs
+        m_sleep.assert_has_calls([call(3)] * 2)
+        assert m_sleep.call_count == 2
+        beanstalk.close.assert_called_once_with()
@@ -1,7 +1,11 @@
 import beanstalkc
+import gevent
 import os
 import subprocess
 
+from gevent.monkey import get_original
+from pytest import raises
+
 from mock import patch, Mock, MagicMock
 from datetime import datetime, timedelta
 
@@ -9,6 +13,9 @@ from .. import worker
 
 from ..contextutil import MaxWhileTries
 
+# monkey.patch_all() makes thread.get_ident() return the greenlet's id
+get_thread_ident = get_original('thread', 'get_ident')
+
 
 class TestWorker(object):
     def setup(self):
@@ -17,6 +24,7 @@ class TestWorker(object):
         self.ctx.archive_dir = '/archive/dir'
         self.ctx.log_dir = '/log/dir'
         self.ctx.tube = 'tube'
+        self.ctx.concurrency = 1
 
     @patch("os.path.exists")
     def test_restart_file_path_doesnt_exist(self, m_exists):
@@ -87,7 +95,7 @@ class TestWorker(object):
         m_popen.return_value = m_p
         m_t_config.results_server = True
         worker.run_job(config, "teuth/bin/path", "archive/dir", verbose=False)
-        m_run_watchdog.assert_called_with(m_p, config)
+        m_run_watchdog.assert_called_with(m_p, config, heartbeat=None)
         expected_args = [
             'teuth/bin/path/teuthology',
             '-v',
@@ -152,11 +160,13 @@ class TestWorker(object):
         }
         process = Mock()
         process.poll.return_value = "not None"
-        worker.run_with_watchdog(process, config)
+        heartbeat = Mock()
+        worker.run_with_watchdog(process, config, heartbeat=heartbeat)
         m_symlink_log.assert_called_with(config["worker_log"], config["archive_path"])
         m_try_push.assert_called_with(
             dict(name=config["name"], job_id=config["job_id"]),
-            dict(status='dead')
+            dict(status='dead'),
+            reporter=heartbeat.reporter,
         )
 
     @patch("subprocess.Popen")
@@ -185,6 +195,90 @@ class TestWorker(object):
             stderr=subprocess.STDOUT
         )
 
+    @patch("teuthology.worker.report.Heartbeat")
+    @patch("teuthology.worker.kill_job")
+    @patch("teuthology.worker.report.try_push_job_info")
+    @patch("teuthology.worker.symlink_worker_log")
+    @patch("teuthology.worker.teuth_config")
+    def test_shared_watchdog(self, m_teuth_config, m_symlink_log, m_try_push,
+                             m_kill_job, m_heartbeat):
+        m_heartbeat.return_value.backoff = 0
+        m_teuth_config.watchdog_interval = 0
+        m_teuth_config.max_job_time = 3600
+        m_teuth_config.results_server = 'http://results'
+        configs = [
+            dict(
+                name="the_name",
+                job_id=str(job_id),
+                owner="owner",
+                worker_log="worker_log",
+                archive_path="archive/path/%s" % job_id,
+            )
+            for job_id in (1, 2)
+        ]
+        processes = [Mock(), Mock()]
+        processes[0].poll.side_effect = [None, 0]
+        processes[1].poll.side_effect = [None, None, 0]
+        watchdog = worker.Watchdog()
+        watchdog.poll_interval = 0
+        greenlets = [
+            gevent.spawn(watchdog.watch, process, config)
+            for process, config in zip(processes, configs)
+        ]
+        gevent.joinall(greenlets, timeout=10, raise_error=True)
+        assert all([greenlet.ready() for greenlet in greenlets])
+        assert not m_kill_job.called
+        for config in configs:
+            m_symlink_log.assert_any_call(config["worker_log"],
+                                          config["archive_path"])
+            m_try_push.assert_any_call(
+                dict(name=config["name"], job_id=config["job_id"]),
+                dict(status='dead'),
+                reporter=m_heartbeat.return_value.reporter,
+            )
+            # heartbeats go through the shared Heartbeat, not one push per job
+            m_heartbeat.return_value.queue.assert_any_call(
+                dict(name=config["name"], job_id=config["job_id"]))
+        assert m_symlink_log.call_count == 2
+        assert m_try_push.call_count == 2
+        assert m_heartbeat.return_value.flush.called
+
+    @patch("teuthology.worker.report.Heartbeat")
+    @patch("teuthology.worker.kill_job")
+    @patch("teuthology.worker.symlink_worker_log")
+    @patch("teuthology.worker.teuth_config")
+    def test_shared_watchdog_kill(self, m_teuth_config, m_symlink_log,
+                                  m_kill_job, m_heartbeat):
+        m_heartbeat.return_value.backoff = 0
+        m_teuth_config.watchdog_interval = 0
+        m_teuth_config.max_job_time = -1
+        m_teuth_config.results_server = None
+        m_teuth_config.archive_base = '/archive'
+        config = dict(
+            name="the_name",
+            job_id="1",
+            owner="owner",
+            worker_log="worker_log",
+            archive_path="archive/path/1",
+        )
+        kill_threads = []
+
+        def kill_job(*args):
+            kill_threads.append(get_thread_ident())
+
+        m_kill_job.side_effect = kill_job
+        process = Mock()
+        process.poll.side_effect = lambda: 0 if kill_threads else None
+        watchdog = worker.Watchdog()
+        watchdog.poll_interval = 0
+        greenlet = gevent.spawn(watchdog.watch, process, config)
+        greenlet.join(timeout=10)
+        assert greenlet.ready()
+        m_kill_job.assert_called_with(
+            "the_name", "1", '/archive', "owner")
+        # kill_job() blocks, so it mustn't run in the hub's thread
+        assert get_thread_ident() not in kill_threads
+
     @patch("os.path.isdir")
     @patch("teuthology.worker.fetch_teuthology")
     @patch("teuthology.worker.fetch_qa_suite")
@@ -216,6 +310,29 @@ class TestWorker(object):
         assert m_fetch_qa_suite.called_once_with_args(branch='master')
         assert got_config['suite_path'] == '/suite/path'
 
+    @patch("os.path.isdir")
+    @patch("teuthology.worker.fetch_teuthology")
+    @patch("teuthology.worker.fetch_qa_suite")
+    @patch("teuthology.worker.teuth_config")
+    def test_prep_job_suite_repo(self, m_teuth_config, m_fetch_qa_suite,
+                                 m_fetch_teuthology, m_isdir):
+        m_teuth_config.ceph_qa_suite_git_url = 'https://example.com/suite'
+        config = dict(
+            name="the_name",
+            job_id="1",
+            suite_branch="wip",
+            suite_repo="https://example.com/other-suite",
+        )
+        m_fetch_teuthology.return_value = '/teuth/path'
+        m_fetch_qa_suite.return_value = '/suite/path'
+        m_isdir.return_value = True
+        worker.prep_job(config, '/worker/log', '/archive/dir')
+        m_fetch_qa_suite.assert_called_once_with(
+            'wip', sha1=None, url="https://example.com/other-suite")
+        # The job's repo mustn't leak into other jobs via the global config
+        assert m_teuth_config.ceph_qa_suite_git_url == \
+            'https://example.com/suite'
+
     def build_fake_jobs(self, m_connection, m_job, job_bodies):
         """
         Given patched copies of:
@@ -261,6 +378,11 @@ class TestWorker(object):
         m_connect.return_value = m_connection
         m_prep_job.return_value = (dict(), '/bin/path')
         worker.main(self.ctx)
+        # Every job is run with the worker's one Heartbeat
+        heartbeats = set(
+            call[1]['heartbeat'] for call in m_run_job.call_args_list)
+        assert len(heartbeats) == 1
+        assert isinstance(heartbeats.pop(), worker.report.Heartbeat)
         # There should be one reserve call per item in the jobs list
         expected_reserve_calls = [
             dict(timeout=60) for i in range(len(jobs))
@@ -309,3 +431,102 @@ class TestWorker(object):
         for i in range(len(jobs)):
             push_call = m_try_push_job_info.call_args_list[i]
             assert push_call[0][1]['status'] == 'dead'
+
+    @patch("teuthology.worker.run_job")
+    @patch("teuthology.worker.prep_job")
+    @patch("beanstalkc.Job", autospec=True)
+    @patch("teuthology.worker.fetch_qa_suite")
+    @patch("teuthology.worker.fetch_teuthology")
+    @patch("teuthology.worker.beanstalk.watch_tube")
+    @patch("teuthology.worker.beanstalk.connect")
+    @patch("os.path.isdir", return_value=True)
+    @patch("teuthology.worker.setup_log_file")
+    def test_main_loop_concurrent(
+            self, m_setup_log_file, m_isdir, m_connect, m_watch_tube,
+            m_fetch_teuthology, m_fetch_qa_suite, m_job, m_prep_job,
+            m_run_job):
+        self.ctx.concurrency = 2
+        m_connection = Mock()
+        jobs = self.build_fake_jobs(
+            m_connection,
+            m_job,
+            [
+                'foo: bar',
+                'stop_worker: true',
+            ],
+        )
+        m_connection.reserve.side_effect = jobs
+        m_connect.return_value = m_connection
+        prep_threads = []
+
+        def prep_job(*args):
+            prep_threads.append(get_thread_ident())
+            return dict(), '/bin/path'
+
+        m_prep_job.side_effect = prep_job
+        running = []
+
+        def run_job(*args, **kwargs):
+            assert kwargs['watchdog'] is not None
+            running.append(kwargs)
+            # Both jobs should be started before either finishes
+            while len(running) < len(jobs):
+                gevent.sleep(0)
+
+        m_run_job.side_effect = run_job
+        worker.main(self.ctx)
+        assert m_connection.reserve.call_count == len(jobs)
+        # Both jobs share one watchdog
+        assert running[0]['watchdog'] is running[1]['watchdog']
+        # prep_job() blocks, so it mustn't run in the hub's thread
+        assert len(prep_threads) == len(jobs)
+        assert get_thread_ident() not in prep_threads
+        for job in jobs:
+            job.bury.assert_called_once_with()
+            job.delete.assert_called_once_with()
+
+    @patch("teuthology.worker.run_job")
+    @patch("teuthology.worker.prep_job")
+    @patch("beanstalkc.Job", autospec=True)
+    @patch("teuthology.worker.fetch_qa_suite")
+    @patch("teuthology.worker.fetch_teuthology")
+    @patch("teuthology.worker.beanstalk.watch_tube")
+    @patch("teuthology.worker.beanstalk.connect")
+    @patch("os.path.isdir", return_value=True)
+    @patch("teuthology.worker.setup_log_file")
+    def test_main_loop_concurrent_job_fails(
+            self, m_setup_log_file, m_isdir, m_connect, m_watch_tube,
+            m_fetch_teuthology, m_fetch_qa_suite, m_job, m_prep_job,
+            m_run_job):
+        self.ctx.concurrency = 2
+        m_connection = Mock()
+        jobs = self.build_fake_jobs(
+            m_connection,
+            m_job,
+            [
+                'fail: true',
+                'foo: bar',
+                'never: reserved',
+            ],
+        )
+        m_connection.reserve.side_effect = jobs
+        m_connect.return_value = m_connection
+        m_prep_job.side_effect = lambda config, *args: (config, '/bin/path')
+        started = []
+
+        def run_job(job_config, *args, **kwargs):
+            started.append(job_config)
+            # Both jobs should be started before either finishes
+            while len(started) < 2:
+                gevent.sleep(0)
+            if job_config.get('fail'):
+                raise RuntimeError("job failed")
+
+        m_run_job.side_effect = run_job
+        # Like the serial loop, a failed job stops the worker...
+        with raises(RuntimeError):
+            worker.main(self.ctx)
+        # ...but only after the other running job has finished
+        assert m_connection.reserve.call_count == 2
+        jobs[0].delete.assert_not_called()
+        jobs[1].delete.assert_called_once_with()
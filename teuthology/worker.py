@@ -1,3 +1,7 @@
+import gevent
+import gevent.event
+import gevent.lock
+import gevent.pool
 import logging
 import os
 import subprocess
@@ -95,6 +99,11 @@ def main(ctx):
         fetch_teuthology('master')
     fetch_qa_suite('master')
 
+    if ctx.concurrency > 1:
+        return run_jobs_concurrently(ctx, connection, log_file_path)
+
+    # One results server session, and backoff, for all of this worker's jobs
+    heartbeat = report.Heartbeat()
     keep_running = True
     while keep_running:
         # Check to see if we have a teuthology-results process hanging around
@@ -137,6 +146,7 @@ def main(ctx):
                 teuth_bin_path,
                 ctx.archive_dir,
                 ctx.verbose,
+                heartbeat=heartbeat,
             )
         except SkipJob:
             continue
@@ -149,6 +159,117 @@ def main(ctx):
             log.exception("Saw exception while trying to delete job")
 
 
+def run_jobs_concurrently(ctx, connection, log_file_path):
+    """
+    Like the loop in main(), but run up to ctx.concurrency jobs at once, each
+    supervised by a greenlet in this process.
+
+    The beanstalk connection is only ever used from the calling greenlet;
+    jobs are deleted from the queue here once the greenlet running them
+    is done. All running jobs share one Watchdog.
+
+    When the restart or stop sentinel appears, or a job asks the worker to
+    stop, no new jobs are reserved, and we restart or stop once the running
+    jobs have finished.
+
+    As in the serial loop, a job failing with an unexpected exception stops
+    the worker, leaving that job buried: no new jobs are reserved, and once
+    the running jobs have finished the first such exception is re-raised.
+    """
+    pool = gevent.pool.Pool(ctx.concurrency)
+    watchdog = Watchdog()
+    # fetch_teuthology() and fetch_qa_suite() aren't safe to run in more
+    # than one greenlet at once; their FileLock is per-process
+    prep_lock = gevent.lock.Semaphore()
+    # subprocess isn't monkey-patched, so fetching and bootstrapping would
+    # block every other greenlet; do them in a thread instead
+    threadpool = gevent.get_hub().threadpool
+    finished_jobs = []
+    failures = []
+
+    def run_one(job, job_config):
+        try:
+            with prep_lock:
+                job_config, teuth_bin_path = threadpool.apply(
+                    prep_job,
+                    (job_config, log_file_path, ctx.archive_dir),
+                )
+            run_job(
+                job_config,
+                teuth_bin_path,
+                ctx.archive_dir,
+                ctx.verbose,
+                watchdog=watchdog,
+            )
+        except SkipJob:
+            return
+        except Exception as e:
+            log.exception("Job %s failed; leaving it buried", job.jid)
+            failures.append(e)
+            return
+        finished_jobs.append(job)
+
+    def delete_finished_jobs():
+        while finished_jobs:
+            job = finished_jobs.pop(0)
+            # This try/except block is to keep the worker from dying when
+            # beanstalkc throws a SocketError
+            try:
+                job.delete()
+            except Exception:
+                log.exception("Saw exception while trying to delete job")
+
+    keep_running = True
+    exit_func = None
+    while True:
+        delete_finished_jobs()
+        if exit_func is None:
+            if sentinel(restart_file_path):
+                exit_func = restart
+            elif sentinel(stop_file_path):
+                exit_func = stop
+            if exit_func is not None:
+                keep_running = False
+        if failures:
+            keep_running = False
+
+        if not keep_running:
+            if len(pool) == 0:
+                break
+            log.info("Waiting for %d running jobs to finish", len(pool))
+            pool.join(timeout=60)
+            continue
+
+        load_config()
+
+        if pool.full():
+            pool.wait_available(timeout=60)
+            continue
+
+        job = connection.reserve(timeout=60)
+        if job is None:
+            continue
+
+        # bury the job so it won't be re-run if it fails
+        job.bury()
+        job_id = job.jid
+        log.info('Reserved job %d', job_id)
+        log.info('Config is: %s', job.body)
+        job_config = yaml.safe_load(job.body)
+        job_config['job_id'] = str(job_id)
+
+        if job_config.get('stop_worker'):
+            keep_running = False
+
+        pool.spawn(run_one, job, job_config)
+
+    delete_finished_jobs()
+    if failures:
+        raise failures[0]
+    if exit_func is not None:
+        exit_func()
+
+
 def prep_job(job_config, log_file_path, archive_dir):
     job_id = job_config['job_id']
     safe_archive = safepath.munge(job_config['name'])
@@ -172,11 +293,9 @@ def prep_job(job_config, log_file_path, archive_dir):
         # last-in-suite jobs don't have suite_branch or branch set.
         ceph_branch = job_config.get('branch', 'master')
         suite_branch = job_config.get('suite_branch', ceph_branch)
-        suite_repo = job_config.get('suite_repo')
-        if suite_repo:
-            teuth_config.ceph_qa_suite_git_url = suite_repo
         job_config['suite_path'] = os.path.normpath(os.path.join(
-            fetch_qa_suite(suite_branch),
+            fetch_qa_suite(suite_branch, sha1=job_config.get('suite_sha1'),
+                           url=job_config.get('suite_repo')),
             job_config.get('suite_relpath', ''),
         ))
     except BranchNotFoundError as exc:
@@ -201,7 +320,17 @@ def prep_job(job_config, log_file_path, archive_dir):
     return job_config, teuth_bin_path
 
 
-def run_job(job_config, teuth_bin_path, archive_dir, verbose):
+def run_job(job_config, teuth_bin_path, archive_dir, verbose, watchdog=None,
+            heartbeat=None):
+    """
+    Run a job, returning once it has finished.
+
+    :param watchdog:  Optionally, a Watchdog shared with other jobs running in
+                      this process. If not given, the job is watched using
+                      run_with_watchdog().
+    :param heartbeat: Optionally, a report.Heartbeat for run_with_watchdog()
+                      to use, shared with this worker's other jobs
+    """
     safe_archive = safepath.munge(job_config['name'])
     if job_config.get('last_in_suite'):
         if teuth_config.results_server:
@@ -273,10 +402,13 @@ def run_job(job_config, teuth_bin_path, archive_dir, verbose):
         log.info("Job archive: %s", job_config['archive_path'])
         log.info("Job PID: %s", str(p.pid))
 
-        if teuth_config.results_server:
+        if watchdog is not None:
+            log.info("Running with shared watchdog")
+            watchdog.watch(p, job_config)
+        elif teuth_config.results_server:
             log.info("Running with watchdog")
             try:
-                run_with_watchdog(p, job_config)
+                run_with_watchdog(p, job_config, heartbeat=heartbeat)
             except Exception:
                 log.exception("run_with_watchdog had an unhandled exception")
                 raise
@@ -295,7 +427,9 @@ def run_job(job_config, teuth_bin_path, archive_dir, verbose):
             log.info('Success!')
 
 
-def run_with_watchdog(process, job_config):
+def run_with_watchdog(process, job_config, heartbeat=None):
+    if heartbeat is None:
+        heartbeat = report.Heartbeat()
     job_start_time = datetime.utcnow()
 
     # Only push the information that's relevant to the watchdog, to save db
@@ -318,11 +452,25 @@ def run_with_watchdog(process, job_config):
             kill_job(job_info['name'], job_info['job_id'],
                      teuth_config.archive_base, job_config['owner'])
 
-        # calling this without a status just updates the jobs updated time
-        report.try_push_job_info(job_info)
-        time.sleep(teuth_config.watchdog_interval)
+        # a heartbeat without a status just updates the job's updated time
+        heartbeat.queue(job_info)
+        heartbeat.flush()
+        time.sleep(teuth_config.watchdog_interval + heartbeat.backoff)
+
+    heartbeat.discard(job_info['job_id'])
+    report_job_finished(job_config, reporter=heartbeat.reporter)
+
 
-    # The job finished. Let's make sure paddles knows.
+def report_job_finished(job_config, reporter=None):
+    """
+    Make sure the results server knows a job has finished
+
+    :param reporter: Optional ResultsReporter to report with
+    """
+    job_info = dict(
+        name=job_config['name'],
+        job_id=job_config['job_id'],
+    )
     branches_sans_reporting = ('argonaut', 'bobtail', 'cuttlefish', 'dumpling')
     if job_config.get('teuthology_branch') in branches_sans_reporting:
         # The job ran with a teuthology branch that may not have the reporting
@@ -348,7 +496,117 @@ def run_with_watchdog(process, job_config):
         # the status, but if it was a pass or fail it will have already been
         # reported to paddles. In that case paddles ignores the 'dead' status.
         # If the job was killed, paddles will use the 'dead' status.
-        report.try_push_job_info(job_info, dict(status='dead'))
+        report.try_push_job_info(job_info, dict(status='dead'),
+                                 reporter=reporter)
+
+
+class Watchdog(object):
+    """
+    Watches many running jobs from a single greenlet, doing for each of them
+    what run_with_watchdog() does for one: symlinking the worker log,
+    killing jobs which have run for longer than max_job_time, and, if there is
+    a results server, telling it that each job is still alive.
+
+    Rather than each job sending its own heartbeat, the heartbeats for all
+    running jobs are sent together once per watchdog_interval, using a
+    report.Heartbeat; if the results server is struggling, they are sent
+    less often.
+
+    Jobs are added with watch(), which blocks the calling greenlet until the
+    job's process exits.
+
+    Killing a job runs teuthology-nuke, which blocks, so it is done in a
+    thread, leaving the other jobs watched meanwhile.
+    """
+    # How often to check whether processes have exited
+    poll_interval = 1
+
+    def __init__(self):
+        self.jobs = dict()
+        self.greenlet = None
+        self.heartbeat = report.Heartbeat()
+        self.next_heartbeat = None
+
+    def watch(self, process, job_config):
+        """
+        Watch process, which is running job_config, until it exits.
+        """
+        job = dict(
+            process=process,
+            config=job_config,
+            info=dict(
+                name=job_config['name'],
+                job_id=job_config['job_id'],
+            ),
+            start_time=datetime.utcnow(),
+            next_check=time.time() + teuth_config.watchdog_interval,
+            symlinked=False,
+            killer=None,
+            done=gevent.event.Event(),
+        )
+        self.jobs[job_config['job_id']] = job
+        if self.greenlet is None or self.greenlet.dead:
+            self.next_heartbeat = \
+                time.time() + teuth_config.watchdog_interval
+            self.greenlet = gevent.spawn(self._loop)
+        job['done'].wait()
+        if teuth_config.results_server:
+            report_job_finished(job_config, reporter=self.heartbeat.reporter)
+
+    def _loop(self):
+        while self.jobs:
+            for job_id, job in self.jobs.items():
+                if job['process'].poll() is not None:
+                    del self.jobs[job_id]
+                    self.heartbeat.discard(job_id)
+                    job['done'].set()
+                    continue
+                if time.time() >= job['next_check']:
+                    try:
+                        self.check(job)
+                    except Exception:
+                        log.exception("Watchdog failed to check job %s",
+                                      job_id)
+                    job['next_check'] = \
+                        time.time() + teuth_config.watchdog_interval
+            if time.time() >= self.next_heartbeat:
+                self.send_heartbeats()
+            time.sleep(self.poll_interval)
+
+    def send_heartbeats(self):
+        if teuth_config.results_server:
+            for job in self.jobs.values():
+                # a heartbeat without a status just updates the job's
+                # updated time
+                self.heartbeat.queue(job['info'])
+            self.heartbeat.flush()
+        self.next_heartbeat = time.time() + \
+            teuth_config.watchdog_interval + self.heartbeat.backoff
+
+    def check(self, job):
+        job_config = job['config']
+        job_info = job['info']
+        if not job['symlinked']:
+            symlink_worker_log(job_config['worker_log'],
+                               job_config['archive_path'])
+            job['symlinked'] = True
+        # Kill jobs that have been running longer than the global max
+        run_time = datetime.utcnow() - job['start_time']
+        total_seconds = run_time.days * 60 * 60 * 24 + run_time.seconds
+        if total_seconds > teuth_config.max_job_time:
+            if job['killer'] is not None and not job['killer'].ready():
+                return
+            log.warning("Job ran longer than {max}s. Killing...".format(
+                max=teuth_config.max_job_time))
+            job['killer'] = gevent.get_hub().threadpool.spawn(
+                self.kill, job_info, job_config)
+
+    def kill(self, job_info, job_config):
+        try:
+            kill_job(job_info['name'], job_info['job_id'],
+                     teuth_config.archive_base, job_config['owner'])
+        except Exception:
+            log.exception("Failed to kill job %s", job_info['job_id'])
 
 
 def symlink_worker_log(worker_log_path, archive_dir):